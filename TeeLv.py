@@ -1,7 +1,7 @@
 import datetime
 import random
-from habit_operations import mark_habit_complete
-from models import User, SessionManager, Habit, Analytics, Reminder, Reward
+from habit_operations import mark_habits_complete_bulk
+from models import User, SessionManager, Habit, Analytics, Reminder
 from database_operations import with_database_connection
 
 def populate_TeeLv_habits_and_reminders(username):
@@ -29,13 +29,6 @@ def populate_TeeLv_habits_and_reminders(username):
                                (habit_id, next_reminder_time, reminder_frequency))
                 
 
-def mark_habit_complete_for_teeLv(habit_id, completion_date=None, reward_system=None):
-    mark_habit_complete(habit_id, completion_date)
-    if reward_system:
-        # habit is always completed successfully so reward function is called
-        reward_system.reward_for_habit_completion(None)  
-        
-
 def populate_database_for_teeLv():
     # Database connection
     with with_database_connection() as cursor:
@@ -43,33 +36,39 @@ def populate_database_for_teeLv():
         cursor.execute("SELECT id FROM habits WHERE username=?", ("TeeLv",))
         habit_ids = [row[0] for row in cursor.fetchall()]
 
-        # Habit #1 ("Morning Run"): Daily completion from 2023-07-25 to 2023-08-22
-        start_date = datetime.date(2023, 7, 25)  # Reset the start_date
-        end_date = datetime.date(2023, 8, 22)
-        while start_date <= end_date:
-            mark_habit_complete_for_teeLv(habit_ids[0], start_date)
-            start_date += datetime.timedelta(days=1)
+    # Collect every completion first, then write them in bulk.
+    completions = []
 
-        # Habit #2 ("Read Book"): 12 random completions in the date range
-        start_date = datetime.date(2023, 7, 25)  # Reset the start_date
-        random_dates = random.sample([start_date + datetime.timedelta(days=i) for i in range((end_date-start_date).days + 1)], 12)
-        for date in random_dates:
-            mark_habit_complete_for_teeLv(habit_ids[1], date)
+    # Habit #1 ("Morning Run"): Daily completion from 2023-07-25 to 2023-08-22
+    start_date = datetime.date(2023, 7, 25)  # Reset the start_date
+    end_date = datetime.date(2023, 8, 22)
+    while start_date <= end_date:
+        completions.append((habit_ids[0], start_date))
+        start_date += datetime.timedelta(days=1)
 
-        # Habit #3 ("Weekly Meditation"): Every 7 days in the date range
-        start_date = datetime.date(2023, 7, 25)  # Reset the start_date
-        while start_date <= end_date:
-            mark_habit_complete_for_teeLv(habit_ids[2], start_date)
-            start_date += datetime.timedelta(days=7)
+    # Habit #2 ("Read Book"): 12 random completions in the date range
+    start_date = datetime.date(2023, 7, 25)  # Reset the start_date
+    random_dates = random.sample([start_date + datetime.timedelta(days=i) for i in range((end_date-start_date).days + 1)], 12)
+    for date in random_dates:
+        completions.append((habit_ids[1], date))
 
-        # Habit #4 ("Guitar Practice"): 20 random completions in the date range
-        start_date = datetime.date(2023, 7, 25)  # Reset the start_date
-        random_dates = random.sample([start_date + datetime.timedelta(days=i) for i in range((end_date-start_date).days + 1)], 20)
-        for date in random_dates:
-            mark_habit_complete_for_teeLv(habit_ids[3], date)
-        
-        # Habit #5 ("Learn 50 Words in Thai"): completed on 2023-08-08
-        mark_habit_complete_for_teeLv(habit_ids[4], datetime.date(2023, 8, 8))
+    # Habit #3 ("Weekly Meditation"): Every 7 days in the date range
+    start_date = datetime.date(2023, 7, 25)  # Reset the start_date
+    while start_date <= end_date:
+        completions.append((habit_ids[2], start_date))
+        start_date += datetime.timedelta(days=7)
+
+    # Habit #4 ("Guitar Practice"): 20 random completions in the date range
+    start_date = datetime.date(2023, 7, 25)  # Reset the start_date
+    random_dates = random.sample([start_date + datetime.timedelta(days=i) for i in range((end_date-start_date).days + 1)], 20)
+    for date in random_dates:
+        completions.append((habit_ids[3], date))
+
+    # Habit #5 ("Learn 50 Words in Thai"): completed on 2023-08-08
+    completions.append((habit_ids[4], datetime.date(2023, 8, 8)))
+
+    # The seeded history is not rewarded; points are awarded in the main block below.
+    mark_habits_complete_bulk(completions, points_per_completion=0)
 
 if __name__ == "__main__":
     # Create an instance of the User class and attempt to log in
@@ -78,9 +77,6 @@ if __name__ == "__main__":
     if user_instance.login():
         print("Login successful!")
         
-        # Initialize the Reward system for the logged-in user
-        user_reward_system = Reward("TeeLv")
-        
         populate_TeeLv_habits_and_reminders("TeeLv")
         populate_database_for_teeLv()
 
@@ -91,9 +87,9 @@ if __name__ == "__main__":
                               WHERE habits.username = ?""", ("TeeLv",))
             
             habit_completions = cursor.fetchall()
-            
-            for habit_id, completion_date in habit_completions:
-                mark_habit_complete_for_teeLv(habit_id, completion_date, user_reward_system)
+
+        # Record the completions again, awarding 10 points for each one.
+        mark_habits_complete_bulk(habit_completions, points_per_completion=10)
         
         print("Successfully populated!")
     else:
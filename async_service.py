@@ -0,0 +1,137 @@
+import asyncio
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from habit_operations import add_habit, delete_habit, mark_habit_complete, habit_exists_for_user
+from user_operations import register_user
+from models import User, Habit, Analytics, Reminder
+from points_ledger import points_ledger
+
+# Asynchronous facade over the habit, user and reward operations.
+#
+# The operations underneath are blocking sqlite3 calls. 'AsyncHabitService' runs them
+# off the event loop: reads go to a bounded pool of reader threads, and everything
+# that writes goes through a single writer thread. Writes are therefore serialized
+# in submission order and never contend with each other for SQLite's write lock,
+# while reads (which WAL mode lets run alongside a writer) proceed concurrently.
+# Background flushes of the points ledger are sent to the writer as well, and habits
+# are handed to the event loop with their completion history already loaded.
+
+DEFAULT_READERS = 4
+
+
+class AsyncHabitService:
+    def __init__(self, max_readers=DEFAULT_READERS):
+        """
+        Parameters:
+        - max_readers (int): Maximum number of read operations running at the same time.
+        """
+        self._readers = ThreadPoolExecutor(max_workers=max_readers, thread_name_prefix="habits-reader")
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="habits-writer")
+        points_ledger.flush_executor = self._writer
+
+    async def _read(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, partial(func, *args, **kwargs))
+
+    async def _write(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer, partial(func, *args, **kwargs))
+
+    async def register(self, username, password):
+        # Register a new user. Returns False if the username is taken.
+        return await self._write(register_user, username, password)
+
+    async def login(self, username, password):
+        """
+        Log a user in. Login may deduct points for broken streaks, so it runs on the writer.
+
+        Returns:
+        - User: The logged-in user, or None if the credentials are wrong.
+        """
+        user = User(username, password)
+        return user if await self._write(user.login) else None
+
+    async def add_habit(self, user, title, description, periodicity, reminder_time=None, reminder_frequency=None):
+        """
+        Add a habit for the user, optionally with a reminder.
+
+        Returns:
+        - bool: False if the user already has a habit with this title.
+        """
+        reminder = Reminder(None, reminder_time, reminder_frequency) if reminder_time else None
+
+        def add():
+            # The check and the insert run as one writer task, so concurrent adds cannot both pass the check.
+            if habit_exists_for_user(user.username, title):
+                return False
+            add_habit(user.username, title, description, periodicity, reminder)
+            return True
+
+        return await self._write(add)
+
+    async def list_habits(self, user):
+        """
+        Return the user's habits, served from the user's habit repository when cached.
+
+        Returns:
+        - list: Detached copies of the habits with their completion history loaded, so that
+          using them on the event loop never queries SQLite. Later writes do not update them.
+        """
+        def load():
+            return [Habit(habit.habit_id, habit.title, habit.description, habit.periodicity, habit.user,
+                          habit.reminder_time, habit.streak_broken_date, array('i', habit.completion_days),
+                          habit.creation_date)
+                    for habit in user.getHabits()]
+
+        return await self._read(load)
+
+    async def delete_habit(self, user, title):
+        # Delete the user's habit with this title. Returns the deleted habit's ID, or None.
+        return await self._write(delete_habit, user.username, title)
+
+    async def complete_habit(self, user, habit_id, completion_date=None):
+        """
+        Mark one of the user's habits as complete and award the completion points.
+
+        Returns:
+        - int: The user's points after the award, or None if the habit does not belong to the user.
+        """
+        habit = await self._read(user.habits.get, habit_id)
+        if habit is None:
+            return None
+
+        def complete():
+            mark_habit_complete(habit_id, completion_date)
+            user.reward.reward_for_habit_completion(habit)
+            return user.reward.points
+
+        return await self._write(complete)
+
+    async def analytics(self, user):
+        """
+        Summarize the user's habits and streaks.
+
+        Returns:
+        - dict: Habit counts per periodicity, the longest streak per habit and overall, and the points.
+        """
+        def summarize():
+            summary = Analytics(user.getHabits()).getSummary()
+            summary["points"] = user.reward.points
+            return summary
+
+        return await self._read(summarize)
+
+    async def close(self):
+        # Write waiting points changes and shut down the worker threads.
+        if points_ledger.flush_executor is self._writer:
+            points_ledger.flush_executor = None
+        await self._write(points_ledger.flush)
+        self._readers.shutdown(wait=True)
+        self._writer.shutdown(wait=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
@@ -0,0 +1,238 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+from database_operations import with_database_connection, configure_connection_pool, close_connection_pool, setup_database
+from habit_operations import mark_habit_complete, mark_habits_complete_bulk
+from models import User, Analytics
+from points_ledger import points_ledger
+
+# Benchmark suite for the Habit Tracker's hot paths.
+#
+# For every database size (users x habits per user x days of history) a fresh database
+# is built in a temporary directory and each benchmark is timed on it:
+#
+#   login           User.login(), which hydrates the habits and checks for broken streaks
+#   mark_complete   mark_habit_complete() on one of the user's habits
+#   get_streak      Habit.getStreak()
+#   longest_streak  Analytics.getLongestStreakAllHabits() over one user's habits
+#
+# Results (ops/sec, p50/p99 latency in milliseconds and peak traced memory) are printed
+# as JSON. With --baseline they are compared to an earlier run and the exit status is 1
+# when a benchmark got slower, or used more memory, by more than --tolerance.
+#
+#   python benchmarks.py --sizes 10x5x90 100x10x365 --output results.json
+#   python benchmarks.py --baseline results.json
+
+DEFAULT_SIZES = ["10x5x90", "50x10x365"]
+DEFAULT_ITERATIONS = 200
+DEFAULT_TOLERANCE = 0.2
+PERIODICITIES = ("daily", "weekly", "monthly")
+
+
+# This function parses a size such as "100x10x365" into (users, habits per user, days of history).
+def parse_size(text):
+    try:
+        users, habits, days = (int(part) for part in text.lower().split("x"))
+    except ValueError:
+        raise ValueError(f"Invalid size {text!r}; expected USERSxHABITSxDAYS, e.g. 100x10x365")
+    if min(users, habits, days) < 1:
+        raise ValueError(f"Invalid size {text!r}; every dimension must be at least 1")
+    return users, habits, days
+
+
+# This function fills an empty database with users, habits and completion history.
+def build_database(users, habits_per_user, days, seed=0):
+    """
+    Parameters:
+    - users (int): Number of users, named bench0, bench1, ...
+    - habits_per_user (int): Habits per user, cycling through daily, weekly and monthly.
+    - days (int): Days of completion history, ending yesterday. Each habit is completed on
+      roughly 80% of its periods.
+    - seed (int): Seed for the random completion pattern.
+    """
+    rng = random.Random(seed)
+    today = date.today()
+    with with_database_connection() as cursor:
+        cursor.executemany("INSERT INTO users (username, password) VALUES (?, 'bench')",
+                           [(f"bench{index}",) for index in range(users)])
+        cursor.executemany(
+            """INSERT INTO habits (username, title, description, periodicity, creation_date)
+               VALUES (?, ?, 'benchmark habit', ?, datetime('now'))""",
+            [(f"bench{user}", f"Habit {habit}", PERIODICITIES[habit % len(PERIODICITIES)])
+             for user in range(users) for habit in range(habits_per_user)]
+        )
+        cursor.execute("SELECT id, periodicity FROM habits")
+        habits = cursor.fetchall()
+
+    step = {"daily": 1, "weekly": 7, "monthly": 30}
+
+    def completions():
+        for habit_id, periodicity in habits:
+            for offset in range(days, 0, -step[periodicity]):
+                if rng.random() < 0.8:
+                    yield habit_id, today - timedelta(days=offset)
+
+    # Bulk loading also rebuilds the streak counters of every habit.
+    mark_habits_complete_bulk(completions(), points_per_completion=0)
+
+
+# This function times one operation and returns its statistics.
+def measure(operation, iterations):
+    """
+    Parameters:
+    - operation (callable): Called with the iteration number.
+    - iterations (int): Number of timed calls, after one untimed warm-up call.
+
+    Returns:
+    - dict: ops_per_sec, p50_ms, p99_ms, peak_memory_kb and iterations.
+    """
+    operation(0)  # Warm up connections and statement caches.
+    timings = []
+    for iteration in range(iterations):
+        start = time.perf_counter()
+        operation(iteration)
+        timings.append(time.perf_counter() - start)
+
+    # Memory is traced in a separate run, because tracing slows down every allocation.
+    tracemalloc.start()
+    operation(iterations)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    timings.sort()
+    return {
+        "iterations": iterations,
+        "ops_per_sec": round(iterations / sum(timings), 1),
+        "p50_ms": round(timings[len(timings) // 2] * 1000, 3),
+        "p99_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000, 3),
+        "peak_memory_kb": round(peak / 1024, 1),
+    }
+
+
+# This function runs every benchmark on one database size.
+def run_size(size, iterations):
+    users, habits_per_user, days = parse_size(size)
+    build_database(users, habits_per_user, days)
+
+    usernames = [f"bench{index}" for index in range(users)]
+    user = User(usernames[0], "bench")
+    user.login()
+    habits = user.getHabits()
+
+    def login(iteration):
+        User(usernames[iteration % users], "bench").login()
+
+    def mark_complete(iteration):
+        mark_habit_complete(habits[iteration % len(habits)].habit_id)
+
+    def get_streak(iteration):
+        habits[iteration % len(habits)].getStreak()
+
+    def longest_streak(iteration):
+        Analytics(habits).getLongestStreakAllHabits()
+
+    benchmarks = [("login", login), ("mark_complete", mark_complete),
+                  ("get_streak", get_streak), ("longest_streak", longest_streak)]
+    results = []
+    for name, operation in benchmarks:
+        result = {"benchmark": name, "size": size}
+        result.update(measure(operation, iterations))
+        results.append(result)
+    points_ledger.flush()
+    return results
+
+
+# This function runs the benchmarks on fresh databases of the given sizes.
+def run_benchmarks(sizes=DEFAULT_SIZES, iterations=DEFAULT_ITERATIONS):
+    """
+    Returns:
+    - dict: "environment" (Python, SQLite and platform versions) and "results" (one entry per benchmark and size).
+    """
+    results = []
+    points_ledger.flush()  # Nothing recorded against the real database may end up in a benchmark database.
+    try:
+        for size in sizes:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                configure_connection_pool(path=os.path.join(tmp_dir, "benchmark.db"))
+                setup_database()
+                # The operations print progress messages; keep them out of the report.
+                with contextlib.redirect_stdout(io.StringIO()):
+                    results.extend(run_size(size, iterations))
+                close_connection_pool()  # Release the database file before it is deleted.
+    finally:
+        configure_connection_pool()
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+
+
+# This function compares benchmark results to a baseline run.
+def compare_to_baseline(report, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Parameters:
+    - report (dict): Results of 'run_benchmarks'.
+    - baseline (dict): Earlier results of 'run_benchmarks'.
+    - tolerance (float): Allowed relative slowdown or memory growth, e.g. 0.2 for 20%.
+
+    Returns:
+    - list: One message per regression; empty when nothing regressed.
+    """
+    previous = {(result["benchmark"], result["size"]): result for result in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        before = previous.get((result["benchmark"], result["size"]))
+        if before is None:
+            continue
+        name = f"{result['benchmark']} [{result['size']}]"
+        if result["ops_per_sec"] < before["ops_per_sec"] * (1 - tolerance):
+            regressions.append(f"{name}: {result['ops_per_sec']} ops/sec, baseline {before['ops_per_sec']}")
+        if result["peak_memory_kb"] > before["peak_memory_kb"] * (1 + tolerance):
+            regressions.append(f"{name}: peak memory {result['peak_memory_kb']} KiB, baseline {before['peak_memory_kb']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Habit Tracker's hot paths.")
+    parser.add_argument("--sizes", nargs="+", default=DEFAULT_SIZES, help="Database sizes as USERSxHABITSxDAYS.")
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS, help="Timed calls per benchmark.")
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", help="Compare against the results in this JSON file.")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Allowed relative regression before failing (default 0.2).")
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        parse_size(size)  # Reject bad sizes before building any database.
+
+    report = run_benchmarks(args.sizes, args.iterations)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare_to_baseline(report, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
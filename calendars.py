@@ -0,0 +1,282 @@
+import sqlite3
+from datetime import date, timedelta
+from database_operations import with_database_connection, chunked_ids
+from rollups import period_start
+from streaks import PERIODICITIES, period_index
+
+# Bitmap completion calendars.
+#
+# A habit is completed at most once per day that counts, so its history fits in one bit
+# per day. 'completion_calendars' stores it as one BLOB per habit and calendar year: bit
+# i (byte i // 8, bit i % 8) is set when the habit was completed on day i of the year,
+# counted from 1 January. A year takes 46 bytes however often the habit was completed.
+#
+# The BLOBs are a cache of the completions table: 'load_calendars' builds the missing
+# years from the completions and stores them when it can take the write lock without
+# waiting for another writer's commit, and triggers drop a year's BLOB whenever
+# the habit's completions in that year change. A 'CompletionCalendar' joins the years
+# into one Python integer, so streaks, gaps and completion rates are computed with
+# shifts, masks and popcounts instead of loops over dates.
+#
+#   calendar = load_calendar(habit.habit_id, habit.periodicity)
+#   print(calendar.heatmap())
+
+YEAR_BYTES = 46  # 366 days, rounded up to whole bytes.
+HEATMAP_WEEKS = 53
+_WEEKDAY_LABELS = ("Mon", "", "Wed", "", "Fri", "", "")
+
+
+# This function returns the length of the longest run of consecutive set bits.
+def _longest_run(bits):
+    # Each step removes the last bit of every run, so the number of steps is the longest run.
+    length = 0
+    while bits:
+        bits &= bits >> 1
+        length += 1
+    return length
+
+
+# This function returns the length of the run of set bits that ends at 'position'.
+def _run_ending_at(bits, position):
+    if position < 0 or not bits >> position & 1:
+        return 0
+    unset = ~bits & ((1 << (position + 1)) - 1)  # Unset bits up to the position.
+    return position - (unset.bit_length() - 1)
+
+
+# The 'CompletionCalendar' class holds a habit's completions over a range of years as a bitset of days.
+class CompletionCalendar:
+    def __init__(self, habit_id, periodicity, first_year, last_year, bits=0):
+        """
+        Parameters:
+        - habit_id (int): The habit.
+        - periodicity (str): "daily", "weekly" or "monthly"; streaks and gaps are counted in these periods.
+        - first_year (int), last_year (int): The years covered.
+        - bits (int): Bit i is set when the habit was completed on the i-th day since 1 January of first_year.
+        """
+        self.habit_id = habit_id
+        self.periodicity = periodicity
+        self.first_year = first_year
+        self.last_year = last_year
+        self.base = date(first_year, 1, 1).toordinal()  # Day ordinal of bit 0.
+        self.bits = bits
+
+    @classmethod
+    def from_year_blobs(cls, habit_id, periodicity, first_year, last_year, blobs):
+        # Build a calendar from {year: BLOB}; years without a BLOB have no completions.
+        calendar = cls(habit_id, periodicity, first_year, last_year)
+        for year, blob in blobs.items():
+            calendar.bits |= int.from_bytes(blob, "little") << (date(year, 1, 1).toordinal() - calendar.base)
+        return calendar
+
+    def year_blob(self, year):
+        # The BLOB stored for one year of the calendar.
+        start = date(year, 1, 1).toordinal() - self.base
+        days = date(year + 1, 1, 1).toordinal() - date(year, 1, 1).toordinal()
+        return (self.bits >> start & ((1 << days) - 1)).to_bytes(YEAR_BYTES, "little")
+
+    def _offset(self, day):
+        return day.toordinal() - self.base
+
+    def _mask(self, first, last):
+        # Bits of the days from 'first' to 'last' (dates, inclusive) that lie within the calendar.
+        start = max(self._offset(first), 0)
+        end = min(self._offset(last), date(self.last_year, 12, 31).toordinal() - self.base)
+        return ((1 << (end - start + 1)) - 1) << start if end >= start else 0
+
+    def is_completed(self, day):
+        offset = self._offset(day)
+        return offset >= 0 and bool(self.bits >> offset & 1)
+
+    def days(self):
+        # The completed days, oldest first.
+        bits, offset = self.bits, 0
+        while bits:
+            skip = (bits & -bits).bit_length() - 1
+            offset += skip
+            yield date.fromordinal(self.base + offset)
+            bits >>= skip + 1
+            offset += 1
+
+    def count(self, first=None, last=None):
+        """
+        Count the days with a completion, optionally only from 'first' to 'last' (dates, inclusive).
+        """
+        if first is None and last is None:
+            return self.bits.bit_count()
+        first = first or date(self.first_year, 1, 1)
+        last = last or date(self.last_year, 12, 31)
+        return (self.bits & self._mask(first, last)).bit_count()
+
+    def completion_rate(self, days=30, today=None):
+        """
+        Share of the periods in the last 'days' days that have at least one completion.
+
+        Returns:
+        - float: Between 0 and 1. For a daily habit this is the share of days with a completion; weekly
+          and monthly habits count the weeks or months that overlap the window.
+        """
+        today = today or date.today()
+        first = today - timedelta(days=days - 1)
+        if self.periodicity == "daily":
+            return self.count(first, today) / days
+        periods, base = self._period_bits()
+        start, end = period_index(first, self.periodicity) - base, period_index(today, self.periodicity) - base
+        if end < 0:
+            return 0.0
+        window = ((1 << (end - max(start, 0) + 1)) - 1) << max(start, 0)
+        return (periods & window).bit_count() / (end - start + 1)
+
+    def _period_bits(self):
+        # The calendar folded into one bit per period of the habit's periodicity, and the period index of bit 0.
+        if self.periodicity == "daily":
+            return self.bits, self.base
+        if self.periodicity not in PERIODICITIES:
+            raise ValueError(f"Unsupported periodicity: {self.periodicity}")
+        first_period = period_index(date.fromordinal(self.base), self.periodicity)
+        periods, bits, offset = 0, self.bits, 0
+        while bits:
+            # Set the bit of the period holding the next completion, then skip the rest of that period.
+            offset += (bits & -bits).bit_length() - 1
+            period = period_index(date.fromordinal(self.base + offset), self.periodicity)
+            periods |= 1 << (period - first_period)
+            next_offset = period_start(period + 1, self.periodicity).toordinal() - self.base
+            bits = self.bits >> next_offset
+            offset = next_offset
+        return periods, first_period
+
+    def longest_streak(self):
+        # The most consecutive periods with a completion.
+        return _longest_run(self._period_bits()[0])
+
+    def current_streak(self, today=None):
+        # The run of periods ending with the latest completion, while it is still alive
+        # (it ended in the current period or the one before), as in 'streaks.StreakSummary.current'.
+        periods, base = self._period_bits()
+        if not periods:
+            return 0
+        last = periods.bit_length() - 1
+        if last + base < period_index(today or date.today(), self.periodicity) - 1:
+            return 0
+        return _run_ending_at(periods, last)
+
+    def longest_gap(self):
+        # The most consecutive periods without a completion between the first and the latest completion.
+        periods, _ = self._period_bits()
+        if not periods:
+            return 0
+        first = (periods & -periods).bit_length() - 1
+        span = ((1 << periods.bit_length()) - 1) ^ ((1 << first) - 1)
+        return _longest_run(~periods & span)
+
+    def heatmap(self, today=None, weeks=HEATMAP_WEEKS, filled="■", empty="·"):
+        """
+        Render the last 'weeks' weeks as a GitHub-style calendar: one column per week, one row per weekday.
+
+        Returns:
+        - str: The calendar, with month names above the columns in which a month starts.
+        """
+        today = today or date.today()
+        first_monday = today.toordinal() - today.weekday() - 7 * (weeks - 1)
+
+        months = [" "] * weeks
+        free_from = 0
+        for column in range(weeks):
+            monday = date.fromordinal(first_monday + 7 * column)
+            sunday = monday + timedelta(days=6)
+            if column == 0 or sunday.day <= 7:
+                name = f"{sunday:%b}" if column else f"{monday:%b}"
+                if column >= free_from and column + len(name) <= weeks:
+                    months[column:column + len(name)] = name
+                    free_from = column + len(name) + 1
+        lines = ["    " + "".join(months).rstrip()]
+
+        for weekday in range(7):
+            cells = []
+            for column in range(weeks):
+                ordinal = first_monday + 7 * column + weekday
+                if ordinal > today.toordinal():
+                    cells.append(" ")
+                else:
+                    offset = ordinal - self.base
+                    cells.append(filled if offset >= 0 and self.bits >> offset & 1 else empty)
+            lines.append(f"{_WEEKDAY_LABELS[weekday]:<4}" + "".join(cells).rstrip())
+        return "\n".join(lines)
+
+
+# This function loads the completion calendars of several habits, building and storing missing years.
+def load_calendars(habits, first_year, last_year):
+    """
+    Parameters:
+    - habits (iterable): (habit_id, periodicity) pairs.
+    - first_year (int), last_year (int): The years to load.
+
+    Returns:
+    - dict: Habit ID -> CompletionCalendar.
+    """
+    periodicities = dict(habits)
+    years = range(first_year, last_year + 1)
+    blobs = {habit_id: {} for habit_id in periodicities}
+
+    with with_database_connection() as cursor:
+        for chunk, placeholders in chunked_ids(periodicities):
+            cursor.execute(
+                f"""SELECT habit_id, year, days FROM completion_calendars
+                    WHERE habit_id IN ({placeholders}) AND year BETWEEN ? AND ?""",
+                [*chunk, first_year, last_year]
+            )
+            for habit_id, year, days in cursor.fetchall():
+                blobs[habit_id][year] = days
+
+        missing = [habit_id for habit_id in periodicities if len(blobs[habit_id]) < len(years)]
+        if missing:
+            # Build the missing years from the completions in a deferred transaction, so viewing a
+            # calendar only takes the write lock when storing the BLOBs. The read snapshot holds until
+            # then; if a completion was committed in the meantime, SQLite refuses the upgrade and the
+            # BLOBs are left to be built on the next view.
+            if not cursor.connection.in_transaction:
+                cursor.execute("BEGIN")
+            built = {habit_id: CompletionCalendar(habit_id, periodicities[habit_id], first_year, last_year)
+                     for habit_id in missing}
+            base = date(first_year, 1, 1).toordinal()
+            for chunk, placeholders in chunked_ids(missing):
+                cursor.execute(
+                    f"""SELECT habit_id, completion_day FROM completions
+                        WHERE habit_id IN ({placeholders}) AND completion_day BETWEEN ? AND ?""",
+                    [*chunk, base, date(last_year, 12, 31).toordinal()]
+                )
+                for habit_id, day in cursor.fetchall():
+                    built[habit_id].bits |= 1 << (day - base)
+
+            rows = []
+            for habit_id, calendar in built.items():
+                for year in years:
+                    if year not in blobs[habit_id]:
+                        blobs[habit_id][year] = calendar.year_blob(year)
+                        rows.append((habit_id, year, blobs[habit_id][year]))
+            try:
+                cursor.executemany("INSERT OR REPLACE INTO completion_calendars (habit_id, year, days) VALUES (?, ?, ?)",
+                                   rows)
+            except sqlite3.OperationalError as error:
+                if "locked" not in str(error):
+                    raise
+                cursor.connection.rollback()  # Another writer got there first; the calendars are still returned.
+
+    return {habit_id: CompletionCalendar.from_year_blobs(habit_id, periodicities[habit_id], first_year, last_year,
+                                                         blobs[habit_id])
+            for habit_id in periodicities}
+
+
+# This function loads one habit's completion calendar, by default covering every year with a completion.
+def load_calendar(habit_id, periodicity, first_year=None, last_year=None):
+    if first_year is None or last_year is None:
+        with with_database_connection() as cursor:
+            cursor.execute("SELECT MIN(completion_day), MAX(completion_day) FROM completions WHERE habit_id = ?",
+                           (habit_id,))
+            first_day, last_day = cursor.fetchone()
+        this_year = date.today().year
+        if first_year is None:
+            first_year = date.fromordinal(first_day).year if first_day else this_year
+        if last_year is None:
+            last_year = max(date.fromordinal(last_day).year if last_day else this_year, this_year)
+    return load_calendars([(habit_id, periodicity)], first_year, last_year)[habit_id]
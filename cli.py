@@ -1,8 +1,9 @@
 from models import User, SessionManager, Habit, Analytics, Reminder, Reward
-from database_operations import with_database_connection, setup_database
-from datetime import time
-from habit_operations import add_habit, get_habits, mark_habit_complete, delete_habit 
+from database_operations import setup_database
+from datetime import date, time
+from habit_operations import add_habit, mark_habit_complete, delete_habit 
 from user_operations import register_user, verify_user
+from points_ledger import points_ledger
 
 
 # Create an instance of the SessionManager class to manage user sessions.
@@ -43,7 +44,10 @@ def main_cli():
                 user = User(username, password)
                 if user.login():
                     active_user = user
+                    session_manager.start_session(user)
                     print("Successfully logged in!")
+                    for habit in user.broken_streaks:
+                        print(f"Streak broken for '{habit.title}'! -10 points")
                 else:
                     print("Login failed!")
                     continue
@@ -54,8 +58,8 @@ def main_cli():
                 break
                 
         else:
-            # Display options for logged-in users: Add Habit, View Habits, Mark Habit as Complete, Check Rewards, View Analytics, Logout
-            print("1. Add Habit\n2. View Habits\n3. Mark Habit as Complete\n4. Check Rewards\n5. View Analytics\n6. Logout")
+            # Display options for logged-in users: Add Habit, View Habits, Mark Habit as Complete, Check Rewards, View Analytics, Logout, View Calendar
+            print("1. Add Habit\n2. View Habits\n3. Mark Habit as Complete\n4. Check Rewards\n5. View Analytics\n6. Logout\n7. View Calendar")
             choice = input("Enter your choice: ")
             
             # Handle adding a new habit.
@@ -77,12 +81,15 @@ def main_cli():
                     
             # Handle viewing existing habits.
             elif choice == "2":
-                with with_database_connection() as cursor:
-                    habits = get_habits(active_user.username, active_user)
+                habits = active_user.getHabits()
 
                 if habits:
                     for idx, habit in enumerate(habits, 1):
-                        print(f"{idx}. {habit.title} ({habit.description})")
+                        reminder = habit.reminder_time
+                        if reminder:
+                            print(f"{idx}. {habit.title} ({habit.description}) - Reminder: {reminder.nextReminderTime} ({reminder.reminderFrequency})")
+                        else:
+                            print(f"{idx}. {habit.title} ({habit.description})")
 
                     delete_choice = input("Do you want to delete a habit? (yes/no): ").lower()
 
@@ -107,10 +114,8 @@ def main_cli():
                         
                         
             elif choice == "3":
-                # Establish a connection to the database.
-                with with_database_connection() as cursor:
-                    # Retrieve the list of habits associated with the currently active user.
-                    habits = get_habits(active_user.username, active_user)
+                # Retrieve the list of habits associated with the currently active user.
+                habits = active_user.getHabits()
 
                 # Check if there are habits to display.
                 if habits:
@@ -137,7 +142,11 @@ def main_cli():
                                 completion_date = None
 
                             # Mark the selected habit as complete and store the completion date.
-                            mark_habit_complete(selected_habit.habit_id, completion_date)
+                            try:
+                                mark_habit_complete(selected_habit.habit_id, completion_date)
+                            except ValueError:
+                                print("Invalid date. Please use the YYYY-MM-DD format.")
+                                continue
 
                             # Check if the user's reward system is initialized.
                             if active_user and active_user.reward:
@@ -169,9 +178,11 @@ def main_cli():
                     print("No other rewards so far.")
 
             elif choice == "5":
-                # Retrieve the user's habits and create an Analytics object.
-                habits_objects = get_habits(active_user.username, active_user)
+                # Retrieve the user's cached habits and create an Analytics object.
+                habits_objects = active_user.getHabits()
                 analytics = Analytics(habits_objects)
+                # Compute every habit's streaks once; the streak figures below reuse them.
+                analytics.getStreakSummaries()
 
                 # Display various analytics related to the user's habits.
                 print(f"Total habits: {len(analytics.getAllHabits())}")
@@ -181,6 +192,11 @@ def main_cli():
                 print(f"Weekly habits count: {len(analytics.getHabitsByPeriodicity('weekly'))}")
                 print(f"Monthly habits count: {len(analytics.getHabitsByPeriodicity('monthly'))}")
                 print(f"Longest streak across all habits: {analytics.getLongestStreakAllHabits()}")
+                for title, rate in analytics.getCompletionRates().items():
+                    print(f"- {title}: completed in {rate:.0%} of its periods over the last 30 days")
+                best = analytics.getBestWeek()
+                if best:
+                    print(f"Best week: {best[0]:%Y-%m-%d} with {best[1]} completions")
 
                 # Get the longest streak for a specific habit.
                 specific_habit_query = input("Do you want to get the longest streak for a specific habit? (yes/no): ").lower()
@@ -195,9 +211,37 @@ def main_cli():
                         print(f"Unable to retrieve the longest streak for habit '{habit_title}'.")
                     
             elif choice == "6":
-                # Log out the active user.
+                # Log out the active user, writing any points changes that are still waiting.
+                points_ledger.flush()
+                session_manager.end_session(active_user)
                 active_user = None 
                 print("Logged out successfully!")
+
+            elif choice == "7":
+                # Show a habit's completions over the last year as a calendar heatmap.
+                habits = active_user.getHabits()
+                if habits:
+                    for idx, habit in enumerate(habits, 1):
+                        print(f"{idx}. {habit.title} ({habit.description})")
+                    try:
+                        habit_choice = int(input("Select habit number to view: "))
+                    except ValueError:
+                        print("Please enter a valid number.")
+                        continue
+
+                    if 1 <= habit_choice <= len(habits):
+                        selected_habit = habits[habit_choice - 1]
+                        today = date.today()
+                        calendar = selected_habit.getCalendar(today.year - 1, today.year)
+                        print(calendar.heatmap(today))
+                        print(f"Current streak: {calendar.current_streak(today)}, "
+                              f"longest streak since {today.year - 1}: {calendar.longest_streak()}, "
+                              f"longest gap: {calendar.longest_gap()}")
+                        print(f"Completed in {calendar.completion_rate(365, today):.0%} of its periods over the last year")
+                    else:
+                        print("Invalid choice. Please select a number from the given list.")
+                else:
+                    print("No habits found!")
                 
 if __name__ == "__main__":
     main_cli()
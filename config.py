@@ -0,0 +1,154 @@
+import os
+from configparser import ConfigParser
+
+# Storage engine configuration for the Habit Tracker.
+#
+# Settings are resolved in this order, later sources overriding earlier ones:
+#   1. Built-in defaults (the "balanced" preset, database file "habits.db").
+#   2. The preset named by 'preset' (see PRESETS below).
+#   3. The [database] section of an INI file named by HABITS_CONFIG (default: habits.ini, if present).
+#   4. Environment variables such as HABITS_DB_PATH or HABITS_DB_SYNCHRONOUS.
+#
+# Example habits.ini:
+#
+#   [database]
+#   preset = throughput
+#   path = /var/lib/habits/habits.db
+#   busy_timeout = 10000
+
+CONFIG_FILE_ENV = "HABITS_CONFIG"
+DEFAULT_CONFIG_FILE = "habits.ini"
+ENV_PREFIX = "HABITS_DB_"
+
+# Named pragma presets.
+# - "durability": every commit is fsynced (synchronous=FULL), no memory-mapped I/O.
+#   Nothing acknowledged is lost on power failure, at the cost of slower writes.
+# - "balanced": WAL with synchronous=NORMAL. The database cannot be corrupted, but the
+#   last few commits may be rolled back after a power failure (not after an app crash).
+# - "throughput": "balanced" plus a 64 MiB page cache, 256 MiB of memory-mapped I/O and
+#   in-memory temporary tables. Suited to read-heavy deployments with spare RAM.
+PRESETS = {
+    "durability": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "cache_size": -2000,
+        "mmap_size": 0,
+        "temp_store": "DEFAULT",
+        "busy_timeout": 5000,
+    },
+    "balanced": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -8000,
+        "mmap_size": 0,
+        "temp_store": "DEFAULT",
+        "busy_timeout": 5000,
+    },
+    "throughput": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -65536,
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
+}
+
+DEFAULT_PRESET = "balanced"
+
+# Allowed values for the enumerated pragmas.
+_CHOICES = {
+    "journal_mode": {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"},
+    "synchronous": {"OFF", "NORMAL", "FULL", "EXTRA"},
+    "temp_store": {"DEFAULT", "FILE", "MEMORY"},
+}
+_INTEGER_SETTINGS = {"cache_size", "mmap_size", "busy_timeout", "pool_size", "cached_statements"}
+_FLOAT_SETTINGS = {"health_check_interval"}
+
+
+# The 'StorageSettings' class holds the database location, connection pool
+# settings and the pragmas applied to every new connection.
+class StorageSettings:
+    PRAGMA_NAMES = ("journal_mode", "synchronous", "cache_size", "mmap_size", "temp_store", "busy_timeout")
+
+    def __init__(self, path="habits.db", preset=DEFAULT_PRESET, pool_size=5,
+                 health_check_interval=30.0, cached_statements=128, **pragmas):
+        if preset not in PRESETS:
+            raise ValueError(f"Unknown storage preset: {preset}")
+        self.path = path
+        self.preset = preset
+        self.pool_size = _coerce("pool_size", pool_size)
+        self.health_check_interval = _coerce("health_check_interval", health_check_interval)
+        self.cached_statements = _coerce("cached_statements", cached_statements)
+
+        values = dict(PRESETS[preset])
+        for name, value in pragmas.items():
+            if name not in self.PRAGMA_NAMES:
+                raise ValueError(f"Unknown storage setting: {name}")
+            values[name] = value
+        for name in self.PRAGMA_NAMES:
+            setattr(self, name, _coerce(name, values[name]))
+
+    def pragma_statements(self):
+        # Return the PRAGMA statements to run on each new connection.
+        # Values are validated in '_coerce', so they are safe to format into SQL.
+        return [f"PRAGMA {name} = {getattr(self, name)}" for name in self.PRAGMA_NAMES]
+
+    def __repr__(self):
+        pragmas = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.PRAGMA_NAMES)
+        return f"StorageSettings(path={self.path!r}, preset={self.preset!r}, {pragmas})"
+
+
+def _coerce(name, value):
+    # Convert a raw setting (possibly a string from a file or the environment) to its proper type.
+    if name in _CHOICES:
+        value = str(value).strip().upper()
+        if value not in _CHOICES[name]:
+            raise ValueError(f"Invalid value for {name}: {value}")
+        return value
+    try:
+        if name in _INTEGER_SETTINGS:
+            return int(value)
+        if name in _FLOAT_SETTINGS:
+            return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid value for {name}: {value!r}")
+    return value
+
+
+def _read_config_file(path):
+    # Read the [database] section of an INI config file, if the file exists.
+    if not path or not os.path.exists(path):
+        return {}
+    parser = ConfigParser()
+    parser.read(path)
+    if not parser.has_section("database"):
+        return {}
+    return dict(parser.items("database"))
+
+
+def _read_environment(environ):
+    # Collect HABITS_DB_* variables, e.g. HABITS_DB_PATH or HABITS_DB_MMAP_SIZE.
+    settings = {}
+    for key, value in environ.items():
+        if key.startswith(ENV_PREFIX):
+            settings[key[len(ENV_PREFIX):].lower()] = value
+    return settings
+
+
+def load_storage_settings(environ=None, **overrides):
+    """
+    Build the storage settings from the config file and environment variables.
+
+    Parameters:
+    - environ (dict): Environment to read from. Defaults to 'os.environ'.
+    - overrides: Settings that take precedence over every other source.
+
+    Returns:
+    - StorageSettings: The resolved settings.
+    """
+    environ = os.environ if environ is None else environ
+    settings = _read_config_file(environ.get(CONFIG_FILE_ENV, DEFAULT_CONFIG_FILE))
+    settings.update(_read_environment(environ))
+    settings.update(overrides)
+    return StorageSettings(**settings)
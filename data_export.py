@@ -0,0 +1,175 @@
+import argparse
+import csv
+import gzip
+import io
+import json
+import sys
+from database_operations import with_database_connection, setup_database
+
+# Streaming export of habits, completions, reminders and points.
+#
+# Rows are read from the cursor in fixed-size chunks and written out one at a time
+# through generators, so memory use does not depend on how much history is exported.
+# Completions and reminders carry the habit's username and title as well as its ID,
+# so an export can be loaded into another database (see 'data_import').
+#
+#   python data_export.py completions completions.csv.gz --user TeeLv
+#   python data_export.py habits - --format jsonl
+
+EXPORT_CHUNK_SIZE = 1000  # Rows fetched from the cursor at a time.
+FORMATS = ("csv", "jsonl")
+
+# Export name -> (columns, query, username column). '{where}' is filled in when exporting one user's data.
+EXPORTS = {
+    "habits": (
+        ["id", "username", "title", "description", "periodicity", "creation_date", "streak_broken_date",
+         "current_streak", "longest_streak"],
+        """SELECT h.id, h.username, h.title, h.description, h.periodicity, h.creation_date, h.streak_broken_date,
+                  h.current_streak, h.longest_streak
+           FROM habits h {where} ORDER BY h.id""",
+        "h.username",
+    ),
+    "completions": (
+        ["username", "title", "habit_id", "completion_date"],
+        """SELECT h.username, h.title, c.habit_id, c.completion_date
+           FROM habits h JOIN completions c ON c.habit_id = h.id {where}
+           ORDER BY h.id, c.completion_day""",
+        "h.username",
+    ),
+    "reminders": (
+        ["username", "title", "habit_id", "next_reminder_time", "reminder_frequency", "next_fire_at"],
+        """SELECT h.username, h.title, r.habit_id, r.next_reminder_time, r.reminder_frequency, r.next_fire_at
+           FROM habits h JOIN reminders r ON r.habit_id = h.id {where}
+           ORDER BY h.id, r.id""",
+        "h.username",
+    ),
+    "points": (
+        ["username", "delta", "reason", "created_at"],
+        """SELECT p.username, p.delta, p.reason, p.created_at
+           FROM points_ledger p {where} ORDER BY p.id""",
+        "p.username",
+    ),
+}
+
+
+# This generator streams the rows of one export as dictionaries.
+def iter_records(table, username=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Parameters:
+    - table (str): One of "habits", "completions", "reminders" or "points".
+    - username (str): Only export this user's data. Without it everyone's data is exported.
+    - chunk_size (int): Number of rows fetched from the cursor at a time.
+
+    Yields:
+    - dict: One row, keyed by column name.
+    """
+    if table not in EXPORTS:
+        raise ValueError(f"Unknown export {table!r}; expected one of {', '.join(EXPORTS)}")
+    columns, query, user_column = EXPORTS[table]
+    where, params = (f"WHERE {user_column} = ?", (username,)) if username is not None else ("", ())
+
+    with with_database_connection() as cursor:
+        cursor.execute(query.format(where=where), params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(zip(columns, row))
+
+
+# This generator turns records into CSV text, one line at a time, starting with the header.
+def csv_lines(records, columns):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, lineterminator="\n")
+    writer.writeheader()
+    for record in records:
+        writer.writerow(record)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()  # The header, if there were no records.
+
+
+# This generator turns records into JSON Lines text.
+def jsonl_lines(records):
+    for record in records:
+        yield json.dumps(record) + "\n"
+
+
+# This function works out the export format from an explicit choice or the file name.
+def _detect_format(path, file_format):
+    if file_format is None:
+        file_format = "jsonl" if path.removesuffix(".gz").endswith((".jsonl", ".json")) else "csv"
+    if file_format not in FORMATS:
+        raise ValueError(f"Unknown format {file_format!r}; expected one of {', '.join(FORMATS)}")
+    return file_format
+
+
+# This function opens an export destination for writing text, compressing it if asked to.
+def _open_output(path, compress):
+    if path == "-":
+        return sys.stdout if not compress else io.TextIOWrapper(gzip.GzipFile(fileobj=sys.stdout.buffer, mode="wb"),
+                                                                encoding="utf-8", newline="")
+    if compress:
+        return gzip.open(path, "wt", encoding="utf-8", newline="")
+    return open(path, "w", encoding="utf-8", newline="")
+
+
+# This function exports one table's rows to a CSV or JSONL file.
+def export_records(table, path, username=None, file_format=None, compress=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Parameters:
+    - table (str): One of "habits", "completions", "reminders" or "points".
+    - path (str): Output file, or "-" for standard output.
+    - username (str): Only export this user's data.
+    - file_format (str): "csv" or "jsonl"; by default taken from the file name (CSV unless it ends in .jsonl).
+    - compress (bool): Gzip the output; by default when the file name ends in .gz.
+    - chunk_size (int): Number of rows fetched from the cursor at a time.
+
+    Returns:
+    - int: The number of records written.
+    """
+    file_format = _detect_format(path, file_format)
+    if compress is None:
+        compress = path.endswith(".gz")
+
+    count = 0
+
+    def counted(records):
+        nonlocal count
+        for record in records:
+            count += 1
+            yield record
+
+    records = counted(iter_records(table, username, chunk_size))
+    lines = csv_lines(records, EXPORTS[table][0]) if file_format == "csv" else jsonl_lines(records)
+
+    output = _open_output(path, compress)
+    try:
+        for line in lines:
+            output.write(line)
+    finally:
+        if output is sys.stdout:
+            output.flush()
+        else:
+            output.close()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export Habit Tracker data to CSV or JSON Lines.")
+    parser.add_argument("table", choices=sorted(EXPORTS), help="What to export.")
+    parser.add_argument("output", help="Output file, or - for standard output. A .gz suffix compresses it.")
+    parser.add_argument("--user", help="Only export this user's data.")
+    parser.add_argument("--format", choices=FORMATS, help="Output format (default: from the file name, else csv).")
+    parser.add_argument("--gzip", action="store_true", default=None, help="Compress the output with gzip.")
+    args = parser.parse_args()
+
+    setup_database()
+    count = export_records(args.table, args.output, username=args.user, file_format=args.format, compress=args.gzip)
+    print(f"Exported {count} {args.table} records.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+import argparse
+import csv
+import gzip
+import json
+import os
+import sys
+from collections import OrderedDict
+from database_operations import with_database_connection, setup_database
+from habit_operations import canonical_completion, write_completion_chunk, rebuild_chunk_streaks, notify_completions_written, notify_habit_changed
+from streaks import PERIODICITIES
+
+# Streaming import of completion history from CSV or JSON Lines.
+#
+# Each record names a habit by username and title and gives a completion date, e.g. the
+# output of 'python data_export.py completions ...':
+#
+#   username,title,completion_date
+#   TeeLv,Morning Run,2023-07-25
+#
+# The file is read lazily, line by line. (username, title) pairs are resolved to habit IDs
+# through an in-memory map, dates are validated, and completions already recorded for the
+# same habit and day, in the database or earlier in the file, are skipped. Completions are
+# written in chunked transactions. Each chunk also stores how far into the file the import
+# has got, so running the same import again after a failure resumes where it stopped, and
+# running it after it finished only picks up lines appended since.
+#
+#   python data_import.py history.csv.gz --create-missing
+#
+# CSV records must each fit on one line; quoted fields containing newlines are not supported.
+
+IMPORT_CHUNK_SIZE = 5000  # Lines processed per transaction.
+DAY_CACHE_SIZE = 1024  # Habits whose recorded completion days are kept in memory for deduplication.
+MAX_ERRORS = 20  # Invalid lines described in the import statistics; the rest are only counted.
+
+
+# The 'ImportStats' class counts what an import did with each line.
+class ImportStats:
+    def __init__(self):
+        self.read = 0  # Lines read in this run.
+        self.imported = 0  # Completions inserted.
+        self.duplicates = 0  # Completions skipped because the habit was already completed that day.
+        self.invalid = 0  # Lines that could not be parsed or had an invalid date.
+        self.unknown_habits = 0  # Lines naming a habit that does not exist (without create_missing).
+        self.created_habits = 0  # Habits created for lines naming a missing habit (with create_missing).
+        self.byte_offset = 0  # Position in the file up to which lines have been committed.
+        self.errors = []  # (byte offset, message) of the first MAX_ERRORS invalid lines.
+
+    def add_error(self, offset, message):
+        self.invalid += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append((offset, message))
+
+    def __str__(self):
+        return (f"{self.read} lines read: {self.imported} imported, {self.duplicates} duplicates, "
+                f"{self.invalid} invalid, {self.unknown_habits} for unknown habits, "
+                f"{self.created_habits} habits created (offset {self.byte_offset})")
+
+
+# This function opens an import file for binary reading, decompressing .gz files on the fly.
+def _open_input(path):
+    return gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+
+
+# This generator reads an import file from a byte offset and yields (record, start offset, end offset).
+def iter_import_records(path, file_format=None, offset=0):
+    """
+    Parameters:
+    - path (str): CSV or JSONL file, optionally gzipped.
+    - file_format (str): "csv" or "jsonl"; by default JSONL for .jsonl/.json files, otherwise CSV.
+    - offset (int): Byte offset (of the uncompressed data) to start reading at. The CSV header is always read.
+
+    Yields:
+    - tuple: (record, start, end), where record is a dict, or a string describing why the line is invalid.
+    """
+    if file_format is None:
+        file_format = "jsonl" if path.removesuffix(".gz").endswith((".jsonl", ".json")) else "csv"
+    if file_format not in ("csv", "jsonl"):
+        raise ValueError(f"Unknown format {file_format!r}; expected csv or jsonl")
+
+    with _open_input(path) as stream:
+        header = None
+        if file_format == "csv":
+            header = next(csv.reader([stream.readline().decode("utf-8-sig")]), None)
+            if not header:
+                return
+            offset = max(offset, stream.tell())
+        stream.seek(offset)
+
+        while True:
+            start = stream.tell()
+            line = stream.readline()
+            if not line:
+                return
+            end = stream.tell()
+            text = line.decode("utf-8", errors="replace").strip()
+            if not text:
+                continue
+            try:
+                if header is not None:
+                    record = dict(zip(header, next(csv.reader([text]))))
+                else:
+                    record = json.loads(text)
+                    if not isinstance(record, dict):
+                        raise ValueError("not a JSON object")
+            except (ValueError, csv.Error) as error:
+                record = f"unreadable line: {error}"
+            yield record, start, end
+
+
+# This function imports completion history from a CSV or JSONL file.
+def import_completions(path, file_format=None, chunk_size=IMPORT_CHUNK_SIZE, source=None, restart=False,
+                       create_missing=False, points_per_completion=0, progress=None):
+    """
+    Parameters:
+    - path (str): CSV or JSONL file, optionally gzipped, with username, title and completion_date fields.
+    - file_format (str): "csv" or "jsonl"; by default taken from the file name.
+    - chunk_size (int): Lines processed per transaction; the checkpoint advances once per chunk.
+    - source (str): Name the checkpoint is stored under; the file's absolute path by default.
+    - restart (bool): Ignore any checkpoint and read the file from the start.
+    - create_missing (bool): Create habits named in the file that do not exist yet, using the
+      record's periodicity and description if present (daily by default).
+    - points_per_completion (int): Reward points per imported completion; history is imported without points by default.
+    - progress (callable): Called with the 'ImportStats' after every committed chunk.
+
+    Returns:
+    - ImportStats: What the import did.
+    """
+    source = source or os.path.abspath(path)
+    stats = ImportStats()
+    habit_ids = {}  # (username, title) -> habit ID, or None for unknown habits.
+    recorded_days = OrderedDict()  # habit ID -> set of completion days, least recently used first.
+    pending_days = {}  # habit ID -> completion days in the chunk not yet written.
+    owners = {}  # habit ID -> username, for awarding points.
+    created_for = set()  # Users who got new habits.
+
+    with with_database_connection() as cursor:
+        offset = 0
+        if not restart:
+            cursor.execute("SELECT byte_offset FROM import_checkpoints WHERE source = ?", (source,))
+            row = cursor.fetchone()
+            offset = row[0] if row else 0
+        stats.byte_offset = offset
+
+        def resolve(username, title, record):
+            key = (username, title)
+            if key not in habit_ids:
+                cursor.execute("SELECT id FROM habits WHERE username = ? AND title = ?", key)
+                row = cursor.fetchone()
+                habit_id = row[0] if row else None
+                if habit_id is None and create_missing:
+                    periodicity = record.get("periodicity") if record.get("periodicity") in PERIODICITIES else "daily"
+                    cursor.execute(
+                        """INSERT INTO habits (username, title, description, periodicity, creation_date)
+                           VALUES (?, ?, ?, ?, datetime('now'))""",
+                        (username, title, record.get("description") or "", periodicity)
+                    )
+                    habit_id = cursor.lastrowid
+                    stats.created_habits += 1
+                    created_for.add(username)
+                habit_ids[key] = habit_id
+            return habit_ids[key]
+
+        def days_for(habit_id):
+            # Completion days already recorded for the habit, including ones written by this import.
+            days = recorded_days.get(habit_id)
+            if days is None:
+                # A habit evicted from the cache may have days in the current chunk that are not in the table yet.
+                cursor.execute("SELECT completion_day FROM completions WHERE habit_id = ?", (habit_id,))
+                days = {row[0] for row in cursor.fetchall()} | pending_days.get(habit_id, set())
+                recorded_days[habit_id] = days
+                if len(recorded_days) > DAY_CACHE_SIZE:
+                    recorded_days.popitem(last=False)
+            else:
+                recorded_days.move_to_end(habit_id)
+            return days
+
+        def commit_chunk(rows, end_offset):
+            changed = []
+            if rows:
+                write_completion_chunk(cursor, rows, points_per_completion, owners)
+                # Rebuild the streak counters of the habits that got new completions.
+                changed = rebuild_chunk_streaks(cursor, {row[0] for row in rows})
+            cursor.execute(
+                """INSERT INTO import_checkpoints (source, byte_offset, records) VALUES (?, ?, ?)
+                   ON CONFLICT (source) DO UPDATE SET byte_offset = excluded.byte_offset,
+                       records = import_checkpoints.records + excluded.records, updated_at = datetime('now')""",
+                (source, end_offset, len(rows))
+            )
+            cursor.connection.commit()  # The completions, their streak counters and the checkpoint are committed together.
+            notify_completions_written(changed)
+            pending_days.clear()
+            stats.imported += len(rows)
+            stats.byte_offset = end_offset
+            if progress:
+                progress(stats)
+
+        rows = []
+        lines_in_chunk = 0
+        end = offset
+        for record, start, end in iter_import_records(path, file_format, offset):
+            stats.read += 1
+            lines_in_chunk += 1
+            if isinstance(record, str):
+                stats.add_error(start, record)
+            else:
+                username, title = record.get("username"), record.get("title")
+                completion_date = record.get("completion_date")
+                if not all(isinstance(value, str) for value in (username, title, completion_date)):
+                    stats.add_error(start, "username, title and completion_date must be strings")
+                elif not username or not title or not completion_date.strip():
+                    stats.add_error(start, "username, title and completion_date are required")
+                else:
+                    try:
+                        completion_date, completion_day = canonical_completion(completion_date.strip())
+                    except ValueError:
+                        stats.add_error(start, f"invalid completion date {completion_date!r}")
+                    else:
+                        habit_id = resolve(username, title, record)
+                        if habit_id is None:
+                            stats.unknown_habits += 1
+                        else:
+                            days = days_for(habit_id)
+                            if completion_day in days:
+                                stats.duplicates += 1
+                            else:
+                                days.add(completion_day)
+                                pending_days.setdefault(habit_id, set()).add(completion_day)
+                                rows.append((habit_id, completion_date, completion_day))
+
+            if lines_in_chunk >= chunk_size:
+                commit_chunk(rows, end)
+                rows, lines_in_chunk = [], 0
+
+        if lines_in_chunk or rows:
+            commit_chunk(rows, end)
+
+    for username in created_for:
+        notify_habit_changed(username)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import completion history from CSV or JSON Lines.")
+    parser.add_argument("input", help="CSV or JSONL file with username, title and completion_date; may be gzipped.")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="Input format (default: from the file name, else csv).")
+    parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE, help="Lines per transaction.")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start from the beginning.")
+    parser.add_argument("--create-missing", action="store_true", help="Create habits that do not exist yet.")
+    parser.add_argument("--points", type=int, default=0, help="Reward points per imported completion.")
+    args = parser.parse_args()
+
+    setup_database()
+    stats = import_completions(args.input, file_format=args.format, chunk_size=args.chunk_size, restart=args.restart,
+                               create_missing=args.create_missing, points_per_completion=args.points,
+                               progress=lambda stats: print(stats, file=sys.stderr))
+    for offset, message in stats.errors:
+        print(f"Line at byte {offset}: {message}", file=sys.stderr)
+    print(f"Import finished: {stats}")
+
+
+if __name__ == "__main__":
+    main()
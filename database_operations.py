@@ -1,51 +1,226 @@
+import os
 import sqlite3
+import sys
+import threading
+import time
 from functools import wraps
+from itertools import islice
 from contextlib import contextmanager
+from config import load_storage_settings
+from migrations import migrate
+from query_instrumentation import get_query_recorder, current_query_action
 
-# This context manager provides a convenient way to establish and manage a database connection.
+
+# The 'ConnectionPool' class keeps long-lived SQLite connections so that callers
+# do not pay the connect/close cost on every database operation.
+class ConnectionPool:
+    def __init__(self, database, max_size=5, health_check_interval=30.0, cached_statements=128, pragmas=()):
+        """
+        Parameters:
+        - database (str): Path to the SQLite database file.
+        - max_size (int): Maximum number of idle connections kept in the pool.
+        - health_check_interval (float): Idle seconds after which a connection is checked before reuse.
+        - cached_statements (int): Size of each connection's prepared statement cache.
+        - pragmas (list): PRAGMA statements executed on every new connection.
+        """
+        self.database = database
+        self.max_size = max_size
+        self.health_check_interval = health_check_interval
+        self.cached_statements = cached_statements
+        self.pragmas = list(pragmas)
+        self._lock = threading.Lock()
+        self._idle = []  # Stack of (connection, last_used) pairs, most recently used last.
+        self._pid = os.getpid()
+
+    @classmethod
+    def from_settings(cls, settings):
+        # Build a pool from a 'config.StorageSettings' instance.
+        return cls(settings.path, max_size=settings.pool_size,
+                   health_check_interval=settings.health_check_interval,
+                   cached_statements=settings.cached_statements,
+                   pragmas=settings.pragma_statements())
+
+    def _connect(self):
+        # Connections are handed from thread to thread, but only ever used by one thread at a time.
+        connection = sqlite3.connect(self.database, check_same_thread=False,
+                                     cached_statements=self.cached_statements)
+        for pragma in self.pragmas:
+            connection.execute(pragma)
+        return connection
+
+    def _check_process(self):
+        # Connections must never be shared with a forked child; start with an empty pool instead.
+        if self._pid != os.getpid():
+            self._idle = []
+            self._pid = os.getpid()
+
+    def _is_healthy(self, connection):
+        try:
+            connection.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def acquire(self):
+        """
+        Take a connection from the pool, opening a new one if none are idle.
+
+        Returns:
+            sqlite3.Connection: A connection reserved for the caller until it is released.
+        """
+        while True:
+            with self._lock:
+                self._check_process()
+                if not self._idle:
+                    break
+                connection, last_used = self._idle.pop()
+
+            # Re-validate connections that have been idle for a while before handing them out.
+            if time.monotonic() - last_used < self.health_check_interval or self._is_healthy(connection):
+                return connection
+            self._close_quietly(connection)
+
+        return self._connect()
+
+    def release(self, connection):
+        """
+        Return a connection to the pool, or close it if the pool is already full.
+        """
+        if connection.in_transaction:
+            connection.rollback()  # Never hand out a connection with a half-finished transaction.
+
+        with self._lock:
+            self._check_process()
+            if len(self._idle) < self.max_size:
+                self._idle.append((connection, time.monotonic()))
+                return
+        self._close_quietly(connection)
+
+    def close(self):
+        # Close every idle connection held by the pool.
+        with self._lock:
+            idle, self._idle = self._idle, []
+            owned = self._pid == os.getpid()
+        if owned:
+            for connection, _ in idle:
+                self._close_quietly(connection)
+
+    @staticmethod
+    def _close_quietly(connection):
+        try:
+            connection.close()
+        except sqlite3.Error:
+            pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_connection_pool():
+    """
+    Return the process-wide connection pool, creating it on first use
+    from the storage settings (see 'config.load_storage_settings').
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool.from_settings(load_storage_settings())
+    return _pool
+
+
+def configure_connection_pool(**overrides):
+    """
+    Replace the process-wide connection pool with one built from the storage settings.
+
+    Parameters:
+    - overrides: Settings that take precedence over the config file and environment,
+      e.g. path="other.db" or preset="throughput".
+    """
+    global _pool
+    new_pool = ConnectionPool.from_settings(load_storage_settings(**overrides))
+    with _pool_lock:
+        old_pool, _pool = _pool, new_pool
+    if old_pool is not None:
+        old_pool.close()
+
+
+def close_connection_pool():
+    """
+    Close all pooled connections. The pool reopens connections on demand afterwards.
+    """
+    if _pool is not None:
+        _pool.close()
+
+
+# This context manager provides a convenient way to borrow a database connection from the pool.
 @contextmanager
 def with_database_connection():
     """
     A context manager that provides a connection to the SQLite database.
-    This context manager ensures that the connection is established, 
-    used, and properly closed/committed after use.
+    This context manager borrows a pooled connection, commits any changes
+    when the block finishes normally, rolls them back if it raises, and
+    returns the connection to the pool.
 
     Yields:
         cursor (sqlite3.Cursor): A cursor for executing SQLite commands.
     """
-    connection = sqlite3.connect("habits.db")
+    pool = get_connection_pool()
+    connection = pool.acquire()
     cursor = connection.cursor()
-    
+
+    # With query instrumentation enabled, statements are timed and attributed to the current
+    # action, or else to the function that opened this connection.
+    recorder = get_query_recorder()
+    if recorder is not None:
+        cursor = recorder.wrap(cursor, current_query_action() or sys._getframe(2).f_code.co_name)
+
     try:
-        yield cursor  # Provide the cursor for database operations.
-    finally:
+        try:
+            yield cursor  # Provide the cursor for database operations.
+        except BaseException:
+            connection.rollback()  # Discard the partial work of a failed block.
+            raise
         connection.commit()  # Save any changes made in the database.
-        cursor.close()       # Close the cursor.
-        connection.close()   # Terminate the database connection.
+    finally:
+        try:
+            cursor.close()  # Close the cursor.
+        finally:
+            pool.release(connection)  # Hand the connection back for reuse.
+
+# Largest number of IDs bound in one 'IN (...)' list, well below SQLite's parameter limit.
+IN_CHUNK_SIZE = 500
+
+
+# This function splits IDs into chunks for 'IN (...)' queries.
+def chunked_ids(ids, chunk_size=IN_CHUNK_SIZE):
+    """
+    Parameters:
+    - ids (iterable): The IDs to split; consumed lazily.
+    - chunk_size (int): Largest number of IDs per chunk.
+
+    Yields:
+        tuple: A list of IDs and the matching "?, ?, ..." placeholders.
+    """
+    ids = iter(ids)
+    while True:
+        chunk = list(islice(ids, chunk_size))
+        if not chunk:
+            return
+        yield chunk, ", ".join("?" * len(chunk))
+
 
 def setup_database():
     """
-    Set up the SQLite database by creating required tables if they don't exist.
+    Set up the SQLite database by applying any pending schema migrations.
+    When the schema is already current this only reads 'PRAGMA user_version'.
+
+    Returns:
+        int: The schema version of the database.
     """
     with with_database_connection() as cursor:
-        # Create table for users.
-        cursor.execute('''CREATE TABLE IF NOT EXISTS users
-                         (username TEXT PRIMARY KEY, password TEXT, points INTEGER DEFAULT 0)''')
-        
-        # Create table for habits.
-        cursor.execute('''CREATE TABLE IF NOT EXISTS habits
-                          (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT, title TEXT, 
-                           description TEXT, periodicity TEXT, creation_date DATETIME, 
-                           streak_broken_date DATETIME DEFAULT NULL)''')
-        
-        # Create table for reminders.
-        cursor.execute('''CREATE TABLE IF NOT EXISTS reminders
-                         (id INTEGER PRIMARY KEY AUTOINCREMENT, habit_id INTEGER, next_reminder_time TEXT, 
-                          reminder_frequency TEXT)''')
-        
-        # Create table to keep track of habit completions.
-        cursor.execute('''CREATE TABLE IF NOT EXISTS completions
-                         (id INTEGER PRIMARY KEY AUTOINCREMENT, habit_id INTEGER, completion_date DATETIME)''')
+        return migrate(cursor)
 
 
 def setup_test_environment():
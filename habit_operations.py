@@ -1,8 +1,53 @@
 import sqlite3
 from database_operations import with_database_connection
+from streaks import record_completion, rebuild_streak_counters
 import importlib
-from datetime import date, datetime
+import threading
+import weakref
+from array import array
+from itertools import islice
+from datetime import date, datetime, time
 
+# Number of completions written per transaction by 'mark_habits_complete_bulk'.
+BULK_CHUNK_SIZE = 500
+
+# Objects caching habits (e.g. 'HabitRepository') that are told when habits change, indexed
+# by the user whose habits they cache, so a write only reaches the owner's caches. Listeners
+# for every user (e.g. 'ReminderScheduler') are kept apart. All are held weakly, so a cache
+# disappears together with the session that owns it.
+_habit_listeners = {}  # username -> WeakSet of listeners.
+_global_habit_listeners = weakref.WeakSet()
+_habit_listeners_lock = threading.Lock()
+
+
+# This function registers an object whose 'habit_changed(username, habit_id)' method is
+# called after a habit of 'username' (of any user, if None) is added, edited, deleted or completed.
+def register_habit_listener(listener, username=None):
+    with _habit_listeners_lock:
+        if username is None:
+            _global_habit_listeners.add(listener)
+        else:
+            _habit_listeners.setdefault(username, weakref.WeakSet()).add(listener)
+
+
+# This function tells the registered listeners that a habit of 'username' changed.
+# Listeners are called with 'username' when the user's set of habits (or a habit's details)
+# changed, and with None when 'history_only' is set, i.e. only the completion history of
+# 'habit_id' changed. Without a username every listener is told.
+def notify_habit_changed(username=None, habit_id=None, history_only=False):
+    with _habit_listeners_lock:
+        listeners = list(_global_habit_listeners)
+        if username is None:
+            for user_listeners in _habit_listeners.values():
+                listeners.extend(user_listeners)
+        elif username in _habit_listeners:
+            user_listeners = _habit_listeners[username]
+            if user_listeners:
+                listeners.extend(user_listeners)
+            else:
+                del _habit_listeners[username]  # Every cache of this user is gone.
+    for listener in listeners:
+        listener.habit_changed(None if history_only else username, habit_id)
 
 
 # This function adds a new habit to the database for a given user.
@@ -21,6 +66,8 @@ def add_habit(username, title, description, periodicity, reminder):
             cursor.execute("INSERT INTO reminders (habit_id, next_reminder_time, reminder_frequency) VALUES (?, ?, ?)",
                            (habit_id, reminder.nextReminderTime, reminder.reminderFrequency))
 
+    notify_habit_changed(username, habit_id)
+
 
 
 
@@ -32,64 +79,274 @@ def get_habits(username, user):
         Habit = importlib.import_module('models').Habit
         
         # Execute a query to retrieve habit records for the given username.
-        cursor.execute("SELECT * FROM habits WHERE username=?", (username,))
+        cursor.execute("SELECT id, title, description, periodicity, creation_date, streak_broken_date FROM habits "
+                       "WHERE username=? ORDER BY id", (username,))
         rows = cursor.fetchall()
 
         habits = []
-        for row in rows:
-            # Create a dictionary to hold habit details from the database row.
-            habit_dict = {
-                'id': row[0],
-                'username': row[1],
-                'title': row[2],
-                'description': row[3],
-                'periodicity': row[4],
-                'creation_date': row[5],
-                'streak_broken_date': row[6]
-            }
-
-            # Convert the streak_broken_date from string to datetime object if it's not None.
-            if habit_dict['streak_broken_date']:
-                try:
-                    # Try parsing as full timestamp
-                    streak_broken_date = datetime.strptime(habit_dict['streak_broken_date'], "%Y-%m-%d %H:%M:%S.%f")
-                except ValueError:
-                    # Fall back to date-only format
-                    streak_broken_date = datetime.strptime(habit_dict['streak_broken_date'], "%Y-%m-%d")
-            else:
-                streak_broken_date = None
-            
+        for habit_id, title, description, periodicity, creation_date, streak_broken_date in rows:
             # Create a Habit object using the retrieved details and user object.
+            # Its completion history is loaded lazily, on first access.
             habit_obj = Habit(
-                habit_id=habit_dict['id'], 
-                title=habit_dict['title'], 
-                description=habit_dict['description'],
-                periodicity=habit_dict['periodicity'],
+                habit_id=habit_id,
+                title=title,
+                description=description,
+                periodicity=periodicity,
                 user=user,
-                streak_broken_date=streak_broken_date  # Use the converted datetime object here
+                creation_date=_parse_creation_date(creation_date),
+                streak_broken_date=_parse_streak_broken_date(streak_broken_date)  # Convert to a datetime object.
             )
 
             habits.append(habit_obj)  # Add the Habit object to the list of habits
+
+        # Attach every habit's reminder with one query instead of one per habit.
+        _attach_reminders(cursor, habits)
         
     return habits  # Return the list of Habit objects
 
 
 
 
+# This function retrieves a user's habits together with their completion dates.
+# Habits and completions are loaded with one joined query and grouped in Python,
+# so the cost does not grow with one extra query per habit.
+def get_habits_with_completions(username, user):
+    with with_database_connection() as cursor:
+        Habit = importlib.import_module('models').Habit
+
+        cursor.execute(
+            """SELECT h.id, h.title, h.description, h.periodicity, h.creation_date, h.streak_broken_date, c.completion_day
+               FROM habits h LEFT JOIN completions c ON c.habit_id = h.id
+               WHERE h.username = ?
+               ORDER BY h.id, c.completion_day""",
+            (username,)
+        )
+
+        habits = []
+        habit_obj = None
+        for habit_id, title, description, periodicity, creation_date, streak_broken_date, completion_day in cursor:
+            # Rows arrive grouped by habit; start a new Habit when the ID changes.
+            if habit_obj is None or habit_obj.habit_id != habit_id:
+                habit_obj = Habit(
+                    habit_id=habit_id,
+                    title=title,
+                    description=description,
+                    periodicity=periodicity,
+                    user=user,
+                    creation_date=_parse_creation_date(creation_date),
+                    streak_broken_date=_parse_streak_broken_date(streak_broken_date),
+                    completion_days=array('i')
+                )
+                habits.append(habit_obj)
+
+            # Habits without completions produce a single row with a NULL day.
+            if completion_day is not None:
+                habit_obj.completion_days.append(completion_day)
+
+        _attach_reminders(cursor, habits)
+
+    return habits
+
+
+# This function loads the reminders of many habits with one indexed IN query per chunk of IDs.
+# It returns a dictionary mapping each habit ID that has a reminder to a 'Reminder' object;
+# when a habit has several reminders, the first one added is used.
+def _fetch_reminders(cursor, habit_ids, chunk_size=BULK_CHUNK_SIZE):
+    Reminder = importlib.import_module('models').Reminder
+    reminders = {}
+    habit_ids = iter(habit_ids)
+    while True:
+        chunk = list(islice(habit_ids, chunk_size))
+        if not chunk:
+            return reminders
+        cursor.execute(
+            f"""SELECT habit_id, next_reminder_time, reminder_frequency, next_fire_at FROM reminders
+                WHERE habit_id IN ({', '.join('?' * len(chunk))}) ORDER BY habit_id, id""",
+            chunk
+        )
+        for habit_id, next_reminder_time, reminder_frequency, next_fire_at in cursor.fetchall():
+            if habit_id not in reminders:
+                next_fire = datetime.fromtimestamp(next_fire_at) if next_fire_at else None
+                reminders[habit_id] = Reminder(None, next_reminder_time, reminder_frequency, nextFireAt=next_fire)
+
+
+# This function sets 'reminder_time' on each habit that has a reminder.
+def _attach_reminders(cursor, habits):
+    reminders = _fetch_reminders(cursor, [habit.habit_id for habit in habits])
+    for habit in habits:
+        reminder = reminders.get(habit.habit_id)
+        if reminder is not None:
+            reminder.habit = habit
+        habit.reminder_time = reminder
+
+
+# This function retrieves the reminders of the given habits in one round trip.
+def get_reminders_for_habits(habit_ids):
+    """
+    Parameters:
+    - habit_ids (iterable): IDs of the habits whose reminders are needed.
+
+    Returns:
+    - dict: Habit ID -> Reminder, for the habits that have a reminder.
+    """
+    with with_database_connection() as cursor:
+        return _fetch_reminders(cursor, habit_ids)
+
+
+# This function converts a stored creation_date string into a datetime object, or None if it is missing or unreadable.
+def _parse_creation_date(value):
+    try:
+        return datetime.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+# This function converts a stored streak_broken_date string into a datetime object.
+def _parse_streak_broken_date(value):
+    if not value:
+        return None
+    try:
+        # Try parsing as full timestamp
+        return datetime.strptime(value, "%Y-%m-%d %H:%M:%S.%f")
+    except ValueError:
+        # Fall back to date-only format
+        return datetime.strptime(value, "%Y-%m-%d")
+
+
+# This function converts a completion date to the canonical form stored in the 'completions' table.
+# It accepts None (now), a date, a datetime or an ISO formatted string, and returns the
+# "YYYY-MM-DD HH:MM:SS" timestamp together with the day ordinal (date.toordinal()).
+def canonical_completion(completion_date=None):
+    if completion_date is None:
+        completion_date = datetime.now()
+    elif isinstance(completion_date, str):
+        completion_date = datetime.fromisoformat(completion_date)  # Raises ValueError for malformed dates.
+    elif not isinstance(completion_date, datetime):
+        completion_date = datetime.combine(completion_date, time())
+    return completion_date.strftime("%Y-%m-%d %H:%M:%S"), completion_date.toordinal()
+
+
 # This function marks a habit as complete by recording the completion in the database.
 def mark_habit_complete(habit_id, completion_date=None):
+    # Store the completion in canonical form; without a date the current datetime is used.
+    timestamp, completion_day = canonical_completion(completion_date)
+
     # Establish a database connection and execute a query to record habit completion.
     with with_database_connection() as cursor:
-        if completion_date is None:
-            # Insert a record into the 'completions' table with the current datetime as the completion date.
-            cursor.execute("INSERT INTO completions (habit_id, completion_date) VALUES (?, datetime('now'))", (habit_id,))
-        else:
-            # Insert a record into the 'completions' table with the provided completion date.
-            cursor.execute("INSERT INTO completions (habit_id, completion_date) VALUES (?, ?)", (habit_id, completion_date))
+        cursor.execute("INSERT INTO completions (habit_id, completion_date, completion_day) VALUES (?, ?, ?)",
+                       (habit_id, timestamp, completion_day))
 
+        # Update the habit's streak counters in the same transaction.
+        record_completion(cursor, habit_id, date.fromordinal(completion_day))
 
-        
+        # Look up the owner, so that only their habit caches are told.
+        cursor.execute("SELECT username FROM habits WHERE id=?", (habit_id,))
+        owner = cursor.fetchone()
+
+    if owner is not None:
+        notify_habit_changed(owner[0], habit_id, history_only=True)
+
+
+# This function inserts one chunk of completions that are already in canonical form, and awards their points.
+# It does not commit; callers commit once per chunk, together with any bookkeeping of their own.
+def write_completion_chunk(cursor, rows, points_per_completion=0, owners=None):
+    """
+    Parameters:
+    - cursor (sqlite3.Cursor): Cursor to run the statements on.
+    - rows (list): (habit_id, completion_date, completion_day) tuples, as returned by 'canonical_completion'.
+    - points_per_completion (int): Reward points per completion, recorded as one points ledger
+      entry and one balance UPDATE per user. Use 0 to record completions without points.
+    - owners (dict): habit_id -> username cache shared between chunks; filled as needed.
+    """
+    cursor.executemany(
+        "INSERT INTO completions (habit_id, completion_date, completion_day) VALUES (?, ?, ?)",
+        rows
+    )
+    if not points_per_completion:
+        return
+
+    # Resolve owners for habits not seen in earlier chunks.
+    owners = {} if owners is None else owners
+    unknown = list({row[0] for row in rows if row[0] not in owners})
+    if unknown:
+        placeholders = ", ".join("?" * len(unknown))
+        cursor.execute(f"SELECT id, username FROM habits WHERE id IN ({placeholders})", unknown)
+        owners.update(cursor.fetchall())
 
+    # Aggregate the points per user so each balance is updated once per chunk.
+    points = {}
+    for row in rows:
+        username = owners.get(row[0])
+        if username is not None:
+            points[username] = points.get(username, 0) + points_per_completion
+    # Each user's chunk total is one ledger entry plus one balance update.
+    cursor.executemany("INSERT INTO points_ledger (username, delta, reason) VALUES (?, ?, 'habit completed')",
+                       list(points.items()))
+    cursor.executemany("UPDATE users SET points = points + ? WHERE username = ?",
+                       [(total, username) for username, total in points.items()])
+
+
+# This function brings the habits of one chunk of completions up to date: it rebuilds their
+# streak counters once per habit. It does not commit, so the counters are committed in the same
+# transaction as the chunk's completions. It returns the (habit_id, username) pairs to pass to
+# 'notify_completions_written' once the chunk is committed.
+def rebuild_chunk_streaks(cursor, habit_ids, chunk_size=BULK_CHUNK_SIZE):
+    habit_ids = list(habit_ids)
+    owners = []
+    for start in range(0, len(habit_ids), chunk_size):
+        chunk = habit_ids[start:start + chunk_size]
+        rebuild_streak_counters(cursor, habit_ids=chunk)
+        cursor.execute(f"SELECT id, username FROM habits WHERE id IN ({', '.join('?' * len(chunk))})", chunk)
+        owners.extend(cursor.fetchall())
+    return owners
+
+
+# This function tells the habit caches about completions written in bulk, after they were committed.
+def notify_completions_written(owners):
+    for habit_id, username in owners:
+        notify_habit_changed(username, habit_id, history_only=True)
+
+
+# This function records many habit completions at once, e.g. when backfilling imported history.
+def mark_habits_complete_bulk(records, chunk_size=BULK_CHUNK_SIZE, points_per_completion=10):
+    """
+    Record completions for many habits using chunked 'executemany' transactions.
+
+    Parameters:
+    - records (iterable): (habit_id, completion_date) pairs, with dates as accepted by
+      'canonical_completion' (None means now). The iterable is consumed lazily, one chunk at a time.
+    - chunk_size (int): Number of completions inserted per transaction.
+    - points_per_completion (int): Reward points per completion, recorded as one points ledger
+      entry and one balance UPDATE per user per chunk. Use 0 to record completions without points.
+
+    Returns:
+    - int: The number of completions inserted.
+    """
+    records = iter(records)
+    owners = {}  # habit_id -> username, shared across chunks.
+    inserted = 0
+
+    with with_database_connection() as cursor:
+        while True:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                break
+
+            write_completion_chunk(
+                cursor,
+                [(habit_id, *canonical_completion(completion_date)) for habit_id, completion_date in chunk],
+                points_per_completion, owners
+            )
+            # Rebuild the streak counters once per habit in the chunk rather than once per completion.
+            changed = rebuild_chunk_streaks(cursor, {habit_id for habit_id, _ in chunk}, chunk_size)
+            cursor.connection.commit()  # One transaction per chunk, counters included.
+            notify_completions_written(changed)
+            inserted += len(chunk)
+    return inserted
+
+
+# This function deletes a user's habit by title together with its completions and reminders.
+# It returns the ID of the deleted habit, or None if no such habit exists.
 def delete_habit(username, title):
    
     with with_database_connection() as cursor:
@@ -102,13 +359,16 @@ def delete_habit(username, title):
             
             # Delete the habit's completion records from the 'completions' table.
             cursor.execute("DELETE FROM completions WHERE habit_id=?", (habit_id,))
+            cursor.execute("DELETE FROM reminders WHERE habit_id=?", (habit_id,))
             
             # Delete the habit record from the 'habits' table.
             cursor.execute("DELETE FROM habits WHERE id=?", (habit_id,))
-            print(f"Deleted habit with ID: {habit_id}")
         else:
-            # Print an error message if the specified habit does not exist.
-            print(f"Habit with title {title} does not exist for user {username}.")
+            # The specified habit does not exist.
+            return None
+
+    notify_habit_changed(username, habit_id)
+    return habit_id
 
 
 
@@ -0,0 +1,90 @@
+import threading
+from habit_operations import get_habits, register_habit_listener
+
+# Per-user habit repository.
+#
+# A 'HabitRepository' is an identity map of one user's habits: every habit is loaded
+# once and the same 'Habit' object is handed out until the habit changes. Lookups by
+# ID or title are answered from memory. The repository listens to the write
+# operations in 'habit_operations' and invalidates itself when the user's habits are
+# added, edited or deleted, or resets a habit's completion history when it is completed.
+
+
+class HabitRepository:
+    def __init__(self, user):
+        self.user = user
+        self.username = user.username
+        self._lock = threading.RLock()
+        self._by_id = None  # Habit ID -> Habit, in ID order; None until loaded.
+        self._by_title = {}
+        self._previous = {}  # Habits cached before the last invalidation, reused to keep their identity.
+        register_habit_listener(self, self.username)
+
+    def _load(self):
+        # Load the habits if needed. Habits that were already cached keep their identity.
+        with self._lock:
+            if self._by_id is None:
+                self._store(get_habits(self.username, self.user))
+            return self._by_id
+
+    def _store(self, habits):
+        by_id = {}
+        for habit in habits:
+            cached = self._previous.get(habit.habit_id)
+            if cached is not None:
+                # Refresh the cached object in place instead of replacing it.
+                cached.title = habit.title
+                cached.description = habit.description
+                cached.periodicity = habit.periodicity
+                cached.streak_broken_date = habit.streak_broken_date
+                cached.reminder_time = habit.reminder_time
+                habit = cached
+            by_id[habit.habit_id] = habit
+        self._by_id = by_id
+        self._by_title = {habit.title: habit for habit in by_id.values()}
+        self._previous = {}
+
+    def prime(self, habits):
+        """
+        Fill the repository with habits that were already loaded, e.g. by login hydration.
+        """
+        with self._lock:
+            self._store(habits)
+
+    def all(self):
+        # Return the user's habits in creation order.
+        return list(self._load().values())
+
+    def get(self, habit_id):
+        # Return the habit with the given ID, or None.
+        return self._load().get(habit_id)
+
+    def get_by_title(self, title):
+        # Return the habit with the given title, or None.
+        with self._lock:
+            self._load()
+            return self._by_title.get(title)
+
+    def invalidate(self):
+        # Forget the loaded habit list; it is reloaded on next access, reusing cached objects.
+        with self._lock:
+            if self._by_id is not None:
+                self._previous = self._by_id
+            self._by_id = None
+            self._by_title = {}
+
+    def clear(self):
+        # Drop every cached habit, e.g. when the user's session ends.
+        with self._lock:
+            self._previous = {}
+            self._by_id = None
+            self._by_title = {}
+
+    def habit_changed(self, username, habit_id):
+        # Called by 'habit_operations.notify_habit_changed' after a write.
+        with self._lock:
+            if username is not None:
+                if username == self.username:
+                    self.invalidate()
+            elif self._by_id is not None and habit_id in self._by_id:
+                self._by_id[habit_id].clear_completion_history()
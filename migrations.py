@@ -0,0 +1,296 @@
+# Versioned schema migrations for the Habit Tracker database.
+# The schema version is stored in SQLite's 'PRAGMA user_version', so a database
+# that is already current is recognised with a single read and no DDL at all.
+
+
+def _create_base_tables(cursor):
+    # Version 1: the original tables. 'IF NOT EXISTS' lets this adopt databases
+    # that were created before migrations were introduced.
+    cursor.execute('''CREATE TABLE IF NOT EXISTS users
+                     (username TEXT PRIMARY KEY, password TEXT, points INTEGER DEFAULT 0)''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS habits
+                      (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT, title TEXT, 
+                       description TEXT, periodicity TEXT, creation_date DATETIME, 
+                       streak_broken_date DATETIME DEFAULT NULL)''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS reminders
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT, habit_id INTEGER, next_reminder_time TEXT, 
+                      reminder_frequency TEXT)''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS completions
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT, habit_id INTEGER, completion_date DATETIME)''')
+
+
+def _add_lookup_indexes(cursor):
+    # Version 2: secondary indexes for the hot lookups. The completions index also
+    # covers 'SELECT completion_date ... WHERE habit_id=?' without touching the table.
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_completions_habit_date ON completions (habit_id, completion_date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_habits_username_title ON habits (username, title)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_reminders_habit ON reminders (habit_id)")
+
+
+def _add_streak_counters(cursor):
+    # Version 3: streak counters kept up to date on insert, so reading a streak is O(1).
+    cursor.execute("ALTER TABLE habits ADD COLUMN current_streak INTEGER NOT NULL DEFAULT 0")
+    cursor.execute("ALTER TABLE habits ADD COLUMN longest_streak INTEGER NOT NULL DEFAULT 0")
+    cursor.execute("ALTER TABLE habits ADD COLUMN last_period_index INTEGER DEFAULT NULL")
+
+    # Fill the counters from the existing history, deriving each day from 'completion_date'.
+    _backfill_streak_counters(cursor, _DAY_FROM_TIMESTAMP.format(column="c.completion_date"))
+
+
+# SQL converting a stored completion timestamp to its day ordinal (as in date.toordinal()).
+_DAY_FROM_TIMESTAMP = "CAST(julianday(date({column})) - 1721424.5 AS INTEGER)"
+
+# SQL for the period index of a day ordinal under the habit's periodicity, matching 'streaks.period_index'.
+_PERIOD_OF_DAY = """CASE periodicity
+        WHEN 'daily' THEN {day}
+        WHEN 'weekly' THEN ({day} - 1) / 7
+        WHEN 'monthly' THEN CAST(strftime('%Y', date({day} + 1721424.5)) AS INTEGER) * 12
+                            + CAST(strftime('%m', date({day} + 1721424.5)) AS INTEGER) - 1
+    END"""
+
+# Streak counters per habit with completions, using the "gaps and islands" trick: subtracting
+# ROW_NUMBER() from consecutive period indexes gives a constant per run. The latest run only
+# counts as current while it ended in today's period or the one before it.
+_STREAK_COUNTERS_SQL = f"""
+WITH days AS (
+    SELECT h.id AS habit_id, h.periodicity, {{day}} AS day,
+           CAST(julianday(date('now', 'localtime')) - 1721424.5 AS INTEGER) AS today
+    FROM habits h JOIN completions c ON c.habit_id = h.id
+),
+periods AS (
+    SELECT DISTINCT habit_id, {_PERIOD_OF_DAY.format(day="day")} AS period,
+           {_PERIOD_OF_DAY.format(day="today")} AS today_period
+    FROM days
+),
+islands AS (
+    SELECT habit_id, period, today_period,
+           period - ROW_NUMBER() OVER (PARTITION BY habit_id ORDER BY period) AS island
+    FROM periods
+    WHERE period IS NOT NULL
+),
+runs AS (
+    SELECT habit_id, today_period, MAX(period) AS run_end, COUNT(*) AS length
+    FROM islands
+    GROUP BY habit_id, island
+),
+ranked AS (
+    SELECT habit_id, today_period, length, run_end,
+           ROW_NUMBER() OVER (PARTITION BY habit_id ORDER BY run_end DESC) AS recency,
+           MAX(length) OVER (PARTITION BY habit_id) AS longest
+    FROM runs
+)
+SELECT CASE WHEN run_end >= today_period - 1 THEN length ELSE 0 END, longest, run_end, habit_id
+FROM ranked WHERE recency = 1
+"""
+
+
+def _backfill_streak_counters(cursor, day):
+    # Fill the streak counters of every habit with completions. Spelled out here rather than
+    # calling 'streaks.rebuild_streak_counters', so later changes to the live code cannot change
+    # what versions 3 and 4 did. 'day' is the SQL for the day ordinal of completion 'c'.
+    cursor.execute(_STREAK_COUNTERS_SQL.format(day=day))
+    cursor.executemany("UPDATE habits SET current_streak = ?, longest_streak = ?, last_period_index = ? WHERE id = ?",
+                       cursor.fetchall())
+
+
+def _canonical_completion_dates(cursor):
+    # Version 4: canonical completion dates.
+    # Rows written as "YYYY-MM-DD", "YYYY-MM-DD HH:MM:SS" or with microseconds are rewritten
+    # to "YYYY-MM-DD HH:MM:SS", and an integer 'completion_day' ordinal is stored alongside,
+    # so readers compare integers instead of parsing strings.
+    cursor.execute("ALTER TABLE completions ADD COLUMN completion_day INTEGER")
+    cursor.execute(f"""UPDATE completions
+                       SET completion_date = COALESCE(datetime(completion_date), completion_date),
+                           completion_day = {_DAY_FROM_TIMESTAMP.format(column="completion_date")}""")
+    cursor.execute("DROP INDEX IF EXISTS idx_completions_habit_date")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_completions_habit_day ON completions (habit_id, completion_day)")
+
+    # Rows inserted without a day (e.g. by hand or by older scripts) are normalized on insert.
+    cursor.execute(f"""CREATE TRIGGER IF NOT EXISTS completions_fill_day
+                       AFTER INSERT ON completions WHEN NEW.completion_day IS NULL
+                       BEGIN
+                           UPDATE completions
+                           SET completion_date = COALESCE(datetime(NEW.completion_date), NEW.completion_date),
+                               completion_day = {_DAY_FROM_TIMESTAMP.format(column="NEW.completion_date")}
+                           WHERE id = NEW.id;
+                       END""")
+
+    # Refill the streak counters from the canonical days.
+    _backfill_streak_counters(cursor, "c.completion_day")
+
+
+def _add_points_ledger(cursor):
+    # Version 5: a ledger of every points change; 'users.points' becomes a cached balance.
+    cursor.execute('''CREATE TABLE IF NOT EXISTS points_ledger
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT NOT NULL, delta INTEGER NOT NULL,
+                      reason TEXT, created_at TEXT DEFAULT (datetime('now')))''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_points_ledger_username ON points_ledger (username)")
+
+    # Existing balances become opening entries, so balances stay derivable from the ledger.
+    cursor.execute("""INSERT INTO points_ledger (username, delta, reason)
+                      SELECT username, points, 'opening balance' FROM users WHERE points != 0""")
+
+
+def _add_user_ids(cursor):
+    # Version 6: give users a stable integer ID. The table is rebuilt because SQLite cannot
+    # add a primary key column in place; existing users keep their current rowid as ID.
+    cursor.execute('''CREATE TABLE users_new
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT NOT NULL UNIQUE,
+                      password TEXT, points INTEGER DEFAULT 0)''')
+    cursor.execute("""INSERT INTO users_new (id, username, password, points)
+                      SELECT rowid, username, password, points FROM users ORDER BY rowid""")
+    cursor.execute("DROP TABLE users")
+    cursor.execute("ALTER TABLE users_new RENAME TO users")
+
+
+def _add_reminder_schedule(cursor):
+    # Version 7: the absolute time (Unix seconds) each reminder fires next. NULL means not yet
+    # scheduled; 'reminder_scheduler' fills it in. The index lets the scheduler page in one window.
+    cursor.execute("ALTER TABLE reminders ADD COLUMN next_fire_at INTEGER")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_reminders_next_fire_at ON reminders (next_fire_at)")
+
+
+def _add_import_checkpoints(cursor):
+    # Version 8: how far each import file has been loaded, so an interrupted import can resume.
+    cursor.execute('''CREATE TABLE IF NOT EXISTS import_checkpoints
+                     (source TEXT PRIMARY KEY, byte_offset INTEGER NOT NULL, records INTEGER NOT NULL,
+                      updated_at TEXT DEFAULT (datetime('now')))''')
+
+
+# SQL for the week and month period indexes of a day ordinal, matching 'streaks.period_index'.
+# Migration 9 depends on them, so they must not change; live code keeps its own copy.
+_WEEK_OF_DAY = "({day} - 1) / 7"
+_MONTH_OF_DAY = ("CAST(strftime('%Y', date({day} + 1721424.5)) AS INTEGER) * 12"
+                 " + CAST(strftime('%m', date({day} + 1721424.5)) AS INTEGER) - 1")
+
+
+def _add_completion_rollups(cursor):
+    # Version 9: completions counted per habit per day, ISO week and month ('grain' is the
+    # periodicity name). Triggers keep the counts current as completions are added, changed
+    # or deleted; rows whose count drops to zero are removed.
+    cursor.execute('''CREATE TABLE IF NOT EXISTS completion_rollups
+                     (habit_id INTEGER NOT NULL, grain TEXT NOT NULL, period INTEGER NOT NULL,
+                      completions INTEGER NOT NULL, PRIMARY KEY (habit_id, grain, period)) WITHOUT ROWID''')
+
+    def add(row):
+        day = f"{row}.completion_day"
+        return f"""INSERT INTO completion_rollups (habit_id, grain, period, completions) VALUES
+                       ({row}.habit_id, 'daily', {day}, 1),
+                       ({row}.habit_id, 'weekly', {_WEEK_OF_DAY.format(day=day)}, 1),
+                       ({row}.habit_id, 'monthly', {_MONTH_OF_DAY.format(day=day)}, 1)
+                   ON CONFLICT (habit_id, grain, period) DO UPDATE SET completions = completions + 1;"""
+
+    def remove(row):
+        day = f"{row}.completion_day"
+        return f"""UPDATE completion_rollups SET completions = completions - 1
+                   WHERE habit_id = {row}.habit_id AND (
+                       (grain = 'daily' AND period = {day})
+                       OR (grain = 'weekly' AND period = {_WEEK_OF_DAY.format(day=day)})
+                       OR (grain = 'monthly' AND period = {_MONTH_OF_DAY.format(day=day)}));
+                   DELETE FROM completion_rollups WHERE habit_id = {row}.habit_id AND completions <= 0;"""
+
+    # Rows inserted without a day are counted once 'completions_fill_day' sets it (an UPDATE).
+    cursor.execute(f"""CREATE TRIGGER IF NOT EXISTS completions_rollup_insert
+                       AFTER INSERT ON completions WHEN NEW.completion_day IS NOT NULL
+                       BEGIN {add("NEW")} END""")
+    cursor.execute(f"""CREATE TRIGGER IF NOT EXISTS completions_rollup_delete
+                       AFTER DELETE ON completions WHEN OLD.completion_day IS NOT NULL
+                       BEGIN {remove("OLD")} END""")
+    cursor.execute(f"""CREATE TRIGGER IF NOT EXISTS completions_rollup_update_old
+                       AFTER UPDATE OF habit_id, completion_day ON completions WHEN OLD.completion_day IS NOT NULL
+                       BEGIN {remove("OLD")} END""")
+    cursor.execute(f"""CREATE TRIGGER IF NOT EXISTS completions_rollup_update_new
+                       AFTER UPDATE OF habit_id, completion_day ON completions WHEN NEW.completion_day IS NOT NULL
+                       BEGIN {add("NEW")} END""")
+
+    # Count the existing history. Spelled out here rather than calling 'rollups.rebuild_rollups',
+    # so later changes to the live code cannot change what this migration did.
+    for grain, period in (("daily", "completion_day"),
+                          ("weekly", _WEEK_OF_DAY.format(day="completion_day")),
+                          ("monthly", _MONTH_OF_DAY.format(day="completion_day"))):
+        cursor.execute(f"""INSERT OR REPLACE INTO completion_rollups (habit_id, grain, period, completions)
+                           SELECT habit_id, '{grain}', {period} AS period, COUNT(*)
+                           FROM completions WHERE completion_day IS NOT NULL
+                           GROUP BY habit_id, period""")
+
+
+def _add_completion_calendars(cursor):
+    # Version 10: completion bitmaps, one BLOB per habit and calendar year (see 'calendars').
+    # They are built from the completions when first read; triggers drop a habit's bitmap
+    # for a year whenever its completions in that year change, so it is rebuilt next time.
+    cursor.execute('''CREATE TABLE IF NOT EXISTS completion_calendars
+                     (habit_id INTEGER NOT NULL, year INTEGER NOT NULL, days BLOB NOT NULL,
+                      PRIMARY KEY (habit_id, year)) WITHOUT ROWID''')
+
+    def invalidate(row):
+        return f"""DELETE FROM completion_calendars WHERE habit_id = {row}.habit_id
+                   AND year = CAST(strftime('%Y', date({row}.completion_day + 1721424.5)) AS INTEGER);"""
+
+    cursor.execute(f"""CREATE TRIGGER IF NOT EXISTS completions_calendar_insert
+                       AFTER INSERT ON completions WHEN NEW.completion_day IS NOT NULL
+                       BEGIN {invalidate("NEW")} END""")
+    cursor.execute(f"""CREATE TRIGGER IF NOT EXISTS completions_calendar_delete
+                       AFTER DELETE ON completions WHEN OLD.completion_day IS NOT NULL
+                       BEGIN {invalidate("OLD")} END""")
+    cursor.execute(f"""CREATE TRIGGER IF NOT EXISTS completions_calendar_update
+                       AFTER UPDATE OF habit_id, completion_day ON completions
+                       BEGIN {invalidate("OLD")} {invalidate("NEW")} END""")
+    cursor.execute("""CREATE TRIGGER IF NOT EXISTS habits_calendar_delete AFTER DELETE ON habits
+                      BEGIN DELETE FROM completion_calendars WHERE habit_id = OLD.id; END""")
+
+
+# Ordered list of (version, migration) pairs. Append new migrations; never edit applied ones.
+MIGRATIONS = [
+    (1, _create_base_tables),
+    (2, _add_lookup_indexes),
+    (3, _add_streak_counters),
+    (4, _canonical_completion_dates),
+    (5, _add_points_ledger),
+    (6, _add_user_ids),
+    (7, _add_reminder_schedule),
+    (8, _add_import_checkpoints),
+    (9, _add_completion_rollups),
+    (10, _add_completion_calendars),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(cursor):
+    # Read the schema version recorded in the database header.
+    cursor.execute("PRAGMA user_version")
+    return cursor.fetchone()[0]
+
+
+def migrate(cursor):
+    """
+    Bring the database schema up to 'LATEST_VERSION', applying pending migrations in order.
+
+    All pending migrations run in one 'BEGIN IMMEDIATE' transaction, so concurrent
+    processes starting at the same time cannot apply the same migration twice.
+
+    Parameters:
+    - cursor (sqlite3.Cursor): A cursor on a connection with no open transaction.
+
+    Returns:
+    - int: The schema version after migrating.
+    """
+    version = get_schema_version(cursor)
+    if version >= LATEST_VERSION:
+        return version
+
+    connection = cursor.connection
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        # Re-read under the write lock in case another process migrated first.
+        version = get_schema_version(cursor)
+        for target, migration in MIGRATIONS:
+            if target > version:
+                migration(cursor)
+                cursor.execute(f"PRAGMA user_version = {target}")
+                version = target
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    return version
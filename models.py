@@ -1,8 +1,20 @@
+import secrets
+import threading
+import time
+from collections import OrderedDict
 from sqlite3 import OperationalError
-from datetime import datetime, timedelta
+from array import array
+from datetime import date, datetime
 from database_operations import with_database_connection
-from habit_operations import add_habit, get_habits, mark_habit_complete, delete_habit, habit_exists_for_user
-from user_operations import register_user, verify_user
+from habit_operations import add_habit, get_habits, get_habits_with_completions, mark_habit_complete, delete_habit, habit_exists_for_user, notify_habit_changed, get_reminders_for_habits
+from habit_repository import HabitRepository
+from user_operations import register_user, load_user
+from streaks import PERIODICITIES, get_streak_counters, period_index, summarize_streaks
+from vectorized_analytics import VectorizedAnalytics
+from points_ledger import points_ledger
+from reminder_scheduler import first_fire_time, advance_fire_time
+from rollups import completion_rates, best_week, completion_trend, period_start
+from calendars import load_calendar
 
 
 # The 'User' class represents a user of the Habit Tracker application.
@@ -12,29 +24,48 @@ class User:
         self.username = username
         self.password = password
         self.user_id = user_id
-        self.reward = Reward(username)  # Initialize a reward instance for the user.
-        
+        self._reward = None  # The reward instance is loaded on first use (or by login).
+        self.broken_streaks = []  # Habits whose streak was found broken at the last login.
+        self.habits = HabitRepository(self)  # In-memory identity map of the user's habits.
+
+    @property
+    def reward(self):
+        # Get the user's reward instance, loading the points from the database on first access.
+        if self._reward is None:
+            self._reward = Reward(self.username)
+        return self._reward
+
+    @reward.setter
+    def reward(self, reward):
+        self._reward = reward
+
     def get_user_id(self):
         # Get the user's ID.
         return self.user_id
 
     def register(self):
         # Register the user by calling the 'register_user' function with the user's credentials.
-        return register_user(self.username, self.password)
+        if not register_user(self.username, self.password):
+            return False
+        self.user_id = load_user(self.username, self.password)[0]
+        return True
 
     def login(self):
         # Log in the user by verifying their credentials and initializing habits, rewards and a check for broken streaks
-        is_verified = verify_user(self.username, self.password)
-        if is_verified:
-            self.reward = Reward(self.username)  # Initialize the user's reward instance.
-            self.reward.points_manager = Reward(self.username)  # Set up reward points manager.
-            
-            # Fetch user's habits, populate completion dates, and check for broken streaks.
-            habits = get_habits(self.username, self)
-            for habit in habits:
-                habit.populate_completion_dates()
-                habit.breakStreak()
-        return is_verified
+        user_row = load_user(self.username, self.password)
+        if user_row is None:
+            return False
+
+        # Initialize the user's ID and reward instance from the user row, including points not yet written.
+        self.user_id = user_row[0]
+        self.reward = Reward(self.username, points=user_row[2] + points_ledger.pending_points(self.username))
+        self.reward.points_manager = self.reward  # Set up reward points manager.
+
+        # Fetch user's habits with their completion dates in one query, cache them, and check for broken streaks.
+        habits = get_habits_with_completions(self.username, self)
+        self.habits.prime(habits)
+        self.broken_streaks = [habit for habit in habits if habit.breakStreak()]
+        return True
     
     def _setup_user_rewards_and_habits(self):
         # Set up the user's rewards and habits
@@ -48,73 +79,208 @@ class User:
         # Check if a habit with the given title exists for the user.
         return habit_exists_for_user(self.username, title)
 
-    def addHabit(self, title, description, periodicity):
+    def addHabit(self, title, description, periodicity, reminder=None):
         # Add a new habit for the user, if it doesn't already exist.
         if self.habit_exists(title):
             print(f"The habit titled '{title}' already exists!")
         else:
-            add_habit(self.username, title, description, periodicity)
+            add_habit(self.username, title, description, periodicity, reminder)
     
     def removeHabit(self, title):
-        # Remove a habit with the given title from the user's account.
-        delete_habit(self.username, title)
+        # Remove a habit with the given title from the user's account. Returns the deleted habit's ID, or None.
+        return delete_habit(self.username, title)
 
     def getHabits(self):
-        # Get a list of habits associated with the user.
-        return get_habits(self.username, self)
+        # Get a list of habits associated with the user, served from the habit repository.
+        return self.habits.all()
     
     def get_reward(self):
         # Add 10 points to the user's reward points.
         self.reward.add_points(10)
         
     def get_habit_by_title(self, title):
-        # Fetch the user's habits
-        habits = self.getHabits()
+        # Look up the habit by title in the habit repository.
+        return self.habits.get_by_title(title)
 
-        # Search through the habits for the specified title
-        for habit in habits:
-            if habit.title == title:
-                return habit
-        return None
+    def release_caches(self):
+        # Drop the cached habits and reward; both are reloaded from the database on next use.
+        self.habits.clear()
+        self._reward = None
 
 
 # The 'SessionManager' class is responsible for managing active user sessions within the Habit Tracker application.
+# Sessions are keyed by user ID and can also be looked up by an opaque token, which is how the HTTP
+# server identifies its clients. Sessions idle for longer than 'idle_ttl' seconds expire, and once
+# 'max_sessions' users are active the least recently used session is evicted. Every session that
+# ends, expires or is evicted is passed to the eviction hooks, which by default drop the user's
+# cached habits and reward so that long-running servers do not grow without bound.
+DEFAULT_SESSION_TTL = 30 * 60
+DEFAULT_MAX_SESSIONS = 10000
+
+
 class SessionManager:
-    def __init__(self):
-        # Initialize an empty dictionary to store active user sessions.
-        self.active_sessions = {}
+    def __init__(self, idle_ttl=DEFAULT_SESSION_TTL, max_sessions=DEFAULT_MAX_SESSIONS, clock=time.monotonic):
+        """
+        Parameters:
+        - idle_ttl (float): Seconds without activity after which a session expires; None to never expire.
+        - max_sessions (int): Maximum number of active sessions; None for no limit.
+        - clock (callable): Source of the current time in seconds.
+        """
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self.clock = clock
+        self.active_sessions = OrderedDict()  # User ID -> user, least recently used first.
+        self.tokens = {}  # Token -> user ID.
+        self._last_seen = {}  # User ID -> time of the session's last use.
+        self._user_tokens = {}  # User ID -> set of the session's tokens.
+        self._eviction_hooks = [User.release_caches]
+        self._lock = threading.Lock()
+
+    def add_eviction_hook(self, hook):
+        # Register hook(user) to be called whenever a session is removed.
+        self._eviction_hooks.append(hook)
+
+    def _remove(self, user_id):
+        # Remove a session from every index. Must be called with the lock held; returns the user.
+        user = self.active_sessions.pop(user_id)
+        del self._last_seen[user_id]
+        for token in self._user_tokens.pop(user_id, ()):
+            del self.tokens[token]
+        return user
+
+    def _expire(self, now):
+        # Remove sessions idle for longer than the TTL. Must be called with the lock held.
+        expired = []
+        if self.idle_ttl is not None:
+            # The least recently used sessions come first, so stop at the first live one.
+            for user_id in list(self.active_sessions):
+                if now - self._last_seen[user_id] <= self.idle_ttl:
+                    break
+                expired.append(self._remove(user_id))
+        return expired
+
+    def _evict(self, users):
+        # Run the eviction hooks outside the lock; they may touch the database.
+        for user in users:
+            for hook in self._eviction_hooks:
+                hook(user)
+
+    def _touch(self, user_id):
+        # Look up a live session and mark it as used. Returns (user, evicted users).
+        now = self.clock()
+        with self._lock:
+            evicted = self._expire(now)
+            user = self.active_sessions.get(user_id)
+            if user is not None:
+                self.active_sessions.move_to_end(user_id)
+                self._last_seen[user_id] = now
+        return user, evicted
 
     def start_session(self, user):
         # Start a session for the provided user by associating their user ID with the user object.
+        # Returns a new token that identifies the session.
         user_id = user.get_user_id()
-        self.active_sessions[user_id] = user
+        if user_id is None:
+            raise ValueError(f"User {user.username} has no user ID; log in or register first.")
+        token = secrets.token_urlsafe(32)
+        now = self.clock()
+        with self._lock:
+            evicted = self._expire(now)
+            previous = self.active_sessions.get(user_id)
+            if previous is not None and previous is not user:
+                # A new login replaces the user's previous session object, but keeps its tokens.
+                evicted.append(previous)
+            self.active_sessions[user_id] = user
+            self.active_sessions.move_to_end(user_id)
+            self._last_seen[user_id] = now
+            self._user_tokens.setdefault(user_id, set()).add(token)
+            self.tokens[token] = user_id
+            # Evict the least recently used sessions beyond the capacity limit.
+            while self.max_sessions is not None and len(self.active_sessions) > self.max_sessions:
+                evicted.append(self._remove(next(iter(self.active_sessions))))
+        self._evict(evicted)
+        return token
 
     def end_session(self, user):
-        # End the session for the provided user by removing their user ID from the active sessions.
+        # End the session for the provided user by removing their user ID and tokens from the active sessions.
         user_id = user.get_user_id()
-        if user_id in self.active_sessions:
-            del self.active_sessions[user_id]
+        with self._lock:
+            if self.active_sessions.get(user_id) is not user:
+                return
+            self._remove(user_id)
+        self._evict([user])
+
+    def end_session_for_token(self, token):
+        # End the session identified by the token. Returns the session's user, or None.
+        user = self.get_user_for_token(token)
+        if user is not None:
+            self.end_session(user)
+        return user
 
     def get_active_user(self, user_id):
         # Get the active user associated with the provided user ID from the active sessions.
-        return self.active_sessions.get(user_id)
+        user, evicted = self._touch(user_id)
+        self._evict(evicted)
+        return user
+
+    def get_user_for_token(self, token):
+        # Get the user whose session is identified by the token, or None.
+        user_id = self.tokens.get(token)
+        return self.get_active_user(user_id) if user_id is not None else None
+
+    def expire_sessions(self):
+        # Remove every expired session now instead of on the next access. Returns how many were removed.
+        with self._lock:
+            expired = self._expire(self.clock())
+        self._evict(expired)
+        return len(expired)
+
+    def __len__(self):
+        return len(self.active_sessions)
 
         
 # The 'Habit' class represents a habit in the Habit Tracker application.
 class Habit:
-    def __init__(self, habit_id, title, description, periodicity, user, reminder_time=None, streak_broken_date=None):
-        # Initialize habit properties: habit ID, title, description, periodicity, creation date,
-        # completion dates, user, optional reminder time, and streak_broken_date.
+    # Habits are held in large numbers by long-running processes, so instances use
+    # __slots__ instead of a per-instance dict, and keep their completion history
+    # as a compact array of day ordinals that is only loaded when first needed.
+    __slots__ = ("habit_id", "title", "description", "periodicity", "creation_date", "user",
+                 "reminder_time", "streak_broken_date", "_completion_days")
+
+    def __init__(self, habit_id, title, description, periodicity, user, reminder_time=None, streak_broken_date=None,
+                 completion_days=None, creation_date=None):
+        # Initialize habit properties: habit ID, title, description, periodicity, user, optional reminder time,
+        # streak_broken_date, optionally preloaded completion days, and the stored creation date (now for new habits).
         self.habit_id = habit_id
         self.title = title
         self.description = description
         self.periodicity = periodicity
-        self.creation_date = datetime.now()
-        self.completion_dates = []
+        self.creation_date = creation_date or datetime.now()
         self.user = user
         self.reminder_time = reminder_time  # Optional reminder time property.
         self.streak_broken_date = streak_broken_date  # Streak broken date
-        
+        self._completion_days = completion_days  # array('i') of day ordinals, or None until loaded.
+
+    @property
+    def completion_days(self):
+        # The completion history as day ordinals (date.toordinal()), loaded from the database on first access.
+        if self._completion_days is None:
+            self.populate_completion_dates()
+        return self._completion_days
+
+    @property
+    def completion_dates(self):
+        # The completion history as date objects, built from the stored day ordinals.
+        return [date.fromordinal(day) for day in self.completion_days]
+
+    @completion_dates.setter
+    def completion_dates(self, dates):
+        self._completion_days = array('i', (day.toordinal() for day in dates))
+
+    def clear_completion_history(self):
+        # Forget the loaded completion history; it is reloaded on next access.
+        self._completion_days = None
+
     
     def save(self):
         # Save or update the habit's details in the database.
@@ -132,6 +298,9 @@ class Habit:
                     "UPDATE habits SET title = ?, description = ?, periodicity = ? WHERE id = ?",
                     (self.title, self.description, self.periodicity, self.habit_id)
                 )
+
+        # Let cached copies of the user's habits know about the change.
+        notify_habit_changed(getattr(self.user, "username", self.user), self.habit_id)
     
     def edit(self, new_title=None, new_description=None, new_periodicity=None):
         """Edit habit details"""
@@ -149,74 +318,55 @@ class Habit:
 
     
     def getStreak(self):
-        # Calculate and return the streak of completed days for the habit.
-        with with_database_connection() as cursor:
-            # Retrieve completion dates for the habit from the database.
-            cursor.execute("SELECT DISTINCT date(completion_date) FROM completions WHERE habit_id=?", (self.habit_id,))
-            completion_dates = [datetime.strptime(date[0], '%Y-%m-%d').date() for date in cursor.fetchall()]
-
-            # If there are no completion dates, the streak is zero.
-            if not completion_dates:
-                return 0
-
-            # Sort completion dates in descending order and get today's date.
-            sorted_dates = sorted(completion_dates, reverse=True)
-            today = datetime.today().date()
-
-            # Determine the time period based on the habit's periodicity.
-            if self.periodicity == "daily":
-                delta = timedelta(days=1)
-            elif self.periodicity == "weekly":
-                delta = timedelta(weeks=1)
-            elif self.periodicity == "monthly":
-                delta = timedelta(days=30)
-            else:
-                raise ValueError(f"Unsupported periodicity: {self.periodicity}")
-            
-            streak = 1  # Initialize streak counter.
-            # Calculate the streak by comparing completion dates.
-            for i in range(len(sorted_dates) - 1):
-                date_difference = sorted_dates[i] - sorted_dates[i + 1]
-                if date_difference == delta:
-                    streak += 1
-                elif date_difference > delta:
-                    break  # If the streak is broken, stop counting.
-            return streak  # Return the calculated streak.
+        # Return the habit's current streak from the counters kept on the habits table.
+        if self.periodicity not in PERIODICITIES:
+            raise ValueError(f"Unsupported periodicity: {self.periodicity}")
+        current, _ = get_streak_counters([self.habit_id]).get(self.habit_id, (0, 0))
+        return current
 
     
+    def getStreakSummary(self):
+        # Compute the current and longest streaks and the run boundaries in one pass over the completion dates.
+        return summarize_streaks(self.completion_dates, self.periodicity, habit_id=self.habit_id)
+
+    def getLongestStreak(self):
+        # Return the longest streak in the habit's history.
+        summary = self.getStreakSummary()
+        return summary.longest if summary else 0
+
+    def getCalendar(self, first_year=None, last_year=None):
+        # The habit's completions as a bitmap calendar (see 'calendars'), by default over every year with a completion.
+        return load_calendar(self.habit_id, self.periodicity, first_year, last_year)
+
     def populate_completion_dates(self):
-        # Retrieve and populate completion dates for the habit from the database.
+        # Retrieve and populate completion dates for the habit from the database, oldest first.
         with with_database_connection() as cursor:
-            cursor.execute("SELECT completion_date FROM completions WHERE habit_id=?", (self.habit_id,))
-            # Convert completion dates to datetime objects and store in the habit's completion_dates list.
-            self.completion_dates = [datetime.strptime(date[0], '%Y-%m-%d').date() for date in cursor.fetchall()]
+            cursor.execute("SELECT completion_day FROM completions WHERE habit_id=? AND completion_day IS NOT NULL "
+                           "ORDER BY completion_day", (self.habit_id,))
+            # Keep the stored day ordinals as a compact integer array.
+            self._completion_days = array('i', (row[0] for row in cursor))
 
             
     def markComplete(self):
         # Mark the habit as complete and perform related actions.
-        with with_database_connection() as cursor:
-            # Insert a new completion record into the database.
-            cursor.execute("INSERT INTO completions (habit_id, completion_date) VALUES (?, datetime('now'))", (self.habit_id,))
-            # Add points to the user's reward and notify completion.
-            self.user.add_points(10)
-            print("Habit completed! +10 points")
-            # Trigger the reward system for the habit completion.
-            self.user.reward.reward_for_habit_completion(self)
+        # Insert a new completion record and update the streak counters.
+        mark_habit_complete(self.habit_id)
+        # Award the completion points once, through the user's reward system.
+        self.user.reward.reward_for_habit_completion(self)
+        print("Habit completed! +10 points")
 
     
     def breakStreak(self):
-        latest_completion = max(self.completion_dates)
+        # Mark the streak broken and deduct points if a period was missed.
+        # Returns True if the streak was broken by this call.
+        # A habit that has never been completed has no streak to break.
+        if not self.completion_days:
+            return False
+        latest_completion = date.fromordinal(max(self.completion_days))
         today = datetime.today().date()
 
-        # Determine the time period based on the habit's periodicity.
-        if self.periodicity == "daily":
-            delta = timedelta(days=1)
-        elif self.periodicity == "weekly":
-            delta = timedelta(days=7)
-        elif self.periodicity == "monthly":
-            delta = timedelta(days=30)
-        else:
-            raise ValueError(f"Unsupported periodicity: {self.periodicity}")
+        # Count the calendar periods (days, ISO weeks or months) since the latest completion.
+        missed_periods = period_index(today, self.periodicity) - period_index(latest_completion, self.periodicity)
 
         # Check if the streak was already marked broken for today.
         today_date = datetime.today().date()
@@ -234,47 +384,63 @@ class Habit:
                 raise TypeError("Unexpected type for streak_broken_date")
 
             if streak_broken_datetime.date() == today_date:
-                return
-
-        # Check if the streak is broken.
-        if (today - latest_completion) > delta:
-            # Update the streak broken date in the database and the Habit instance.
+                return False
+
+        # The streak is broken when neither this period nor the previous one has a completion.
+        if missed_periods > 1:
+            # Update the streak broken date in the database and the Habit instance, unless the
+            # streak was marked broken today in the meantime (e.g. by 'streak_sweeper') or a
+            # completion in this or the previous period was recorded since the history was loaded.
+            # This is the check 'streak_sweeper' makes, so only one of them deducts the points.
             now = datetime.now()
+            cutoff = period_start(period_index(today, self.periodicity) - 1, self.periodicity).toordinal()
             with with_database_connection() as cursor:
-                cursor.execute("UPDATE habits SET streak_broken_date = ? WHERE id = ?", (now, self.habit_id))
+                cursor.execute("""UPDATE habits SET streak_broken_date = ?, current_streak = 0
+                                  WHERE id = ? AND (streak_broken_date IS NULL OR date(streak_broken_date) < ?)
+                                    AND (SELECT MAX(completion_day) FROM completions WHERE habit_id = habits.id) < ?""",
+                               (now, self.habit_id, today_date.isoformat(), cutoff))
+                marked = cursor.rowcount == 1
+            if not marked:
+                return False
             self.streak_broken_date = now
 
             # Deduct points for breaking the streak.
-            self.user.reward.add_points(-10)
-            print("Streak broken! -10 points")
+            self.user.reward.add_points(-10, "streak broken")
+            return True
+        return False
                 
             
     def delete_habit_by_id(self, habit_id):
         # Delete a habit from the database by its ID.
         with with_database_connection() as cursor:
             cursor.execute("DELETE FROM habits WHERE id = ?", (habit_id,))
+        notify_habit_changed(getattr(self.user, "username", self.user), habit_id)
 
     
     
 # The 'Reminder' class represents a reminder for a specific habit
 class Reminder:
-    def __init__(self, habit=None, nextReminderTime=None, reminderFrequency=None):
-        # Initialize reminder properties: associated habit, next reminder time, and reminder frequency.
+    def __init__(self, habit=None, nextReminderTime=None, reminderFrequency=None, nextFireAt=None):
+        # Initialize reminder properties: associated habit, next reminder time (a time of day such as "13:00"),
+        # reminder frequency, and the datetime the reminder fires next, if known.
         self.habit = habit
         self.nextReminderTime = nextReminderTime
         self.reminderFrequency = reminderFrequency
+        self.nextFireAt = nextFireAt
 
     @classmethod
     def get_reminders_for_habit(cls, habit_id):
-        # Retrieve reminder time for a habit from the database based on its ID.
-        with with_database_connection() as cursor:
-            cursor.execute("SELECT next_reminder_time FROM reminders WHERE id=?", (habit_id,))
-            result = cursor.fetchall()
-            return result[0] if result else None
+        # Retrieve the reminder of a habit from the database based on the habit's ID, or None.
+        return get_reminders_for_habits([habit_id]).get(habit_id)
 
     def resetReminder(self):
-        # Reset the reminder's next reminder time based on its frequency.
-        self.nextReminderTime += timedelta(days=self.reminderFrequency)
+        # Move the reminder on to its next fire time after it fired, based on its frequency
+        # ("daily", "weekly", "monthly" or a number of days).
+        if self.nextFireAt is None:
+            self.nextFireAt = first_fire_time(self.nextReminderTime, datetime.now())
+        else:
+            self.nextFireAt = advance_fire_time(self.nextFireAt, self.reminderFrequency)
+        return self.nextFireAt
         
     @staticmethod
     def add_reminder(habit_id, next_reminder_time, reminder_frequency):
@@ -287,9 +453,13 @@ class Reminder:
 
 # The 'Analytics' class provides methods to analyze and retrieve insights from the user's habits
 class Analytics:
-    def __init__(self, habits):
+    def __init__(self, habits, backend="python"):
         # Initialize the class with a list of user habits for analysis.
+        # backend="numpy" computes streaks from the raw completions with the
+        # vectorized backend (see 'vectorized_analytics'); it requires NumPy.
         self.habits = habits
+        self.backend = backend
+        self._summaries = None  # Habit ID -> StreakSummary, filled by getStreakSummaries().
 
     def getAllHabits(self):
         # Return a list of all user habits for analysis.
@@ -299,10 +469,25 @@ class Analytics:
         # Return a list of user habits filtered by the specified periodicity.
         return [habit for habit in self.habits if habit.periodicity == periodicity]
 
+    def _vectorized(self):
+        # Vectorized analytics over the habits being analysed.
+        return VectorizedAnalytics.for_habits(habit.habit_id for habit in self.habits)
+
+    def getStreakSummaries(self):
+        # Compute every habit's streak summary once; later metrics reuse the cached results.
+        if self._summaries is None:
+            self._summaries = {habit.habit_id: habit.getStreakSummary() for habit in self.habits}
+        return self._summaries
+
     def getLongestStreakAllHabits(self):
-        # Retrieve the longest streak across all user habits.
-        with with_database_connection() as cursor:
-            return max([habit.getStreak() for habit in self.habits], default=0)
+        # Retrieve the longest streak ever achieved across all user habits.
+        if self.backend == "numpy":
+            return int(self._vectorized().streaks()["longest"].max(initial=0))
+        if self._summaries is not None:
+            return max([summary.longest for summary in self._summaries.values() if summary], default=0)
+        # Without computed summaries, the counters stored on the habits table are used.
+        counters = get_streak_counters(habit.habit_id for habit in self.habits)
+        return max([longest for _, longest in counters.values()], default=0)
 
     def getLongestStreakForHabit(self, user, habit_title):
         """
@@ -315,14 +500,56 @@ class Analytics:
         Returns:
         - int: The longest streak for the habit.
         """
-        # Get the habit object based on the habit title.
-        habit = user.get_habit_by_title(habit_title)
+        # Get the habit object based on the habit title, preferring the habits already being analysed.
+        habit = next((habit for habit in self.habits if habit.title == habit_title), None)
+        if habit is None:
+            habit = user.get_habit_by_title(habit_title)
         if habit:
-            return habit.getStreak()
+            if self._summaries is not None and habit.habit_id in self._summaries:
+                summary = self._summaries[habit.habit_id]
+                return summary.longest if summary else 0
+            return habit.getLongestStreak()
         else:
             print(f"Habit with title '{habit_title}' not found for user '{user.username}'.")
             return None
 
+    def getSummary(self):
+        """
+        Summarize the habits being analysed in one JSON-friendly dictionary.
+
+        Returns:
+        - dict: Habit counts per periodicity, and the longest streak overall and per habit title.
+        """
+        summaries = self.getStreakSummaries()
+        longest_by_habit = {habit.title: (summaries[habit.habit_id].longest if summaries[habit.habit_id] else 0)
+                            for habit in self.habits}
+        return {
+            "total_habits": len(self.habits),
+            "daily": len(self.getHabitsByPeriodicity("daily")),
+            "weekly": len(self.getHabitsByPeriodicity("weekly")),
+            "monthly": len(self.getHabitsByPeriodicity("monthly")),
+            "longest_streak": self.getLongestStreakAllHabits(),
+            "longest_streak_by_habit": longest_by_habit,
+        }
+
+    def getCompletionRates(self, days=30):
+        # Share of each habit's periods in the last 'days' days with a completion, keyed by habit title.
+        # Read from the completion rollups (see 'rollups'), not from the raw completions.
+        rates = completion_rates(((habit.habit_id, habit.periodicity) for habit in self.habits), days)
+        return {habit.title: rates.get(habit.habit_id, 0.0) for habit in self.habits}
+
+    def getBestWeek(self):
+        # The week (its Monday) with the most completions across the habits, and that count; None without completions.
+        return best_week(habit.habit_id for habit in self.habits)
+
+    def getTrend(self, grain="monthly", periods=12):
+        # Completions across the habits in each of the last 'periods' days, weeks or months, oldest first.
+        return completion_trend((habit.habit_id for habit in self.habits), grain, periods)
+
+    def getReport(self):
+        # Per-habit streaks, completion rate and weekday histogram, keyed by habit ID (requires NumPy).
+        return self._vectorized().report()
+
     def get_user_points(self, user):
         # Retrieve the points accumulated by the user's reward system.
         return user.reward.points_manager.points
@@ -331,33 +558,36 @@ class Analytics:
     
 # The 'Reward' class manages the user's reward system in the Habit Tracker application.
 class Reward:
-    def __init__(self, username):
+    def __init__(self, username, points=None):
         # Initialize the reward system for a specific user.
+        # When the caller already loaded the user's points they are used as-is,
+        # otherwise the current points are retrieved from the database.
         self.username = username
-        self.points = self.get_points()  # Retrieve the user's current points from the database.
+        self.points = self.get_points() if points is None else points
 
-    def add_points(self, points_to_add):
-        # Add points to the user's reward balance and update the database.
+    def add_points(self, points_to_add, reason=None):
+        # Add points to the user's reward balance and record the change in the points ledger.
+        # The ledger writes the change in a later batch (see 'points_ledger').
         self.points += points_to_add
-        self.update_points_in_db(points_to_add)
+        points_ledger.record(self.username, points_to_add, reason)
 
     def reward_for_habit_completion(self, habit):
         # Reward the user with points for completing a habit.
-        self.add_points(10)
+        self.add_points(10, "habit completed")
 
     def update_points_in_db(self, points_to_add):
-        # Update the user's points in the database.
-        with with_database_connection() as cursor:
-            cursor.execute("UPDATE users SET points = points + ? WHERE username = ?", (points_to_add, self.username))
+        # Record a points change and write it to the database immediately.
+        points_ledger.record(self.username, points_to_add)
+        points_ledger.flush()
 
     def get_points(self):
-        # Retrieve the user's current points from the database.
+        # Retrieve the user's current points: the stored balance plus changes not yet written.
         try:
             with with_database_connection() as cursor:
                 cursor.execute("SELECT points FROM users WHERE username = ?", (self.username,))
                 result = cursor.fetchone()
                 if result:
-                    return result[0]
+                    return result[0] + points_ledger.pending_points(self.username)
                 else:
                     return 0
         except OperationalError as e:
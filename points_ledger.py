@@ -0,0 +1,175 @@
+import atexit
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from database_operations import with_database_connection
+
+# Write-behind reward points ledger.
+#
+# Every change to a user's points is an entry in the 'points_ledger' table, and
+# 'users.points' is a cached balance equal to the sum of the user's entries.
+# Entries are first collected in memory by a 'PointsLedger' and written in one
+# transaction, together with one balance UPDATE per user, at the latest one flush
+# interval after they were recorded (a background timer flushes an idle ledger),
+# when a unit of work ends, or when the process exits. Bursts of completions
+# therefore cost one write per user instead of one per award.
+
+FLUSH_INTERVAL = 1.0  # Seconds between automatic flushes.
+MAX_PENDING = 1000    # Flush early once this many entries are waiting.
+
+logger = logging.getLogger(__name__)
+
+
+class PointsLedger:
+    def __init__(self, flush_interval=FLUSH_INTERVAL, max_pending=MAX_PENDING):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        # '_lock' guards the in-memory buffers and is never held during a database write, so
+        # recording points does not wait for SQLite. '_write_lock' serializes the writes, so that
+        # a flush returns only after everything recorded before it is written.
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()
+        self._entries = []  # (username, delta, reason, created_at) waiting to be written.
+        self._pending = {}  # username -> sum of that user's waiting deltas.
+        self._writing = {}  # username -> sum of the deltas of the write in progress.
+        self._last_flush = time.monotonic()
+        self._deferred = 0  # Depth of nested 'unit_of_work' blocks.
+        self._timer = None  # Pending background flush, if any.
+        self.flush_executor = None  # If set, background flushes are submitted here instead of run on the timer thread.
+
+    def record(self, username, delta, reason=None):
+        """
+        Add a points change for a user. It is written to the database on the next flush.
+        The change is kept even if that flush fails; the write is retried later.
+
+        Parameters:
+        - username (str): The user whose balance changes.
+        - delta (int): Points to add (negative to deduct).
+        - reason (str): Why the points changed, stored with the ledger entry.
+        """
+        with self._lock:
+            self._entries.append((username, delta, reason, time.strftime("%Y-%m-%d %H:%M:%S")))
+            self._pending[username] = self._pending.get(username, 0) + delta
+            due = (time.monotonic() - self._last_flush >= self.flush_interval
+                   or len(self._entries) >= self.max_pending)
+            if not due or self._deferred:
+                self._schedule_flush()
+                return
+        self._flush_or_retry()
+
+    def _schedule_flush(self):
+        # Write waiting entries after the flush interval even if nothing else is recorded in the meantime.
+        if self._timer is None and self._entries:
+            self._timer = threading.Timer(self.flush_interval, self._flush_on_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _flush_on_timer(self):
+        # Hand the flush to the executor (e.g. the single writer of 'async_service') if there is one.
+        executor = self.flush_executor
+        if executor is not None:
+            try:
+                executor.submit(self._flush_in_background)
+                return
+            except RuntimeError:
+                pass  # The executor was shut down; flush on this thread instead.
+        self._flush_in_background()
+
+    def _flush_in_background(self):
+        with self._lock:
+            self._timer = None
+            if self._deferred:
+                return  # The unit of work flushes when it ends.
+        self._flush_or_retry()
+
+    def _flush_or_retry(self):
+        # Flush for the ledger's own reasons: a failed write is logged and retried after another interval.
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Error writing points ledger; the entries are kept and retried")
+            with self._lock:
+                self._schedule_flush()
+
+    def pending_points(self, username):
+        # Points recorded for a user that have not been written to the database yet.
+        with self._lock:
+            return self._pending.get(username, 0) + self._writing.get(username, 0)
+
+    def flush(self):
+        """
+        Write all waiting entries and update the cached balances in one transaction.
+        If the write fails the entries are kept for the next flush and the error is raised.
+
+        Returns:
+        - int: The number of ledger entries written.
+        """
+        with self._write_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                entries, pending = self._entries, self._pending
+                self._entries, self._pending = [], {}
+                self._writing = pending
+                self._last_flush = time.monotonic()
+            if not entries:
+                return 0
+
+            # The buffers are free again while the rows are written.
+            try:
+                with with_database_connection() as cursor:
+                    cursor.executemany(
+                        "INSERT INTO points_ledger (username, delta, reason, created_at) VALUES (?, ?, ?, ?)", entries
+                    )
+                    cursor.executemany("UPDATE users SET points = points + ? WHERE username = ?",
+                                       [(delta, username) for username, delta in pending.items() if delta])
+            except Exception:
+                # Merge the entries back so that a later flush can retry them.
+                with self._lock:
+                    self._entries = entries + self._entries
+                    for username, delta in pending.items():
+                        self._pending[username] = self._pending.get(username, 0) + delta
+                    self._writing = {}
+                raise
+            with self._lock:
+                self._writing = {}
+            return len(entries)
+
+    @contextmanager
+    def unit_of_work(self):
+        """
+        Defer automatic flushes inside the block and flush once when it ends.
+        """
+        with self._lock:
+            self._deferred += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._deferred -= 1
+                done = not self._deferred
+            if done:
+                self.flush()
+
+
+# The process-wide ledger used by 'models.Reward'. Waiting entries are written at exit.
+points_ledger = PointsLedger()
+atexit.register(points_ledger.flush)
+
+
+def rebuild_points_balances(username=None):
+    """
+    Recompute the cached 'users.points' balances from the ledger.
+
+    Parameters:
+    - username (str): Only rebuild this user's balance. Without it every balance is rebuilt.
+    """
+    points_ledger.flush()
+    with with_database_connection() as cursor:
+        where, params = ("WHERE username = ?", (username,)) if username is not None else ("", ())
+        cursor.execute(f"""UPDATE users
+                           SET points = (SELECT COALESCE(SUM(delta), 0) FROM points_ledger
+                                         WHERE points_ledger.username = users.username)
+                           {where}""", params)
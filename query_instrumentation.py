@@ -0,0 +1,276 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import chain
+
+# Query instrumentation for the database layer.
+#
+# When enabled, every cursor handed out by 'with_database_connection' is wrapped in an
+# 'InstrumentedCursor' that times each statement (including fetching its rows), counts
+# the rows it returned or changed, and attributes it to an action: the name given to
+# the innermost 'query_action' block, or else the function that opened the connection.
+# Per-action summaries are available from 'get_query_summaries'. A statement is
+# normalized before it is counted (whitespace collapsed, IN lists of placeholders
+# shortened), so one statement repeated per habit, an N+1 pattern, shows up as a single
+# entry with a high count.
+#
+# Statements slower than the threshold are appended to the slow-query log as JSON lines
+# together with their EXPLAIN QUERY PLAN. Parameters are never logged, since they can
+# contain passwords. When instrumentation is disabled the cursor is not wrapped at all.
+#
+#   enable_query_instrumentation(slow_threshold_ms=50, slow_log_path="slow_queries.log")
+#   with query_action("login"):
+#       user.login()
+#   print(get_query_summaries()["login"])
+
+DEFAULT_SLOW_THRESHOLD_MS = 100.0
+
+_current_action = ContextVar("query_action", default=None)
+_recorder = None
+
+_WHITESPACE = re.compile(r"\s+")
+_PLACEHOLDER_LIST = re.compile(r"\?(\s*,\s*\?)+")
+
+
+# This function normalizes a statement so that variants of the same query are counted together.
+def normalize_sql(sql):
+    return _PLACEHOLDER_LIST.sub("?, ...", _WHITESPACE.sub(" ", sql).strip())
+
+
+# The 'QueryRecorder' class collects statement timings and writes the slow-query log.
+class QueryRecorder:
+    def __init__(self, slow_threshold_ms=DEFAULT_SLOW_THRESHOLD_MS, slow_log_path=None):
+        """
+        Parameters:
+        - slow_threshold_ms (float): Statements taking at least this long are logged as slow.
+        - slow_log_path (str): File the slow-query log is appended to; None to keep no log.
+        """
+        self.slow_threshold_ms = slow_threshold_ms
+        self.slow_log_path = slow_log_path
+        self._lock = threading.Lock()
+        self._actions = {}  # Action -> summary dictionary.
+
+    def _summary(self, action):
+        summary = self._actions.get(action)
+        if summary is None:
+            summary = self._actions[action] = {"connections": 0, "queries": 0, "rows": 0, "total_ms": 0.0,
+                                               "max_ms": 0.0, "slow_queries": 0, "statements": {}}
+        return summary
+
+    def wrap(self, cursor, action):
+        # Wrap a cursor borrowed by 'action' so that its statements are recorded.
+        with self._lock:
+            self._summary(action)["connections"] += 1
+        return InstrumentedCursor(cursor, self, action)
+
+    def record(self, action, sql, elapsed_ms, rows, plan_cursor=None, params=()):
+        """
+        Add one finished statement to the action's summary, and to the slow-query log if it was slow.
+        """
+        normalized = normalize_sql(sql)
+        slow = elapsed_ms >= self.slow_threshold_ms
+        with self._lock:
+            summary = self._summary(action)
+            summary["queries"] += 1
+            summary["rows"] += rows
+            summary["total_ms"] += elapsed_ms
+            summary["max_ms"] = max(summary["max_ms"], elapsed_ms)
+            summary["slow_queries"] += slow
+            statement = summary["statements"].setdefault(normalized, {"count": 0, "rows": 0, "total_ms": 0.0})
+            statement["count"] += 1
+            statement["rows"] += rows
+            statement["total_ms"] += elapsed_ms
+        if slow and self.slow_log_path:
+            self._log_slow(action, normalized, elapsed_ms, rows, explain_query_plan(plan_cursor, sql, params))
+
+    def _log_slow(self, action, sql, elapsed_ms, rows, plan):
+        entry = {"time": time.strftime("%Y-%m-%d %H:%M:%S"), "action": action, "elapsed_ms": round(elapsed_ms, 3),
+                 "rows": rows, "sql": sql, "plan": plan}
+        with self._lock, open(self.slow_log_path, "a") as log:
+            log.write(json.dumps(entry) + "\n")
+
+    def summaries(self):
+        # Return a copy of the per-action summaries, with the busiest statements first.
+        with self._lock:
+            result = {}
+            for action, summary in self._actions.items():
+                summary = dict(summary)
+                summary["statements"] = dict(sorted(summary["statements"].items(),
+                                                    key=lambda item: item[1]["total_ms"], reverse=True))
+                result[action] = summary
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._actions = {}
+
+
+# This function returns the EXPLAIN QUERY PLAN of a statement as a list of plan lines, or None.
+def explain_query_plan(cursor, sql, params=()):
+    if cursor is None or not sql.lstrip().upper().startswith(("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")):
+        return None
+    try:
+        plan_cursor = cursor.connection.cursor()
+        plan_cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        plan = [row[-1] for row in plan_cursor.fetchall()]
+        plan_cursor.close()
+        return plan
+    except sqlite3.Error:
+        return None
+
+
+# The 'InstrumentedCursor' class wraps a sqlite3 cursor and reports each statement to a 'QueryRecorder'.
+# A statement is finished (and recorded) when the next one starts, its rows are exhausted, or the cursor closes.
+class InstrumentedCursor:
+    def __init__(self, cursor, recorder, action):
+        self._cursor = cursor
+        self._recorder = recorder
+        self._action = action
+        self._sql = None
+        self._params = ()
+        self._elapsed = 0.0
+        self._rows = 0
+
+    def __getattr__(self, name):
+        # Everything not instrumented (lastrowid, rowcount, connection, ...) comes from the real cursor.
+        return getattr(self._cursor, name)
+
+    def _finish(self):
+        if self._sql is None:
+            return
+        rows = self._rows if self._cursor.description is not None else max(self._cursor.rowcount, 0)
+        sql, params, elapsed = self._sql, self._params, self._elapsed
+        self._sql = None
+        self._recorder.record(self._action, sql, elapsed * 1000, rows, self._cursor, params)
+
+    def _start(self, sql, params):
+        self._finish()
+        self._sql, self._params, self._elapsed, self._rows = sql, params, 0.0, 0
+
+    def execute(self, sql, parameters=()):
+        self._start(sql, parameters)
+        start = time.perf_counter()
+        try:
+            self._cursor.execute(sql, parameters)
+        finally:
+            self._elapsed += time.perf_counter() - start
+        if self._cursor.description is None:
+            self._finish()  # Statements without a result set are complete once executed.
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        # Only the first row is kept for the log; the rest of a stream is passed on without materializing it.
+        seq_of_parameters = iter(seq_of_parameters)
+        first = next(seq_of_parameters, None)
+        if first is not None:
+            seq_of_parameters = chain((first,), seq_of_parameters)
+        self._start(sql, first if first is not None else ())
+        start = time.perf_counter()
+        try:
+            self._cursor.executemany(sql, seq_of_parameters)
+        finally:
+            self._elapsed += time.perf_counter() - start
+        self._finish()
+        return self
+
+    def _fetch(self, fetch, *args):
+        start = time.perf_counter()
+        try:
+            result = fetch(*args)
+        finally:
+            self._elapsed += time.perf_counter() - start
+        return result
+
+    def fetchone(self):
+        row = self._fetch(self._cursor.fetchone)
+        if row is None:
+            self._finish()
+        else:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._fetch(self._cursor.fetchmany, self._cursor.arraysize if size is None else size)
+        self._rows += len(rows)
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._fetch(self._cursor.fetchall)
+        self._rows += len(rows)
+        self._finish()
+        return rows
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+    def close(self):
+        self._finish()
+        self._cursor.close()
+
+
+# This function turns instrumentation on for every connection borrowed from now on.
+def enable_query_instrumentation(slow_threshold_ms=DEFAULT_SLOW_THRESHOLD_MS, slow_log_path=None):
+    """
+    Parameters:
+    - slow_threshold_ms (float): Statements taking at least this long are logged as slow.
+    - slow_log_path (str): File the slow-query log is appended to; None to keep no log.
+
+    Returns:
+    - QueryRecorder: The recorder collecting the statistics.
+    """
+    global _recorder
+    _recorder = QueryRecorder(slow_threshold_ms, slow_log_path)
+    return _recorder
+
+
+def disable_query_instrumentation():
+    global _recorder
+    _recorder = None
+
+
+def get_query_recorder():
+    # The active recorder, or None when instrumentation is disabled.
+    return _recorder
+
+
+def current_query_action():
+    # The name given to the innermost 'query_action' block, or None.
+    return _current_action.get()
+
+
+@contextmanager
+def query_action(name):
+    """
+    Attribute every statement run inside the block to the action 'name'.
+    """
+    token = _current_action.set(name)
+    try:
+        yield
+    finally:
+        _current_action.reset(token)
+
+
+def get_query_summaries():
+    """
+    Returns:
+    - dict: Action -> {"connections", "queries", "rows", "total_ms", "max_ms", "slow_queries",
+      "statements": {normalized SQL -> {"count", "rows", "total_ms"}}}. Empty when disabled.
+    """
+    return _recorder.summaries() if _recorder is not None else {}
+
+
+def reset_query_stats():
+    if _recorder is not None:
+        _recorder.reset()
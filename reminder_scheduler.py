@@ -0,0 +1,245 @@
+import argparse
+import heapq
+import threading
+import time
+from calendar import monthrange
+from collections import namedtuple
+from datetime import datetime, timedelta
+from database_operations import with_database_connection, setup_database
+from habit_operations import register_habit_listener
+
+# Reminder scheduler.
+#
+# A reminder stores the time of day it should fire ('next_reminder_time', e.g. "13:00"
+# or "9:00 AM"), how often ('reminder_frequency': daily, weekly, monthly or a number
+# of days), and the absolute time it fires next ('next_fire_at', Unix seconds).
+#
+# 'ReminderScheduler' pages the reminders due within the next time window into a
+# min-heap with one indexed range query, sleeps until the earliest one is due, hands
+# each due reminder to a sink, and advances its 'next_fire_at' by its frequency. The
+# advanced times are written back in batches. Reminders are delivered at least once:
+# a reminder that fired just before a crash may fire again after a restart.
+#
+# Run with: python reminder_scheduler.py
+
+DEFAULT_WINDOW = 300.0  # Seconds of upcoming reminders held in memory.
+DEFAULT_BATCH_SIZE = 500  # Reminders read or written per database round trip.
+UNSCHEDULABLE = 0  # 'next_fire_at' of reminders whose time or frequency cannot be parsed.
+
+# A reminder that is due, as handed to the sink.
+DueReminder = namedtuple("DueReminder", ["reminder_id", "habit_id", "username", "title", "fire_at"])
+
+
+# This function parses a reminder's time of day, e.g. "13:00", "9:00 AM" or "9:00pm".
+def parse_reminder_time(text):
+    text = text.strip().upper().replace(" ", "")
+    for fmt in ("%H:%M", "%I:%M%p", "%I%p"):
+        try:
+            return datetime.strptime(text, fmt).time()
+        except ValueError:
+            pass
+    raise ValueError(f"Invalid reminder time: {text!r}")
+
+
+# This function returns the first time after 'now' at which a reminder with the given time of day fires.
+def first_fire_time(time_text, now):
+    fire_at = datetime.combine(now.date(), parse_reminder_time(time_text))
+    return fire_at if fire_at > now else fire_at + timedelta(days=1)
+
+
+# This function advances a fire time by one reminder period.
+def advance_fire_time(fire_at, frequency):
+    """
+    Parameters:
+    - fire_at (datetime): The time the reminder last fired (local wall-clock time).
+    - frequency (str or int): "daily", "weekly", "monthly", or a number of days.
+
+    Returns:
+    - datetime: The next fire time. Monthly reminders keep their day of the month,
+      clamped to the length of shorter months.
+    """
+    if frequency == "monthly":
+        year, month = divmod(fire_at.year * 12 + fire_at.month, 12)  # The following month.
+        month += 1
+        return fire_at.replace(year=year, month=month, day=min(fire_at.day, monthrange(year, month)[1]))
+    if frequency == "daily":
+        days = 1
+    elif frequency == "weekly":
+        days = 7
+    else:
+        try:
+            days = int(frequency)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid reminder frequency: {frequency!r}")
+        if days < 1:
+            raise ValueError(f"Invalid reminder frequency: {frequency!r}")
+    return fire_at + timedelta(days=days)
+
+
+# This sink prints due reminders to standard output.
+def print_sink(reminder):
+    print(f"[{reminder.fire_at:%Y-%m-%d %H:%M}] Reminder for {reminder.username}: time for '{reminder.title}'!")
+
+
+class ReminderScheduler:
+    def __init__(self, sink=print_sink, window=DEFAULT_WINDOW, batch_size=DEFAULT_BATCH_SIZE, clock=time.time):
+        """
+        Parameters:
+        - sink (callable): Called with a 'DueReminder' for every reminder that fires.
+        - window (float): Seconds of upcoming reminders loaded into memory at a time.
+        - batch_size (int): Rows fetched, and advanced times written, per round trip.
+        - clock (callable): Source of the current time in Unix seconds.
+        """
+        self.sink = sink
+        self.window = window
+        self.batch_size = batch_size
+        self.clock = clock
+        self._heap = []  # (fire_at, reminder_id, habit_id, frequency, username, title)
+        self._horizon = None  # Reminders due up to this time are in the heap; None until loaded.
+        self._updates = []  # (new next_fire_at, reminder_id, old next_fire_at) waiting to be written.
+        self._stale = False  # Set when reminders changed in this process and the heap must be reloaded.
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        register_habit_listener(self)
+
+    def habit_changed(self, username, habit_id):
+        # Habits (and so reminders) were added or deleted in this process: reload on the next round.
+        if username is not None:
+            self._stale = True
+            self._wakeup.set()
+
+    def _schedule_new(self, cursor, now):
+        # Give reminders that were never scheduled their first fire time, one batch at a time:
+        # each batch is read in full and written before the next one is read.
+        last_id = 0
+        while True:
+            cursor.execute(
+                "SELECT id, next_reminder_time FROM reminders WHERE next_fire_at IS NULL AND id > ? ORDER BY id LIMIT ?",
+                (last_id, self.batch_size)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            self._updates.extend((self._first_fire_at(time_text, now), reminder_id, None)
+                                 for reminder_id, time_text in rows)
+            self._flush(cursor)
+            last_id = rows[-1][0]
+
+    @staticmethod
+    def _first_fire_at(time_text, now):
+        try:
+            return int(first_fire_time(time_text or "", datetime.fromtimestamp(now)).timestamp())
+        except ValueError:
+            return UNSCHEDULABLE
+
+    def _reload(self, now):
+        # Write pending advances, then page in every reminder due before the end of the next window.
+        horizon = now + self.window
+        heap = []
+        self._stale = False
+        with with_database_connection() as cursor:
+            self._flush(cursor)
+            self._schedule_new(cursor, now)
+            cursor.execute(
+                """SELECT r.next_fire_at, r.id, r.habit_id, r.reminder_frequency, h.username, h.title
+                   FROM reminders r JOIN habits h ON h.id = r.habit_id
+                   WHERE r.next_fire_at > ? AND r.next_fire_at <= ?""",
+                (UNSCHEDULABLE, horizon)
+            )
+            while True:
+                rows = cursor.fetchmany(self.batch_size)
+                if not rows:
+                    break
+                heap.extend(rows)
+        heapq.heapify(heap)
+        self._heap = heap
+        self._horizon = horizon
+
+    def _flush(self, cursor):
+        # Persist advanced fire times. A row changed by someone else since it was loaded is left alone.
+        if not self._updates:
+            return
+        updates, self._updates = self._updates, []
+        cursor.executemany(
+            "UPDATE reminders SET next_fire_at = ? WHERE id = ? AND next_fire_at IS ?",
+            updates
+        )
+
+    def flush(self):
+        # Write every advanced fire time that is still waiting.
+        with with_database_connection() as cursor:
+            self._flush(cursor)
+
+    def run_pending(self):
+        """
+        Fire every reminder that is due now and advance it to its next fire time.
+
+        Returns:
+        - int: The number of reminders fired.
+        """
+        now = self.clock()
+        if self._stale or self._horizon is None or now >= self._horizon:
+            self._reload(now)
+        horizon = self._horizon
+
+        fired = 0
+        while self._heap and self._heap[0][0] <= now:
+            fire_at, reminder_id, habit_id, frequency, username, title = heapq.heappop(self._heap)
+            self.sink(DueReminder(reminder_id, habit_id, username, title, datetime.fromtimestamp(fire_at)))
+            fired += 1
+
+            # Occurrences missed while the scheduler was down are collapsed into the one just fired.
+            next_fire = datetime.fromtimestamp(fire_at)
+            try:
+                while next_fire.timestamp() <= now:
+                    next_fire = advance_fire_time(next_fire, frequency)
+                next_fire_at = int(next_fire.timestamp())
+            except ValueError:
+                next_fire_at = UNSCHEDULABLE
+            self._updates.append((next_fire_at, reminder_id, fire_at))
+            if UNSCHEDULABLE < next_fire_at <= horizon:
+                heapq.heappush(self._heap, (next_fire_at, reminder_id, habit_id, frequency, username, title))
+            if len(self._updates) >= self.batch_size:
+                self.flush()
+
+        self.flush()
+        return fired
+
+    def seconds_until_next(self):
+        # Seconds until the next reminder is due or the window must be reloaded, whichever is first.
+        if self._stale or self._horizon is None:
+            return 0.0
+        next_time = self._heap[0][0] if self._heap else self._horizon
+        return max(0.0, min(next_time, self._horizon) - self.clock())
+
+    def run_forever(self):
+        # Fire reminders as they become due until 'stop' is called.
+        self._stopped.clear()
+        while not self._stopped.is_set():
+            self.run_pending()
+            self._wakeup.wait(self.seconds_until_next())
+            self._wakeup.clear()
+        self.flush()
+
+    def stop(self):
+        # Stop 'run_forever', e.g. from another thread.
+        self._stopped.set()
+        self._wakeup.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fire habit reminders as they become due.")
+    parser.add_argument("--window", type=float, default=DEFAULT_WINDOW,
+                        help="Seconds of upcoming reminders held in memory.")
+    args = parser.parse_args()
+
+    setup_database()
+    scheduler = ReminderScheduler(window=args.window)
+    try:
+        scheduler.run_forever()
+    except KeyboardInterrupt:
+        scheduler.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+from datetime import date, timedelta
+from database_operations import with_database_connection, chunked_ids
+from streaks import PERIODICITIES, period_index
+
+# Period rollups of habit completions.
+#
+# 'completion_rollups' holds the number of completions of every habit per day, ISO week
+# and calendar month (grain "daily", "weekly" and "monthly", with the period indexes of
+# 'streaks.period_index'). Triggers on 'completions' keep it current, so analytics over
+# months of history read a few rollup rows per habit instead of scanning every completion.
+# 'rebuild_rollups' recomputes the counts in bulk, e.g. after editing completions by hand.
+
+# Period index of a completion's day ordinal per grain, in SQL, matching 'streaks.period_index'
+# and the expressions the triggers of migration 9 use.
+_GRAIN_SQL = {
+    "daily": "completion_day",
+    "weekly": "(completion_day - 1) / 7",
+    "monthly": ("CAST(strftime('%Y', date(completion_day + 1721424.5)) AS INTEGER) * 12"
+                " + CAST(strftime('%m', date(completion_day + 1721424.5)) AS INTEGER) - 1"),
+}
+
+
+def period_start(period, grain):
+    """
+    Return the first day of a period.
+
+    Parameters:
+    - period (int): Period index, as returned by 'streaks.period_index'.
+    - grain (str): "daily", "weekly" or "monthly".
+
+    Returns:
+    - date: The day, the Monday of the week, or the first of the month.
+    """
+    if grain == "daily":
+        return date.fromordinal(period)
+    elif grain == "weekly":
+        return date.fromordinal(period * 7 + 1)
+    elif grain == "monthly":
+        return date(period // 12, period % 12 + 1, 1)
+    raise ValueError(f"Unsupported grain: {grain}")
+
+
+def rebuild_rollups(cursor, habit_ids=None):
+    """
+    Recompute the rollup counts from the completions.
+
+    Parameters:
+    - cursor (sqlite3.Cursor): Cursor to run the statements on.
+    - habit_ids (list): Only rebuild these habits. Without it every habit is rebuilt.
+    """
+    if habit_ids is None:
+        batches = [("", [])]
+        cursor.execute("DELETE FROM completion_rollups")
+    else:
+        batches = [(f"AND habit_id IN ({placeholders})", chunk) for chunk, placeholders in chunked_ids(habit_ids)]
+        for where, chunk in batches:
+            cursor.execute(f"DELETE FROM completion_rollups WHERE 1 {where}", chunk)
+
+    for where, chunk in batches:
+        for grain, period_sql in _GRAIN_SQL.items():
+            cursor.execute(
+                f"""INSERT INTO completion_rollups (habit_id, grain, period, completions)
+                    SELECT habit_id, '{grain}', {period_sql} AS period, COUNT(*)
+                    FROM completions WHERE completion_day IS NOT NULL {where}
+                    GROUP BY habit_id, period""",
+                chunk
+            )
+
+
+# This function counts the periods with at least one completion within a range, per habit.
+def _active_periods(cursor, habit_ids, grain, first, last):
+    counts = {}
+    for chunk, placeholders in chunked_ids(habit_ids):
+        cursor.execute(
+            f"""SELECT habit_id, COUNT(*) FROM completion_rollups
+                WHERE habit_id IN ({placeholders}) AND grain = ? AND period BETWEEN ? AND ?
+                GROUP BY habit_id""",
+            [*chunk, grain, first, last]
+        )
+        counts.update(cursor.fetchall())
+    return counts
+
+
+def completion_rates(habits, days=30, today=None):
+    """
+    Share of each habit's periods within a window that have at least one completion.
+
+    Parameters:
+    - habits (iterable): (habit_id, periodicity) pairs.
+    - days (int): Length of the window in days, ending today.
+    - today (date): Last day of the window; today by default.
+
+    Returns:
+    - dict: Habit ID -> completion rate between 0 and 1. A weekly habit counts the ISO weeks,
+      and a monthly habit the months, that overlap the window.
+    """
+    today = today or date.today()
+    first_day = today - timedelta(days=days - 1)
+    by_grain = {}
+    for habit_id, periodicity in habits:
+        if periodicity in PERIODICITIES:
+            by_grain.setdefault(periodicity, []).append(habit_id)
+
+    rates = {}
+    with with_database_connection() as cursor:
+        for grain, habit_ids in by_grain.items():
+            first, last = period_index(first_day, grain), period_index(today, grain)
+            active = _active_periods(cursor, habit_ids, grain, first, last)
+            for habit_id in habit_ids:
+                rates[habit_id] = active.get(habit_id, 0) / (last - first + 1)
+    return rates
+
+
+def best_week(habit_ids):
+    """
+    Find the ISO week in which the habits were completed most often.
+
+    Returns:
+    - tuple: (Monday of the week, number of completions), or None without completions.
+      Ties go to the most recent week.
+    """
+    habit_ids = list(habit_ids)
+    if not habit_ids:
+        return None
+    totals = {}
+    with with_database_connection() as cursor:
+        for chunk, placeholders in chunked_ids(habit_ids):
+            cursor.execute(
+                f"""SELECT period, SUM(completions) FROM completion_rollups
+                    WHERE habit_id IN ({placeholders}) AND grain = 'weekly' GROUP BY period""",
+                chunk
+            )
+            for period, total in cursor.fetchall():
+                totals[period] = totals.get(period, 0) + total
+    if not totals:
+        return None
+    period = max(totals, key=lambda week: (totals[week], week))
+    return period_start(period, "weekly"), totals[period]
+
+
+def completion_trend(habit_ids, grain="monthly", periods=12, today=None):
+    """
+    Count the habits' completions in each of the most recent periods.
+
+    Parameters:
+    - habit_ids (iterable): The habits to count.
+    - grain (str): "daily", "weekly" or "monthly".
+    - periods (int): Number of periods, ending with the current one.
+    - today (date): Reference day for the current period; today by default.
+
+    Returns:
+    - list: (first day of the period, completions) pairs, oldest first, including periods without completions.
+    """
+    if grain not in _GRAIN_SQL:
+        raise ValueError(f"Unsupported grain: {grain}")
+    last = period_index(today or date.today(), grain)
+    first = last - periods + 1
+    totals = dict.fromkeys(range(first, last + 1), 0)
+    habit_ids = list(habit_ids)
+    with with_database_connection() as cursor:
+        for chunk, placeholders in chunked_ids(habit_ids):
+            cursor.execute(
+                f"""SELECT period, SUM(completions) FROM completion_rollups
+                    WHERE habit_id IN ({placeholders}) AND grain = ? AND period BETWEEN ? AND ?
+                    GROUP BY period""",
+                [*chunk, grain, first, last]
+            )
+            for period, total in cursor.fetchall():
+                totals[period] += total
+    return [(period_start(period, grain), total) for period, total in totals.items()]
+
+
+if __name__ == "__main__":
+    # Repair command: python rollups.py
+    with with_database_connection() as cursor:
+        rebuild_rollups(cursor)
+    print("Rebuilt the completion rollups.")
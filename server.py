@@ -0,0 +1,329 @@
+import argparse
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+from models import User, SessionManager, Analytics, Reminder, DEFAULT_SESSION_TTL, DEFAULT_MAX_SESSIONS
+from database_operations import setup_database
+from habit_operations import add_habit, delete_habit, mark_habit_complete
+from streaks import PERIODICITIES, get_streak_counters
+from points_ledger import points_ledger
+from reminder_scheduler import parse_reminder_time
+
+# Multi-user HTTP/JSON server for the Habit Tracker.
+#
+# Serves the operations of the CLI as JSON endpoints. Clients log in once and send
+# the returned token as "Authorization: Bearer <token>" on every other request.
+# Each session keeps its 'User' object, so the user's habit repository and reward
+# stay warm between requests. Idle sessions expire and the number of sessions is
+# capped (see --session-ttl and --max-sessions).
+#
+#   POST   /register                  {"username", "password"}
+#   POST   /login                     {"username", "password"} -> {"token", "points"}
+#   POST   /logout
+#   GET    /habits
+#   POST   /habits                    {"title", "description", "periodicity", "reminder_time"?, "reminder_frequency"?}
+#   DELETE /habits/<title>
+#   POST   /habits/<id>/complete      {"completion_date"?}
+#   GET    /rewards
+#   GET    /analytics
+#
+# Every request is handled on its own thread. Reads run concurrently; writes are
+# serialized by one lock so that concurrent clients queue in the process instead
+# of contending for SQLite's write lock.
+#
+# Run with: python server.py --port 8000
+
+MAX_BODY_SIZE = 1024 * 1024  # Largest accepted request body in bytes.
+
+
+# This function lists the given request fields that are present but not strings.
+def non_string_fields(body, names):
+    """
+    Parameters:
+    - body (dict): The decoded request body.
+    - names (iterable): The fields that must be strings when given. A null value counts as missing.
+
+    Returns:
+    - list: The names of the invalid fields, in the given order.
+    """
+    return [name for name in names if body.get(name) is not None and not isinstance(body[name], str)]
+
+
+# This function converts a habit into a JSON-friendly dictionary.
+def habit_to_dict(habit, counters=None):
+    """
+    Parameters:
+    - habit (Habit): The habit to convert.
+    - counters (tuple): The habit's (current_streak, longest_streak), if already loaded.
+
+    Returns:
+    - dict: The habit's fields.
+    """
+    current, longest = counters if counters else (0, 0)
+    reminder = habit.reminder_time
+    return {
+        "id": habit.habit_id,
+        "title": habit.title,
+        "description": habit.description,
+        "periodicity": habit.periodicity,
+        "creation_date": habit.creation_date.isoformat(sep=" ", timespec="seconds"),
+        "current_streak": current,
+        "longest_streak": longest,
+        "reminder": {"time": reminder.nextReminderTime, "frequency": reminder.reminderFrequency} if reminder else None,
+    }
+
+
+# The 'HabitRequestHandler' class maps HTTP requests to habit, user and reward operations.
+class HabitRequestHandler(BaseHTTPRequestHandler):
+    server_version = "HabitTracker/1.0"
+    protocol_version = "HTTP/1.1"  # Keep connections alive between requests from the same client.
+
+    # (method, path pattern, handler name, whether a session is required, whether it writes)
+    routes = [
+        ("POST", re.compile(r"^/register$"), "register", False, True),
+        ("POST", re.compile(r"^/login$"), "login", False, True),
+        ("POST", re.compile(r"^/logout$"), "logout", True, True),
+        ("GET", re.compile(r"^/habits$"), "list_habits", True, False),
+        ("POST", re.compile(r"^/habits$"), "create_habit", True, True),
+        ("DELETE", re.compile(r"^/habits/(?P<title>[^/]+)$"), "remove_habit", True, True),
+        ("POST", re.compile(r"^/habits/(?P<habit_id>\d+)/complete$"), "complete_habit", True, True),
+        ("GET", re.compile(r"^/rewards$"), "rewards", True, False),
+        ("GET", re.compile(r"^/analytics$"), "analytics", True, False),
+    ]
+
+    def __getattr__(self, name):
+        # 'BaseHTTPRequestHandler' calls 'do_<METHOD>' for each request. Every method is routed
+        # through '_dispatch', so unsupported ones get a JSON 405 instead of an HTML 501 page.
+        if name.startswith("do_"):
+            return lambda: self._dispatch(name[len("do_"):])
+        raise AttributeError(name)
+
+    def _dispatch(self, method):
+        # The body is read before any response is sent: on a kept-alive connection an unread
+        # body would otherwise be parsed as the next request.
+        try:
+            raw_body = self._read_raw_body()
+        except ValueError as error:
+            self.close_connection = True  # The rest of the request cannot be located on the socket.
+            return self._send(400, {"error": str(error)})
+
+        path = self.path.split("?", 1)[0]
+        methods = sorted({route[0] for route in self.routes})
+        if method not in methods:
+            return self._send(405, {"error": "Method not allowed."}, {"Allow": ", ".join(methods)})
+
+        allowed = []
+        for route_method, pattern, name, needs_session, writes in self.routes:
+            match = pattern.match(path)
+            if match and route_method == method:
+                break
+            if match:
+                allowed.append(route_method)
+        else:
+            if allowed:
+                return self._send(405, {"error": "Method not allowed."}, {"Allow": ", ".join(allowed)})
+            return self._send(404, {"error": "Not found."})
+
+        try:
+            body = self._parse_body(raw_body)
+        except ValueError:
+            return self._send(400, {"error": "Request body must be a JSON object."})
+
+        user = None
+        if needs_session:
+            user = self._session_user()
+            if user is None:
+                return self._send(401, {"error": "Missing or unknown session token."})
+
+        handler = getattr(self, name)
+        params = {key: unquote(value) for key, value in match.groupdict().items()}
+        try:
+            if writes:
+                with self.server.write_lock:
+                    status, payload = handler(user, body, **params)
+            else:
+                status, payload = handler(user, body, **params)
+        except Exception as error:
+            self.log_error("%s %s failed: %r", method, path, error)
+            status, payload = 500, {"error": "Internal server error."}
+        self._send(status, payload)
+
+    def _read_raw_body(self):
+        # Read the request body as announced by Content-Length.
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            raise ValueError("Invalid Content-Length.")
+        if length < 0 or length > MAX_BODY_SIZE:
+            raise ValueError(f"Content-Length must be between 0 and {MAX_BODY_SIZE}.")
+        return self.rfile.read(length) if length else b""
+
+    def _parse_body(self, raw_body):
+        # Decode the JSON request body. An empty body is an empty object.
+        if not raw_body:
+            return {}
+        body = json.loads(raw_body)
+        if not isinstance(body, dict):
+            raise ValueError("JSON body is not an object")
+        return body
+
+    def _token(self):
+        header = self.headers.get("Authorization", "")
+        return header[len("Bearer "):].strip() if header.startswith("Bearer ") else None
+
+    def _session_user(self):
+        token = self._token()
+        return self.server.session_manager.get_user_for_token(token) if token else None
+
+    def _send(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if self.command != "HEAD":  # A response to HEAD has headers only.
+            self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _invalid_fields(self, body, names):
+        # A 400 response for request fields that are not strings, or None if all are valid.
+        invalid = non_string_fields(body, names)
+        if invalid:
+            return 400, {"error": f"{', '.join(invalid)} must be strings."}
+        return None
+
+    # Endpoint handlers. Each returns (HTTP status, JSON payload).
+
+    def register(self, user, body):
+        invalid = self._invalid_fields(body, ("username", "password"))
+        if invalid:
+            return invalid
+        username, password = body.get("username"), body.get("password")
+        if not username or not password:
+            return 400, {"error": "username and password are required."}
+        if not User(username, password).register():
+            return 409, {"error": f"Username {username} already exists."}
+        return 201, {"username": username}
+
+    def login(self, user, body):
+        invalid = self._invalid_fields(body, ("username", "password"))
+        if invalid:
+            return invalid
+        user = User(body.get("username"), body.get("password"))
+        if not user.username or not user.login():
+            return 401, {"error": "Invalid username or password."}
+        for habit in user.broken_streaks:
+            self.log_message("Streak broken for habit %s of user %s", habit.habit_id, user.username)
+        token = self.server.session_manager.start_session(user)
+        return 200, {"token": token, "username": user.username, "points": user.reward.points}
+
+    def logout(self, user, body):
+        # Write any points changes that are still waiting, as the CLI does on logout.
+        self.server.session_manager.end_session_for_token(self._token())
+        points_ledger.flush()
+        return 200, {}
+
+    def list_habits(self, user, body):
+        habits = user.getHabits()
+        counters = get_streak_counters(habit.habit_id for habit in habits)
+        return 200, {"habits": [habit_to_dict(habit, counters.get(habit.habit_id)) for habit in habits]}
+
+    def create_habit(self, user, body):
+        invalid = self._invalid_fields(body, ("title", "description", "periodicity",
+                                              "reminder_time", "reminder_frequency"))
+        if invalid:
+            return invalid
+        title, periodicity = body.get("title"), body.get("periodicity")
+        if not title or periodicity not in PERIODICITIES:
+            return 400, {"error": f"title and a periodicity ({', '.join(PERIODICITIES)}) are required."}
+
+        reminder = None
+        if body.get("reminder_time"):
+            try:
+                parse_reminder_time(body["reminder_time"])
+            except ValueError:
+                return 400, {"error": "Invalid reminder_time. Please use a time of day such as 13:00."}
+            reminder = Reminder(None, body["reminder_time"], body.get("reminder_frequency") or periodicity)
+        if user.habit_exists(title):
+            return 409, {"error": f"The habit titled '{title}' already exists."}
+        add_habit(user.username, title, body.get("description") or "", periodicity, reminder)
+        return 201, {"habit": habit_to_dict(user.get_habit_by_title(title))}
+
+    def remove_habit(self, user, body, title):
+        habit_id = delete_habit(user.username, title)
+        if habit_id is None:
+            return 404, {"error": f"Habit with title {title} does not exist."}
+        return 200, {"deleted": habit_id}
+
+    def complete_habit(self, user, body, habit_id):
+        habit = user.habits.get(int(habit_id))
+        if habit is None:
+            return 404, {"error": f"Habit {habit_id} does not exist."}
+        completion_date = body.get("completion_date")
+        try:
+            if completion_date is not None and not isinstance(completion_date, str):
+                raise ValueError(completion_date)
+            mark_habit_complete(habit.habit_id, completion_date)
+        except ValueError:
+            return 400, {"error": "Invalid date. Please use the YYYY-MM-DD format."}
+        user.reward.reward_for_habit_completion(habit)
+        return 200, {"points": user.reward.points}
+
+    def rewards(self, user, body):
+        return 200, {"points": user.reward.points}
+
+    def analytics(self, user, body):
+        return 200, Analytics(user.getHabits()).getSummary()
+
+
+# The 'HabitServer' class is a threaded HTTP server that owns the sessions of its clients.
+class HabitServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 512  # Accept bursts of hundreds of concurrent connections.
+
+    def __init__(self, address, session_manager=None, quiet=False):
+        """
+        Parameters:
+        - address (tuple): (host, port) to listen on. Port 0 picks a free port.
+        - session_manager (SessionManager): Store for the client sessions; a new one by default.
+        - quiet (bool): Whether to suppress the per-request access log.
+        """
+        super().__init__(address, HabitRequestHandler)
+        self.session_manager = session_manager or SessionManager()
+        self.write_lock = threading.Lock()
+        self.quiet = quiet
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the Habit Tracker as a JSON API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--session-ttl", type=float, default=DEFAULT_SESSION_TTL,
+                        help="Seconds of inactivity after which a session expires.")
+    parser.add_argument("--max-sessions", type=int, default=DEFAULT_MAX_SESSIONS,
+                        help="Maximum number of active sessions; the least recently used is evicted.")
+    parser.add_argument("--quiet", action="store_true", help="Do not log every request.")
+    args = parser.parse_args()
+
+    setup_database()
+    session_manager = SessionManager(idle_ttl=args.session_ttl, max_sessions=args.max_sessions)
+    server = HabitServer((args.host, args.port), session_manager=session_manager, quiet=args.quiet)
+    print(f"Serving the Habit Tracker on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        points_ledger.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import argparse
+from collections import Counter
+from datetime import datetime
+from database_operations import with_database_connection, setup_database
+from habit_operations import notify_habit_changed
+from rollups import period_start
+from streaks import PERIODICITIES, period_index
+
+# Nightly sweep for broken streaks.
+#
+# 'Habit.breakStreak' only notices a broken streak when the habit's owner logs in. The
+# sweeper finds every broken streak at once: one grouped query over the completions
+# index takes each habit's latest completion day and compares it with the first day of
+# the previous period, since a streak is broken when neither the current nor the
+# previous period has a completion. The habits found are then updated in chunks. Each
+# chunk is one transaction that sets 'streak_broken_date', resets 'current_streak' and
+# deducts the penalty through ledger entries and one balance update per user.
+#
+# Each chunk checks again that the streak is still broken and was not already marked
+# broken today, while it holds the write lock. A completion or a login that gets in
+# between the query and the chunk is therefore neither penalized twice nor overwritten.
+# The check is a SELECT followed by an UPDATE of the rows it found, rather than
+# 'UPDATE ... RETURNING', which needs SQLite 3.35.
+# Run it once a day, e.g. from cron:
+#
+#   5 0 * * * cd /path/to/HabitTrackingApp && python streak_sweeper.py
+
+SWEEP_CHUNK_SIZE = 500  # Habits updated per transaction.
+STREAK_PENALTY = 10  # Points deducted per broken streak, as in 'Habit.breakStreak'.
+
+# First day (ordinal) of the previous period for the habit's periodicity, one parameter per periodicity.
+_CUTOFF_SQL = "CASE {column} " + " ".join(f"WHEN '{periodicity}' THEN ?" for periodicity in PERIODICITIES) + " END"
+
+
+# This function returns, per periodicity, the first day of the period before the one 'today' falls in.
+def _cutoff_days(today):
+    return [period_start(period_index(today, periodicity) - 1, periodicity).toordinal()
+            for periodicity in PERIODICITIES]
+
+
+def find_broken_streaks(today, username=None):
+    """
+    Find the habits whose streak is broken and has not been marked broken today.
+
+    Parameters:
+    - today (date): The day of the sweep.
+    - username (str): Only look at this user's habits. Without it every user's habits are checked.
+
+    Returns:
+    - list: IDs of the habits, in ascending order. Habits without completions have no streak and are not included.
+    """
+    user_filter, params = ("AND h.username = ?", [username]) if username is not None else ("", [])
+    with with_database_connection() as cursor:
+        cursor.execute(
+            f"""SELECT h.id FROM habits h JOIN completions c ON c.habit_id = h.id
+                WHERE (h.streak_broken_date IS NULL OR date(h.streak_broken_date) < ?) {user_filter}
+                GROUP BY h.id
+                HAVING MAX(c.completion_day) < {_CUTOFF_SQL.format(column="h.periodicity")}
+                ORDER BY h.id""",
+            [today.isoformat(), *params, *_cutoff_days(today)]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def sweep_broken_streaks(now=None, chunk_size=SWEEP_CHUNK_SIZE, penalty=STREAK_PENALTY, username=None):
+    """
+    Mark every broken streak as broken and deduct the penalty from the habit's owner.
+
+    Parameters:
+    - now (datetime): Time of the sweep, stored as the streak broken date; now by default.
+    - chunk_size (int): Habits updated per transaction.
+    - penalty (int): Points deducted per broken streak.
+    - username (str): Only sweep this user's habits.
+
+    Returns:
+    - int: The number of habits whose streak was marked broken.
+    """
+    now = now or datetime.now()
+    today = now.date()
+    cutoffs = _cutoff_days(today)
+    habit_ids = find_broken_streaks(today, username)
+    created_at = now.strftime("%Y-%m-%d %H:%M:%S")
+    broken_date = now.strftime("%Y-%m-%d %H:%M:%S.%f")  # The format 'get_habits' parses.
+    broken = 0
+
+    with with_database_connection() as cursor:
+        for start in range(0, len(habit_ids), chunk_size):
+            chunk = habit_ids[start:start + chunk_size]
+            placeholders = ", ".join("?" * len(chunk))
+            if not cursor.connection.in_transaction:
+                cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute(
+                f"""SELECT id, username FROM habits
+                    WHERE id IN ({placeholders})
+                      AND (streak_broken_date IS NULL OR date(streak_broken_date) < ?)
+                      AND (SELECT MAX(completion_day) FROM completions WHERE habit_id = habits.id)
+                          < {_CUTOFF_SQL.format(column="habits.periodicity")}""",
+                [*chunk, today.isoformat(), *cutoffs]
+            )
+            rows = cursor.fetchall()
+            if rows:
+                cursor.execute(
+                    f"UPDATE habits SET streak_broken_date = ?, current_streak = 0 WHERE id IN ({', '.join('?' * len(rows))})",
+                    [broken_date, *(habit_id for habit_id, _ in rows)]
+                )
+            if rows and penalty:
+                cursor.executemany(
+                    "INSERT INTO points_ledger (username, delta, reason, created_at) VALUES (?, ?, 'streak broken', ?)",
+                    [(owner, -penalty, created_at) for _, owner in rows]
+                )
+                cursor.executemany("UPDATE users SET points = points + ? WHERE username = ?",
+                                   [(-penalty * count, owner)
+                                    for owner, count in Counter(owner for _, owner in rows).items()])
+            cursor.connection.commit()
+            broken += len(rows)
+
+            # Let cached copies of the habits pick up the new streak broken date.
+            for habit_id, owner in rows:
+                notify_habit_changed(owner, habit_id)
+    return broken
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mark every broken streak and deduct the streak penalty.")
+    parser.add_argument("--chunk-size", type=int, default=SWEEP_CHUNK_SIZE, help="Habits updated per transaction.")
+    parser.add_argument("--penalty", type=int, default=STREAK_PENALTY, help="Points deducted per broken streak.")
+    parser.add_argument("--user", help="Only sweep this user's habits.")
+    args = parser.parse_args()
+
+    setup_database()
+    broken = sweep_broken_streaks(chunk_size=args.chunk_size, penalty=args.penalty, username=args.user)
+    print(f"Marked {broken} broken streaks.")
+
+
+if __name__ == "__main__":
+    main()
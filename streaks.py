@@ -0,0 +1,299 @@
+from datetime import date
+from database_operations import with_database_connection
+
+# Streak calculations done inside SQLite.
+#
+# Every completion is mapped to an integer period index (day, ISO week or calendar
+# month, depending on the habit's periodicity). Consecutive indexes form a run; the
+# classic "gaps and islands" trick finds runs by subtracting ROW_NUMBER() from the
+# index, which is constant within a run. Only one summary row per habit is returned.
+
+PERIODICITIES = ("daily", "weekly", "monthly")
+
+# Calendar date of a completion, from its stored day ordinal (date.toordinal(), 0001-01-01 is day 1).
+_DATE_SQL = "date(c.completion_day + 1721424.5)"
+
+# Period index of a completion; NULL for unsupported periodicities.
+_PERIOD_SQL = f"""CASE h.periodicity
+        WHEN 'daily' THEN c.completion_day
+        WHEN 'weekly' THEN (c.completion_day - 1) / 7
+        WHEN 'monthly' THEN CAST(strftime('%Y', {_DATE_SQL}) AS INTEGER) * 12
+                            + CAST(strftime('%m', {_DATE_SQL}) AS INTEGER) - 1
+    END"""
+
+_STREAKS_SQL = f"""
+WITH periods AS (
+    SELECT DISTINCT h.id AS habit_id, h.periodicity, {_PERIOD_SQL} AS period
+    FROM habits h JOIN completions c ON c.habit_id = h.id
+    WHERE {{where}}
+),
+islands AS (
+    SELECT habit_id, periodicity, period,
+           period - ROW_NUMBER() OVER (PARTITION BY habit_id ORDER BY period) AS island
+    FROM periods
+    WHERE period IS NOT NULL
+),
+runs AS (
+    SELECT habit_id, periodicity, MIN(period) AS run_start, MAX(period) AS run_end, COUNT(*) AS length
+    FROM islands
+    GROUP BY habit_id, island
+),
+ranked AS (
+    SELECT habit_id, periodicity, length, run_end,
+           ROW_NUMBER() OVER (PARTITION BY habit_id ORDER BY run_end DESC) AS recency,
+           MAX(length) OVER (PARTITION BY habit_id) AS longest
+    FROM runs
+)
+SELECT habit_id, periodicity, length, run_end, longest FROM ranked WHERE recency = 1
+"""
+
+
+def period_index(day, periodicity):
+    """
+    Map a date to the integer index of the period it falls in.
+    Consecutive periods have consecutive indexes.
+
+    Parameters:
+    - day (date): The date to map.
+    - periodicity (str): "daily", "weekly" (ISO weeks, starting Monday) or "monthly" (calendar months).
+
+    Returns:
+    - int: The period index.
+    """
+    if periodicity == "daily":
+        return day.toordinal()
+    elif periodicity == "weekly":
+        return (day.toordinal() - 1) // 7
+    elif periodicity == "monthly":
+        return day.year * 12 + day.month - 1
+    else:
+        raise ValueError(f"Unsupported periodicity: {periodicity}")
+
+
+# The 'StreakSummary' class holds the streak figures computed for one habit.
+class StreakSummary:
+    def __init__(self, habit_id, periodicity, latest_run, last_period, longest, runs=None):
+        self.habit_id = habit_id
+        self.periodicity = periodicity
+        self.latest_run = latest_run    # Length of the most recent run of consecutive periods.
+        self.last_period = last_period  # Period index of the most recent completion.
+        self.longest = longest          # Length of the longest run ever.
+        self.runs = runs                # (first date, last date, length) per run, oldest first, if known.
+
+    def current(self, today=None):
+        # The most recent run only counts as current while it is still alive,
+        # i.e. it ended in the current period or the one before it.
+        today = today or date.today()
+        if self.last_period >= period_index(today, self.periodicity) - 1:
+            return self.latest_run
+        return 0
+
+    def __repr__(self):
+        return (f"StreakSummary(habit_id={self.habit_id}, latest_run={self.latest_run}, "
+                f"last_period={self.last_period}, longest={self.longest})")
+
+
+def summarize_streaks(completion_dates, periodicity, habit_id=None):
+    """
+    Compute a habit's streaks from its completion dates in a single pass.
+
+    Each date is mapped to its period index (see 'period_index'); a run continues
+    while consecutive completions fall in the same or the next period. The dates
+    are only sorted if they are not already in ascending order.
+
+    Parameters:
+    - completion_dates (iterable): The habit's completion dates, duplicates allowed.
+    - periodicity (str): "daily", "weekly" or "monthly".
+    - habit_id (int): Stored on the returned summary.
+
+    Returns:
+    - StreakSummary: The streaks, with 'runs' filled in, or None if there are no completions.
+    """
+    dates = list(completion_dates)
+    if any(earlier > later for earlier, later in zip(dates, dates[1:])):
+        dates.sort()
+
+    runs = []
+    last_period = None
+    for day in dates:
+        period = period_index(day, periodicity)
+        if period == last_period:
+            run_start, _, length = runs[-1]
+            runs[-1] = (run_start, day, length)  # Same period again: only the run's last date moves.
+        elif last_period is not None and period == last_period + 1:
+            run_start, _, length = runs[-1]
+            runs[-1] = (run_start, day, length + 1)
+        else:
+            runs.append((day, day, 1))  # First completion, or the first one after a gap.
+        last_period = period
+
+    if not runs:
+        return None
+    longest = max(length for _, _, length in runs)
+    return StreakSummary(habit_id, periodicity, runs[-1][2], last_period, longest, runs=runs)
+
+
+def _fetch_streaks(cursor, where, params):
+    # Run the streak statement with the given filter on 'habits h'.
+    cursor.execute(_STREAKS_SQL.format(where=where), params)
+    return {row[0]: StreakSummary(*row) for row in cursor.fetchall()}
+
+
+def _query_streaks(where, params):
+    with with_database_connection() as cursor:
+        return _fetch_streaks(cursor, where, params)
+
+
+def _habit_ids_filter(habit_ids):
+    # Build an 'h.id IN (...)' filter for a list of habit IDs.
+    return f"h.id IN ({', '.join('?' * len(habit_ids))})"
+
+
+def get_habit_streak(habit_id):
+    """
+    Compute the streaks of one habit in a single statement.
+
+    Returns:
+    - StreakSummary: The habit's streaks, or None if it has no completions.
+    """
+    return _query_streaks("h.id = ?", (habit_id,)).get(habit_id)
+
+
+def get_user_streaks(username):
+    """
+    Compute the streaks of all of a user's habits in a single statement.
+
+    Returns:
+    - dict: Habit ID -> StreakSummary, for habits that have completions.
+    """
+    return _query_streaks("h.username = ?", (username,))
+
+
+def get_habits_streaks(habit_ids):
+    """
+    Compute the streaks of the given habits in a single statement.
+
+    Returns:
+    - dict: Habit ID -> StreakSummary, for habits that have completions.
+    """
+    habit_ids = list(habit_ids)
+    if not habit_ids:
+        return {}
+    return _query_streaks(_habit_ids_filter(habit_ids), habit_ids)
+
+
+# Streak counters persisted on the 'habits' table.
+#
+# 'current_streak', 'longest_streak' and 'last_period_index' are kept up to date
+# by 'record_completion' whenever a completion is inserted, and 'current_streak'
+# is reset by 'Habit.breakStreak'. Readers can then fetch streaks without
+# touching the completions table. 'rebuild_streak_counters' recomputes them
+# from the full history for repair.
+
+def record_completion(cursor, habit_id, completion_day):
+    """
+    Update a habit's persisted streak counters for one new completion.
+
+    Parameters:
+    - cursor (sqlite3.Cursor): Cursor of the transaction that inserted the completion.
+    - habit_id (int): The completed habit.
+    - completion_day (date): The date of the new completion.
+    """
+    cursor.execute("SELECT periodicity, current_streak, longest_streak, last_period_index FROM habits WHERE id = ?",
+                   (habit_id,))
+    row = cursor.fetchone()
+    if row is None or row[0] not in PERIODICITIES:
+        return
+    periodicity, current, longest, last = row
+    period = period_index(completion_day, periodicity)
+
+    if last is not None and period == last:
+        return  # Another completion in a period that is already counted.
+    elif last is not None and period == last + 1 and current > 0:
+        current += 1  # The run continues into the next period.
+    elif last is None or period > last + 1:
+        current = 1  # First completion, or a new run after a gap.
+    else:
+        # A backdated completion may join or merge earlier runs; recompute this habit.
+        rebuild_streak_counters(cursor, habit_ids=[habit_id])
+        return
+
+    cursor.execute("UPDATE habits SET current_streak = ?, longest_streak = ?, last_period_index = ? WHERE id = ?",
+                   (current, max(longest, current), period, habit_id))
+
+
+def rebuild_streak_counters(cursor, username=None, habit_ids=None, today=None):
+    """
+    Recompute persisted streak counters from the full completion history.
+
+    Parameters:
+    - cursor (sqlite3.Cursor): Cursor to run the statements on.
+    - username (str): Only rebuild this user's habits.
+    - habit_ids (list): Only rebuild these habits. Without a filter every habit is rebuilt.
+    - today (date): Reference date for deciding whether a streak is still current.
+
+    Returns:
+    - int: The number of habits with completions that were updated.
+    """
+    if habit_ids is not None:
+        habit_ids = list(habit_ids)
+        if not habit_ids:
+            return 0
+        where, params = _habit_ids_filter(habit_ids), habit_ids
+    elif username is not None:
+        where, params = "h.username = ?", (username,)
+    else:
+        where, params = "1 = 1", ()
+
+    summaries = _fetch_streaks(cursor, where, params)
+
+    # Reset the counters of every habit in scope, then fill in those that have completions.
+    cursor.execute(f"UPDATE habits AS h SET current_streak = 0, longest_streak = 0, last_period_index = NULL WHERE {where}",
+                   params)
+    cursor.executemany(
+        "UPDATE habits SET current_streak = ?, longest_streak = ?, last_period_index = ? WHERE id = ?",
+        [(summary.current(today), summary.longest, summary.last_period, habit_id)
+         for habit_id, summary in summaries.items()]
+    )
+    return len(summaries)
+
+
+def get_streak_counters(habit_ids, today=None):
+    """
+    Read the persisted streak counters of the given habits.
+
+    Parameters:
+    - habit_ids (iterable): The habits to read.
+    - today (date): Reference day for deciding whether a streak is still alive; today by default.
+
+    Returns:
+    - dict: Habit ID -> (current_streak, longest_streak). The stored current streak is only updated
+      by completions, so it is reported as 0 once its last period is older than the previous one,
+      as in 'StreakSummary.current'.
+    """
+    habit_ids = list(habit_ids)
+    if not habit_ids:
+        return {}
+    today = today or date.today()
+    with with_database_connection() as cursor:
+        cursor.execute(
+            f"""SELECT id, periodicity, current_streak, longest_streak, last_period_index FROM habits h
+                WHERE {_habit_ids_filter(habit_ids)}""",
+            habit_ids
+        )
+        counters = {}
+        for habit_id, periodicity, current, longest, last_period in cursor.fetchall():
+            if periodicity in PERIODICITIES and (last_period is None
+                                                 or last_period < period_index(today, periodicity) - 1):
+                current = 0
+            counters[habit_id] = (current, longest)
+        return counters
+
+
+if __name__ == "__main__":
+    # Repair command: python streaks.py [username]
+    import sys
+
+    with with_database_connection() as cursor:
+        rebuilt = rebuild_streak_counters(cursor, username=sys.argv[1] if len(sys.argv) > 1 else None)
+    print(f"Rebuilt streak counters for {rebuilt} habits.")
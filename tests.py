@@ -1,10 +1,35 @@
-from models import User, Habit, Analytics, Reward, Reminder
+from models import User, Habit, Analytics, Reward, Reminder, SessionManager
 from unittest.mock import patch, Mock, MagicMock
 from cli import main_cli
+import asyncio
+import csv
+import gzip
+import http.client
+import json
+import threading
+import time
+import os
+import pytest
 import sqlite3
-from datetime import datetime, timedelta
-from database_operations import setup_test_environment, with_database_connection
-from habit_operations import add_habit, get_habits, habit_exists_for_user, delete_habit, mark_habit_complete
+import tempfile
+from datetime import date, datetime, timedelta
+from database_operations import setup_test_environment, with_database_connection, close_connection_pool, get_connection_pool, ConnectionPool, configure_connection_pool, setup_database
+from migrations import LATEST_VERSION
+from config import load_storage_settings
+from points_ledger import PointsLedger, points_ledger, rebuild_points_balances
+from vectorized_analytics import VectorizedAnalytics, np
+from async_service import AsyncHabitService
+from server import HabitServer
+from reminder_scheduler import ReminderScheduler, advance_fire_time
+from benchmarks import run_benchmarks, compare_to_baseline, parse_size
+from data_export import export_records, iter_records
+from data_import import import_completions
+from rollups import rebuild_rollups, completion_rates, best_week, completion_trend
+from calendars import load_calendars
+from streak_sweeper import find_broken_streaks, sweep_broken_streaks
+from query_instrumentation import enable_query_instrumentation, disable_query_instrumentation, get_query_summaries, query_action
+from streaks import get_habit_streak, get_user_streaks, get_streak_counters, rebuild_streak_counters, summarize_streaks
+from habit_operations import add_habit, get_habits, habit_exists_for_user, delete_habit, mark_habit_complete, mark_habits_complete_bulk, get_habits_with_completions, get_reminders_for_habits
 
 
 def setup_environment(username="testuser", password="testpass"):
@@ -16,6 +41,9 @@ def setup_environment(username="testuser", password="testpass"):
     - password (str): The password for the test user.
     """
 
+    # Make sure the database schema is current before touching any tables.
+    setup_database()
+
     # First, make sure there's no leftover data from previous tests for this user.
     teardown_test_environment(username)
     
@@ -37,6 +65,9 @@ def teardown_test_environment(username="testuser"):
     - username (str): The username for which the data should be removed.
     """
     
+    # Write points changes still waiting in the ledger, so they cannot leak into the next test.
+    points_ledger.flush()
+
     # Using the custom context manager 'with_database_connection' to handle database operations.
     with with_database_connection() as cursor:
         
@@ -49,6 +80,7 @@ def teardown_test_environment(username="testuser"):
         # Delete all habits and the user account associated with the given username.
         cursor.execute("DELETE FROM habits WHERE username=?", (username,))
         cursor.execute("DELETE FROM users WHERE username=?", (username,))
+        cursor.execute("DELETE FROM points_ledger WHERE username=?", (username,))
         
         # Print a message indicating the end of the cleanup process for the specified username.
         print(f"Cleanup for {username} complete!")
@@ -651,9 +683,13 @@ def test_create_and_delete_habit():
 
         mock_cursor.execute.side_effect = side_effect
 
-        # Mock the sqlite3.connect function to return our mock connection
+        # Mock the sqlite3.connect function to return our mock connection.
+        # The pool is emptied first so that a new (mocked) connection is opened,
+        # and again afterwards so the mock is not handed out to later tests.
+        close_connection_pool()
         with patch('sqlite3.connect', return_value=mock_conn):
             delete_habit(username, habit_title)
+        close_connection_pool()
 
     # Check mock calls here
     print(mock_cursor.execute.call_args_list)
@@ -667,12 +703,1164 @@ def test_create_and_delete_habit():
 
         
     
+def test_connection_pool_reuses_connections():
+    """
+    Test that the connection pool hands back the same connection instead of reconnecting.
+    """
+    pool = ConnectionPool("habits.db", max_size=1)
+
+    # A released connection should be reused by the next acquire.
+    first = pool.acquire()
+    pool.release(first)
+    second = pool.acquire()
+    assert second is first
+
+    # Connections released beyond the pool size are closed instead of kept.
+    third = pool.acquire()
+    pool.release(second)
+    pool.release(third)
+    with patch('sqlite3.connect') as mock_connect:
+        assert pool.acquire() is first
+        mock_connect.assert_not_called()
+
+    pool.close()
+
+    # A block that raises must roll back the statements it already ran.
+    try:
+        with with_database_connection() as cursor:
+            cursor.execute("INSERT INTO users (username, password) VALUES (?, ?)", ("rollbackuser", "pw"))
+            raise ValueError("fail partway through")
+    except ValueError:
+        pass
+    with with_database_connection() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM users WHERE username = ?", ("rollbackuser",))
+        assert cursor.fetchone()[0] == 0
+
+
+def test_schema_migrations():
+    """
+    Test that migrations create indexes on a fresh database and are skipped once current.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        configure_connection_pool(path=os.path.join(tmp_dir, "fresh.db"))
+        try:
+            # The first run applies every migration.
+            assert setup_database() == LATEST_VERSION
+            with with_database_connection() as cursor:
+                cursor.execute("SELECT name FROM sqlite_master WHERE type='index'")
+                indexes = {row[0] for row in cursor.fetchall()}
+            assert "idx_completions_habit_day" in indexes
+            assert "idx_habits_username_title" in indexes
+
+            # A second run must not execute any DDL.
+            migration = Mock()
+            with patch('migrations.MIGRATIONS', [(LATEST_VERSION, migration)]):
+                assert setup_database() == LATEST_VERSION
+            migration.assert_not_called()
+        finally:
+            configure_connection_pool()
+
+
+def test_storage_settings():
+    """
+    Test that storage settings come from presets and environment variables and are applied to connections.
+    """
+    environ = {"HABITS_CONFIG": "", "HABITS_DB_PRESET": "throughput", "HABITS_DB_BUSY_TIMEOUT": "1234"}
+    settings = load_storage_settings(environ)
+    assert settings.journal_mode == "WAL"
+    assert settings.temp_store == "MEMORY"
+    assert settings.busy_timeout == 1234
+
+    # Invalid pragma values are rejected instead of being formatted into SQL.
+    try:
+        load_storage_settings({"HABITS_CONFIG": "", "HABITS_DB_SYNCHRONOUS": "sometimes"})
+        assert False, "Invalid synchronous level was accepted"
+    except ValueError:
+        pass
+
+    # New connections get the configured pragmas.
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        settings.path = os.path.join(tmp_dir, "settings.db")
+        pool = ConnectionPool.from_settings(settings)
+        connection = pool.acquire()
+        assert connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert connection.execute("PRAGMA busy_timeout").fetchone()[0] == 1234
+        pool.release(connection)
+        pool.close()
+
+
+def test_mark_habits_complete_bulk():
+    """
+    Test that bulk completions are inserted in chunks and points are awarded in aggregate.
+    """
+    setup_environment()
+    add_habit("testuser", "Daily Walk", "Walk for 30 minutes.", "daily", None)
+    habit = get_habits("testuser", None)[0]
+
+    # Three completions written with a chunk size of two, i.e. in two transactions.
+    start = datetime(2023, 7, 25).date()
+    records = [(habit.habit_id, start + timedelta(days=i)) for i in range(3)]
+    assert mark_habits_complete_bulk(records, chunk_size=2) == 3
+
+    with with_database_connection() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM completions WHERE habit_id=?", (habit.habit_id,))
+        assert cursor.fetchone()[0] == 3
+    assert Reward("testuser").points == 30
+
+    # When a later chunk fails, the chunks already committed have their streak counters.
+    def failing_records():
+        yield habit.habit_id, start + timedelta(days=3)
+        yield habit.habit_id, start + timedelta(days=4)
+        raise ValueError("broken input")
+    try:
+        mark_habits_complete_bulk(failing_records(), chunk_size=2)
+        assert False, "The failing chunk did not raise"
+    except ValueError:
+        pass
+    with with_database_connection() as cursor:
+        cursor.execute("SELECT longest_streak FROM habits WHERE id=?", (habit.habit_id,))
+        assert cursor.fetchone()[0] == 5
+
+    teardown_test_environment()
+
+
+def test_login_hydrates_habits():
+    """
+    Test that login loads habits with their completions without per-habit queries.
+    """
+    setup_environment()
+    add_habit("testuser", "Daily Walk", "Walk for 30 minutes.", "daily", None)
+    add_habit("testuser", "Read Book", "Read for 1 hour.", "daily", None)
+    habit = get_habits("testuser", None)[0]
+    mark_habit_complete(habit.habit_id, datetime.now().date())
+    mark_habit_complete(habit.habit_id, (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S'))
+
+    user = User("testuser", "testpass")
+    with patch.object(Habit, 'populate_completion_dates') as mock_populate:
+        assert user.login()
+        mock_populate.assert_not_called()
+    assert user.reward.points == 0
+
+    # Both completion formats are grouped onto the right habit; the other habit has none.
+    habits = get_habits_with_completions("testuser", user)
+    assert [len(h.completion_dates) for h in habits] == [2, 0]
+    assert max(habits[0].completion_dates) == datetime.now().date()
+
+    assert not User("testuser", "wrongpass").login()
+    teardown_test_environment()
+
+
+def test_sql_streaks():
+    """
+    Test the SQL streak engine for daily, weekly and monthly habits.
+    """
+    setup_environment()
+    add_habit("testuser", "Daily Walk", "Walk for 30 minutes.", "daily", None)
+    add_habit("testuser", "Meditation", "Meditate on the weekend.", "weekly", None)
+    add_habit("testuser", "Learn Words", "Learn 50 words.", "monthly", None)
+    daily, weekly, monthly = get_habits("testuser", None)
+
+    # Daily: a run of 3 days, a gap, then a run of 2 days (one day completed twice).
+    start = datetime(2023, 7, 1)
+    for offset in [0, 1, 2, 4, 5, 5]:
+        mark_habit_complete(daily.habit_id, (start + timedelta(days=offset)).strftime('%Y-%m-%d %H:%M:%S'))
+    # Weekly: Sunday and the following Monday are consecutive ISO weeks.
+    for day in ["2023-07-02", "2023-07-03", "2023-07-12"]:
+        mark_habit_complete(weekly.habit_id, day)
+    # Monthly: 31 January and 1 February are consecutive calendar months.
+    for day in ["2023-01-31", "2023-02-01", "2023-04-15"]:
+        mark_habit_complete(monthly.habit_id, day)
+
+    summary = get_habit_streak(daily.habit_id)
+    assert (summary.latest_run, summary.longest) == (2, 3)
+    assert summary.current(datetime(2023, 7, 7).date()) == 2
+    assert summary.current(datetime(2023, 7, 9).date()) == 0
+
+    streaks = get_user_streaks("testuser")
+    assert (streaks[weekly.habit_id].latest_run, streaks[weekly.habit_id].longest) == (3, 3)
+    assert (streaks[monthly.habit_id].latest_run, streaks[monthly.habit_id].longest) == (1, 2)
+    # The stored counter holds the latest run, but it is only current while the run is alive.
+    assert get_streak_counters([daily.habit_id], today=datetime(2023, 7, 7).date())[daily.habit_id] == (2, 3)
+    assert daily.getStreak() == 0
+
+    teardown_test_environment()
+
+
+def test_streak_counters():
+    """
+    Test that streak counters are maintained on insert and agree with a full rebuild.
+    """
+    setup_environment()
+    add_habit("testuser", "Daily Walk", "Walk for 30 minutes.", "daily", None)
+    habit = get_habits("testuser", None)[0]
+    today = datetime.now().date()
+
+    # Completions today, two days ago, then a backdated one that joins both into one run.
+    mark_habit_complete(habit.habit_id, today)
+    mark_habit_complete(habit.habit_id, today - timedelta(days=2))
+    assert get_streak_counters([habit.habit_id])[habit.habit_id] == (1, 1)
+    mark_habit_complete(habit.habit_id, today - timedelta(days=1))
+    assert get_streak_counters([habit.habit_id])[habit.habit_id] == (3, 3)
+    assert habit.getStreak() == 3
+
+    # A full rebuild must produce the same counters.
+    with with_database_connection() as cursor:
+        rebuild_streak_counters(cursor, username="testuser")
+    assert get_streak_counters([habit.habit_id])[habit.habit_id] == (3, 3)
+
+    # Once a period without a completion has passed, the stored streak is no longer current.
+    assert get_streak_counters([habit.habit_id], today=today + timedelta(days=1))[habit.habit_id] == (3, 3)
+    assert get_streak_counters([habit.habit_id], today=today + timedelta(days=2))[habit.habit_id] == (0, 3)
+    add_habit("testuser", "Old Habit", "Completed long ago.", "weekly", None)
+    old = next(h for h in get_habits("testuser", None) if h.title == "Old Habit")
+    mark_habit_complete(old.habit_id, today - timedelta(days=60))
+    assert get_streak_counters([old.habit_id])[old.habit_id] == (0, 1)
+    assert old.getStreak() == 0
+
+    teardown_test_environment()
+
+
+def test_vectorized_analytics():
+    """
+    Test that the NumPy backend agrees with the SQL streak engine.
+    """
+    if np is None:
+        pytest.skip("NumPy is not installed; the vectorized analytics backend is untested.")
+
+    setup_environment()
+    add_habit("testuser", "Daily Walk", "Walk for 30 minutes.", "daily", None)
+    add_habit("testuser", "Meditation", "Meditate on the weekend.", "weekly", None)
+    add_habit("testuser", "Never Done", "No completions yet.", "monthly", None)
+    daily, weekly, never = get_habits("testuser", None)
+
+    today = datetime.now().date()
+    for offset in [0, 1, 2, 5, 6, 7, 8, 8]:
+        mark_habit_complete(daily.habit_id, today - timedelta(days=offset))
+    for offset in [0, 7, 21]:
+        mark_habit_complete(weekly.habit_id, today - timedelta(days=offset))
+
+    analytics = VectorizedAnalytics.for_user("testuser")
+    streaks = analytics.streaks(today)
+    sql_streaks = get_user_streaks("testuser")
+    for position, habit_id in enumerate(analytics.arrays.habit_ids.tolist()):
+        summary = sql_streaks.get(habit_id)
+        assert streaks["longest"][position] == (summary.longest if summary else 0)
+        assert streaks["current"][position] == (summary.current(today) if summary else 0)
+
+    # Eight completions on seven distinct days; the weekday histogram counts distinct days.
+    report = analytics.report(today)
+    assert sum(report[daily.habit_id]["weekday_histogram"]) == 7
+    assert report[never.habit_id]["completion_rate"] == 0.0
+    assert Analytics([daily, weekly, never], backend="numpy").getLongestStreakAllHabits() == 4
+
+    teardown_test_environment()
+
+
+def test_summarize_streaks():
+    """
+    Test the single-pass streak engine with calendar-aware periods.
+    """
+    day = lambda text: datetime.strptime(text, "%Y-%m-%d").date()
+
+    # Unsorted daily dates with a duplicate: runs of 3 and 2 days.
+    dates = [day("2023-07-05"), day("2023-07-01"), day("2023-07-02"), day("2023-07-03"), day("2023-07-06"), day("2023-07-02")]
+    summary = summarize_streaks(dates, "daily")
+    assert (summary.latest_run, summary.longest) == (2, 3)
+    assert summary.runs == [(day("2023-07-01"), day("2023-07-03"), 3), (day("2023-07-05"), day("2023-07-06"), 2)]
+
+    # Calendar months: 31 January and 1 February are consecutive, although only one day apart.
+    summary = summarize_streaks([day("2023-01-31"), day("2023-02-01"), day("2023-03-31")], "monthly")
+    assert (summary.latest_run, summary.longest) == (3, 3)
+
+    assert summarize_streaks([], "weekly") is None
+
+    # The habit and analytics views agree with the engine.
+    habit = Habit(1, "Daily Walk", "Walk for 30 minutes.", "daily", None)
+    habit.completion_dates = dates
+    assert habit.getLongestStreak() == 3
+    analytics = Analytics([habit])
+    analytics.getStreakSummaries()
+    assert analytics.getLongestStreakAllHabits() == 3
+    assert analytics.getLongestStreakForHabit(None, "Daily Walk") == 3
+
+
+def test_canonical_completion_migration():
+    """
+    Test that upgrading an old database rewrites mixed completion dates to the canonical form.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "old.db")
+
+        # Build a database the way the original 'setup_database' did, with mixed date formats.
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE users (username TEXT PRIMARY KEY, password TEXT, points INTEGER DEFAULT 0)")
+        conn.execute("""CREATE TABLE habits (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT, title TEXT,
+                        description TEXT, periodicity TEXT, creation_date DATETIME, streak_broken_date DATETIME DEFAULT NULL)""")
+        conn.execute("CREATE TABLE completions (id INTEGER PRIMARY KEY AUTOINCREMENT, habit_id INTEGER, completion_date DATETIME)")
+        conn.execute("INSERT INTO habits (username, title, periodicity) VALUES ('olduser', 'Run', 'daily')")
+        conn.executemany("INSERT INTO completions (habit_id, completion_date) VALUES (1, ?)",
+                         [("2023-07-25",), ("2023-07-26 08:15:00",), ("2023-07-27 21:00:00.123456",)])
+        conn.commit()
+        conn.close()
+
+        configure_connection_pool(path=path)
+        try:
+            setup_database()
+            with with_database_connection() as cursor:
+                cursor.execute("SELECT completion_date, completion_day FROM completions ORDER BY id")
+                rows = cursor.fetchall()
+                cursor.execute("SELECT longest_streak, current_streak FROM habits WHERE id = 1")
+                counters = cursor.fetchone()
+
+                # Raw inserts without a day are normalized by the trigger.
+                cursor.execute("INSERT INTO completions (habit_id, completion_date) VALUES (1, '2023-07-28')")
+                cursor.execute("SELECT completion_date, completion_day FROM completions WHERE id = ?", (cursor.lastrowid,))
+                raw_row = cursor.fetchone()
+        finally:
+            configure_connection_pool()
+
+    first_day = datetime(2023, 7, 25).toordinal()
+    assert rows == [("2023-07-25 00:00:00", first_day), ("2023-07-26 08:15:00", first_day + 1),
+                    ("2023-07-27 21:00:00", first_day + 2)]
+    assert raw_row == ("2023-07-28 00:00:00", first_day + 3)
+    assert counters == (3, 0)  # The backfilled run ended in 2023, so it is no longer current.
+
+
+def test_habit_lazy_completion_history():
+    """
+    Test that a habit's completion history is loaded lazily into a compact array.
+    """
+    setup_environment()
+    add_habit("testuser", "Daily Walk", "Walk for 30 minutes.", "daily", None)
+    habit = get_habits("testuser", None)[0]
+    mark_habit_complete(habit.habit_id, "2023-07-26")
+    mark_habit_complete(habit.habit_id, "2023-07-25 10:00:00")
+
+    # Nothing is loaded until the history is first used.
+    assert not hasattr(habit, "__dict__")
+    assert habit._completion_days is None
+    assert list(habit.completion_days) == [datetime(2023, 7, 25).toordinal(), datetime(2023, 7, 26).toordinal()]
+    assert habit.completion_days.typecode == 'i'
+    assert habit.completion_dates[-1] == datetime(2023, 7, 26).date()
+
+    teardown_test_environment()
+
+
+def test_habit_repository():
+    """
+    Test that the habit repository serves repeated lookups from memory and invalidates on writes.
+    """
+    setup_environment()
+    user = User("testuser", "testpass")
+    add_habit("testuser", "Daily Walk", "Walk for 30 minutes.", "daily", None)
+    habit = user.get_habit_by_title("Daily Walk")
+
+    # Repeated lookups return the same object without querying again.
+    with patch('habit_repository.get_habits') as mock_get_habits:
+        assert user.get_habit_by_title("Daily Walk") is habit
+        assert user.getHabits() == [habit]
+        mock_get_habits.assert_not_called()
+
+    # Adding a habit invalidates the list; existing habits keep their identity.
+    add_habit("testuser", "Read Book", "Read for 1 hour.", "daily", None)
+    assert [h.title for h in user.getHabits()] == ["Daily Walk", "Read Book"]
+    assert user.get_habit_by_title("Daily Walk") is habit
+
+    # Completing a habit reloads only its completion history.
+    assert len(habit.completion_days) == 0
+    mark_habit_complete(habit.habit_id, "2023-07-25")
+    assert len(habit.completion_days) == 1
+
+    # Writes to another user's habits do not reach this user's repository.
+    with patch.object(user.habits, 'habit_changed') as mock_changed:
+        add_habit("otheruser", "Swim", "Swim 1 km.", "daily", None)
+        mark_habit_complete(get_habits("otheruser", None)[0].habit_id, "2023-07-25")
+        mock_changed.assert_not_called()
+
+    delete_habit("testuser", "Read Book")
+    assert user.get_habit_by_title("Read Book") is None
+    delete_habit("otheruser", "Swim")
+
+    teardown_test_environment()
+
+
+def test_points_ledger():
+    """
+    Test that point awards are batched in the ledger and balances can be rebuilt from it.
+    """
+    setup_environment()
+    ledger = PointsLedger(flush_interval=3600)
+
+    # Inside a unit of work nothing is written until the block ends.
+    with ledger.unit_of_work():
+        for _ in range(5):
+            ledger.record("testuser", 10, "habit completed")
+        ledger.record("testuser", -10, "streak broken")
+        assert ledger.pending_points("testuser") == 40
+        assert Reward("testuser", points=None).points == 0
+
+    with with_database_connection() as cursor:
+        cursor.execute("SELECT points FROM users WHERE username=?", ("testuser",))
+        assert cursor.fetchone()[0] == 40
+        cursor.execute("SELECT COUNT(*), SUM(delta) FROM points_ledger WHERE username=?", ("testuser",))
+        assert cursor.fetchone() == (6, 40)
+
+        # A corrupted cached balance is repaired from the ledger.
+        cursor.execute("UPDATE users SET points = 999 WHERE username=?", ("testuser",))
+    rebuild_points_balances("testuser")
+    assert Reward("testuser").points == 40
+
+    # Rewards made through the shared ledger are visible before they are flushed.
+    reward = Reward("testuser")
+    with points_ledger.unit_of_work():
+        reward.reward_for_habit_completion(None)
+        assert Reward("testuser").points == 50
+
+        # Logging in again also counts the points still waiting in the ledger.
+        user = User("testuser", "testpass")
+        assert user.login() and user.reward.points == 50
+
+    # A flush that fails halfway writes nothing, so retrying it records each entry once.
+    ledger = PointsLedger(flush_interval=3600)
+    ledger.record("testuser", 5, "bonus")
+    with with_database_connection() as cursor:
+        cursor.execute("""CREATE TRIGGER fail_points_update BEFORE UPDATE OF points ON users
+                          BEGIN SELECT RAISE(ABORT, 'simulated failure'); END""")
+    try:
+        ledger.flush()
+        assert False, "The simulated failure did not happen"
+    except sqlite3.IntegrityError:
+        pass
+    finally:
+        with with_database_connection() as cursor:
+            cursor.execute("DROP TRIGGER fail_points_update")
+    assert ledger.flush() == 1
+    with with_database_connection() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM points_ledger WHERE username = ? AND reason = 'bonus'", ("testuser",))
+        assert cursor.fetchone()[0] == 1
+    assert Reward("testuser").points == 55
+
+    # An idle ledger is flushed by its timer, without another record, flush or exit.
+    ledger = PointsLedger(flush_interval=0.05)
+    ledger.record("testuser", 1, "bonus")
+    deadline = time.monotonic() + 5
+    while ledger.pending_points("testuser") and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert ledger.pending_points("testuser") == 0
+    assert Reward("testuser").points == 56
+
+    # Recording and reading pending points do not wait for a write in progress.
+    ledger = PointsLedger(flush_interval=3600)
+    ledger.record("testuser", 2, "bonus")
+    writing, release = threading.Event(), threading.Event()
+
+    def slow_connection():
+        writing.set()
+        release.wait(5)
+        return with_database_connection()
+    with patch('points_ledger.with_database_connection', side_effect=slow_connection):
+        flusher = threading.Thread(target=ledger.flush)
+        flusher.start()
+        assert writing.wait(5)
+        started = time.monotonic()
+        ledger.record("testuser", 3, "bonus")
+        assert ledger.pending_points("testuser") == 5
+        assert time.monotonic() - started < 1
+        release.set()
+        flusher.join()
+    assert ledger.pending_points("testuser") == 3
+    assert ledger.flush() == 1
+    assert Reward("testuser").points == 61
+
+    # A failing automatic flush is logged, and the recorded change is kept for the next flush.
+    ledger = PointsLedger(flush_interval=3600, max_pending=1)
+    with with_database_connection() as cursor:
+        cursor.execute("""CREATE TRIGGER fail_points_update BEFORE UPDATE OF points ON users
+                          BEGIN SELECT RAISE(ABORT, 'simulated failure'); END""")
+    try:
+        with patch('points_ledger.logger') as mock_logger:
+            ledger.record("testuser", 4, "bonus")
+            mock_logger.exception.assert_called_once()
+        assert ledger.pending_points("testuser") == 4
+    finally:
+        with with_database_connection() as cursor:
+            cursor.execute("DROP TRIGGER fail_points_update")
+    assert ledger.flush() == 1
+    assert Reward("testuser").points == 65
+
+    teardown_test_environment()
+
+
+def test_async_habit_service():
+    """
+    Test the asyncio service API: concurrent reads alongside serialized writes.
+    """
+    setup_environment()
+
+    async def scenario():
+        async with AsyncHabitService(max_readers=2) as service:
+            assert await service.login("testuser", "wrongpass") is None
+            user = await service.login("testuser", "testpass")
+            assert user is not None
+
+            # Writes queued together are applied one after another.
+            added = await asyncio.gather(*(service.add_habit(user, f"Async {i}", "desc", "daily") for i in range(3)))
+            assert added == [True, True, True]
+            assert await service.add_habit(user, "Async 0", "desc", "daily") is False
+
+            # Concurrent adds of the same title create exactly one habit.
+            added = await asyncio.gather(*(service.add_habit(user, "Duplicate", "desc", "daily") for _ in range(8)))
+            assert added.count(True) == 1
+            with with_database_connection() as cursor:
+                cursor.execute("SELECT COUNT(*) FROM habits WHERE username = 'testuser' AND title = 'Duplicate'")
+                assert cursor.fetchone()[0] == 1
+            assert await service.delete_habit(user, "Duplicate") is not None
+
+            # Readers run concurrently and all see the committed habits.
+            listings = await asyncio.gather(*(service.list_habits(user) for _ in range(4)))
+            assert all(len(habits) == 3 for habits in listings)
+
+            # Listed habits arrive with their history, so the event loop never loads it.
+            with patch.object(Habit, 'populate_completion_dates') as mock_populate:
+                assert all(len(habit.completion_days) == 0 for habit in listings[0])
+                mock_populate.assert_not_called()
+
+            # Background ledger flushes are queued on the writer.
+            assert points_ledger.flush_executor is service._writer
+            with patch.object(service._writer, 'submit') as mock_submit:
+                points_ledger._flush_on_timer()
+                mock_submit.assert_called_once_with(points_ledger._flush_in_background)
+
+            habit = listings[0][0]
+            assert await service.complete_habit(user, habit.habit_id) == 10
+            assert await service.complete_habit(user, -1) is None
+
+            summary = await service.analytics(user)
+            assert summary["total_habits"] == 3
+            assert summary["daily"] == 3
+            assert summary["longest_streak_by_habit"][habit.title] == 1
+            assert summary["points"] == 10
+
+            assert await service.delete_habit(user, "Async 2") is not None
+            assert await service.delete_habit(user, "Async 2") is None
+            assert len(await service.list_habits(user)) == 2
+
+    asyncio.run(scenario())
+    assert points_ledger.flush_executor is None
+    teardown_test_environment()
+
+
+def test_http_server():
+    """
+    Test the JSON endpoints and token sessions of the HTTP server.
+    """
+    setup_environment()
+    server = HabitServer(("127.0.0.1", 0), quiet=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def request(method, path, body=None, token=None):
+        connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1])
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        connection.request(method, path, json.dumps(body) if body is not None else None, headers)
+        response = connection.getresponse()
+        payload = json.loads(response.read())
+        connection.close()
+        return response.status, payload
+
+    try:
+        assert request("GET", "/habits")[0] == 401
+        assert request("POST", "/login", {"username": "testuser", "password": "nope"})[0] == 401
+        status, login = request("POST", "/login", {"username": "testuser", "password": "testpass"})
+        assert status == 200
+        token = login["token"]
+
+        status, created = request("POST", "/habits", {"title": "Read", "description": "20 pages", "periodicity": "daily"}, token)
+        assert status == 201 and created["habit"]["title"] == "Read"
+        assert request("POST", "/habits", {"title": "Read", "periodicity": "daily"}, token)[0] == 409
+        assert request("POST", "/habits", {"title": "Bad", "periodicity": "hourly"}, token)[0] == 400
+        assert request("POST", "/habits", {"title": ["x"], "periodicity": "daily"}, token)[0] == 400
+        assert request("POST", "/habits", {"title": "Bad", "periodicity": "daily", "reminder_time": "25:99"}, token)[0] == 400
+        assert request("POST", "/habits", {"title": "Bad", "periodicity": "daily", "reminder_time": {}}, token)[0] == 400
+        assert request("POST", "/register", {"username": ["x"], "password": "pw"})[0] == 400
+        assert request("POST", "/register", {"username": 42, "password": "pw"})[0] == 400
+        assert request("POST", "/login", {"username": {"x": 1}, "password": "pw"})[0] == 400
+
+        habit_id = created["habit"]["id"]
+        with with_database_connection() as cursor:
+            cursor.execute("SELECT creation_date FROM habits WHERE id = ?", (habit_id,))
+            assert created["habit"]["creation_date"] == cursor.fetchone()[0]
+        assert request("POST", f"/habits/{habit_id}/complete", {"completion_date": "not a date"}, token)[0] == 400
+        assert request("POST", f"/habits/{habit_id}/complete", {"completion_date": 20240101}, token)[0] == 400
+        assert request("POST", f"/habits/{habit_id}/complete", {"completion_date": ["2024-01-01"]}, token)[0] == 400
+        assert request("POST", f"/habits/{habit_id}/complete", {}, token) == (200, {"points": 10})
+
+        # Concurrent clients share the session and see the same habits.
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(request("GET", "/habits", token=token)))
+                   for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert all(status == 200 and payload["habits"][0]["current_streak"] == 1 for status, payload in results)
+
+        status, summary = request("GET", "/analytics", token=token)
+        assert summary["total_habits"] == 1 and summary["longest_streak_by_habit"] == {"Read": 1}
+        assert request("GET", "/rewards", token=token) == (200, {"points": 10})
+
+        # Rejected requests still consume their body, so a kept-alive connection stays in sync.
+        smuggled = "GET /smuggled HTTP/1.1\r\nHost: localhost\r\n\r\n"
+        connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1])
+        try:
+            for method, path, body, headers, expected in (
+                    ("POST", "/nope", smuggled, {}, 404),
+                    ("GET", "/login", smuggled, {}, 405),
+                    ("PUT", "/habits", smuggled, {}, 405),
+                    ("PATCH", "/nope", smuggled, {}, 405),
+                    ("POST", "/logout", json.dumps({"padding": smuggled}), {}, 401),
+                    ("GET", "/habits", None, {"Authorization": f"Bearer {token}"}, 200)):
+                connection.request(method, path, body, headers)
+                response = connection.getresponse()
+                response.read()
+                assert response.status == expected
+                if expected == 405:
+                    assert response.getheader("Content-Type") == "application/json"
+                    assert response.getheader("Allow") == ("POST" if method == "GET" else "DELETE, GET, POST")
+        finally:
+            connection.close()
+
+        assert request("DELETE", "/habits/Read", token=token) == (200, {"deleted": habit_id})
+        assert request("DELETE", "/habits/Read", token=token)[0] == 404
+        assert request("POST", "/logout", token=token)[0] == 200
+        assert request("GET", "/habits", token=token)[0] == 401
+    finally:
+        server.shutdown()
+        server.server_close()
+    teardown_test_environment()
+
+
+def test_session_manager():
+    """
+    Test that sessions use real user IDs, expire when idle, are capped in number, and release caches.
+    """
+    setup_environment()
+    setup_environment("otheruser", "otherpass")
+    now = [0.0]
+    sessions = SessionManager(idle_ttl=60, max_sessions=1, clock=lambda: now[0])
+    evicted = []
+    sessions.add_eviction_hook(evicted.append)
+
+    user = User("testuser", "testpass")
+    try:
+        sessions.start_session(user)
+        assert False, "A user without an ID was given a session"
+    except ValueError:
+        pass
+
+    assert user.login() and user.user_id is not None
+    other = User("otheruser", "otherpass")
+    assert other.login() and other.user_id != user.user_id
+
+    token = sessions.start_session(user)
+    assert sessions.get_user_for_token(token) is user
+    assert sessions.get_active_user(user.user_id) is user
+    user.getHabits()
+    assert user.habits._by_id is not None
+
+    # Idle sessions expire, and their caches are dropped.
+    now[0] = 61
+    assert sessions.get_user_for_token(token) is None
+    assert evicted == [user] and user.habits._by_id is None and user._reward is None
+
+    # Starting a session beyond the capacity evicts the least recently used one.
+    token = sessions.start_session(user)
+    other_token = sessions.start_session(other)
+    assert len(sessions) == 1
+    assert sessions.get_user_for_token(token) is None
+    assert sessions.get_user_for_token(other_token) is other
+    assert evicted == [user, user]
+
+    sessions.end_session_for_token(other_token)
+    assert len(sessions) == 0 and sessions.tokens == {}
+    assert evicted[-1] is other
+
+    teardown_test_environment("otheruser")
+    teardown_test_environment()
+
+
+def test_reminder_scheduler():
+    """
+    Test that due reminders fire to the sink and their next fire times are advanced and persisted.
+    """
+    assert advance_fire_time(datetime(2026, 1, 31, 9, 0), "monthly") == datetime(2026, 2, 28, 9, 0)
+    assert advance_fire_time(datetime(2026, 1, 31, 9, 0), "weekly") == datetime(2026, 2, 7, 9, 0)
+    reminder = Reminder(None, "9:00 AM", "daily", nextFireAt=datetime(2026, 3, 1, 9, 0))
+    assert reminder.resetReminder() == datetime(2026, 3, 2, 9, 0)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        configure_connection_pool(path=os.path.join(tmp_dir, "reminders.db"))
+        try:
+            setup_database()
+            add_habit("testuser", "Stretch", "desc", "daily", Reminder(None, "13:00", "daily"))
+            add_habit("testuser", "Review", "desc", "weekly", Reminder(None, "9:30 PM", "weekly"))
+            add_habit("testuser", "Broken", "desc", "daily", Reminder(None, "whenever", "daily"))
+
+            now = [datetime(2026, 1, 5, 12, 0).timestamp()]
+            fired = []
+            scheduler = ReminderScheduler(sink=fired.append, window=600, batch_size=2, clock=lambda: now[0])
+
+            # New reminders are scheduled in batches, so no more than a batch is held in memory.
+            write_sizes = []
+            flush_updates = scheduler._flush
+            def recording_flush(cursor):
+                write_sizes.append(len(scheduler._updates))
+                flush_updates(cursor)
+            with patch.object(scheduler, '_flush', side_effect=recording_flush):
+                assert scheduler.run_pending() == 0
+            assert max(write_sizes) == 2 and sum(write_sizes) == 3
+
+            now[0] = datetime(2026, 1, 5, 13, 0).timestamp()
+            assert scheduler.run_pending() == 1
+            assert fired[0].title == "Stretch" and fired[0].fire_at == datetime(2026, 1, 5, 13, 0)
+
+            # After three days of downtime the missed occurrences fire once, not three times.
+            now[0] = datetime(2026, 1, 8, 22, 0).timestamp()
+            assert scheduler.run_pending() == 2
+            assert sorted(reminder.title for reminder in fired[1:]) == ["Review", "Stretch"]
+
+            with with_database_connection() as cursor:
+                cursor.execute("""SELECT h.title, r.next_fire_at FROM reminders r JOIN habits h ON h.id = r.habit_id
+                                  ORDER BY h.title""")
+                next_fire = dict(cursor.fetchall())
+            assert next_fire["Stretch"] == datetime(2026, 1, 9, 13, 0).timestamp()
+            assert next_fire["Review"] == datetime(2026, 1, 12, 21, 30).timestamp()
+            assert next_fire["Broken"] == 0
+        finally:
+            configure_connection_pool()
+
+
+def test_batched_reminder_lookup():
+    """
+    Test that habits get their reminders attached with a single query keyed by habit ID.
+    """
+    setup_environment()
+    add_habit("testuser", "With Reminder", "desc", "daily", Reminder(None, "07:15", "daily"))
+    add_habit("testuser", "Without Reminder", "desc", "weekly", None)
+    add_habit("testuser", "Weekly Reminder", "desc", "weekly", Reminder(None, "18:00", "weekly"))
+
+    # Count the reminder queries issued on the pooled connection that get_habits will use.
+    pool = get_connection_pool()
+    connection = pool.acquire()
+    statements = []
+    connection.set_trace_callback(statements.append)
+    pool.release(connection)
+    try:
+        habits = {habit.title: habit for habit in get_habits("testuser", None)}
+    finally:
+        connection.set_trace_callback(None)
+    assert len([sql for sql in statements if "FROM reminders" in sql]) == 1
+
+    reminder = habits["With Reminder"].reminder_time
+    assert (reminder.nextReminderTime, reminder.reminderFrequency) == ("07:15", "daily")
+    assert reminder.habit is habits["With Reminder"]
+    assert habits["Without Reminder"].reminder_time is None
+
+    reminders = get_reminders_for_habits(habit.habit_id for habit in habits.values())
+    assert set(reminders) == {habits["With Reminder"].habit_id, habits["Weekly Reminder"].habit_id}
+    assert Reminder.get_reminders_for_habit(habits["Weekly Reminder"].habit_id).nextReminderTime == "18:00"
+    assert Reminder.get_reminders_for_habit(habits["Without Reminder"].habit_id) is None
+
+    # Login hydration attaches reminders as well.
+    user = User("testuser", "testpass")
+    assert user.login()
+    assert user.get_habit_by_title("Weekly Reminder").reminder_time.reminderFrequency == "weekly"
+    teardown_test_environment()
+
+
+def test_benchmarks():
+    """
+    Test that the benchmark suite reports every hot path and flags regressions against a baseline.
+    """
+    assert parse_size("3x2x10") == (3, 2, 10)
+    try:
+        parse_size("3x2")
+        assert False, "An incomplete size was accepted"
+    except ValueError:
+        pass
+
+    report = run_benchmarks(["2x3x20"], iterations=3)
+    assert [result["benchmark"] for result in report["results"]] == ["login", "mark_complete", "get_streak", "longest_streak"]
+    for result in report["results"]:
+        assert result["ops_per_sec"] > 0 and result["p50_ms"] <= result["p99_ms"]
+    json.dumps(report)  # The report must be machine-readable.
+
+    # The suite works on its own databases, so the regular database is still in use afterwards.
+    assert User("bench0", "bench").login() is False
+
+    assert compare_to_baseline(report, report) == []
+    faster = json.loads(json.dumps(report))
+    faster["results"][0]["ops_per_sec"] = report["results"][0]["ops_per_sec"] * 10
+    regressions = compare_to_baseline(report, faster)
+    assert len(regressions) == 1 and regressions[0].startswith("login [2x3x20]")
+
+
+def test_query_instrumentation():
+    """
+    Test per-action query summaries and the slow-query log with query plans.
+    """
+    setup_environment()
+    add_habit("testuser", "Instrumented", "desc", "daily", None)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        slow_log = os.path.join(tmp_dir, "slow.log")
+        enable_query_instrumentation(slow_threshold_ms=0, slow_log_path=slow_log)
+        try:
+            with query_action("login"):
+                assert User("testuser", "testpass").login()
+            get_habits("testuser", None)
+            summaries = get_query_summaries()
+        finally:
+            disable_query_instrumentation()
+
+        # Statements are attributed to the named action, or to the function that opened the connection.
+        login = summaries["login"]
+        assert login["queries"] >= 2 and login["rows"] >= 1
+        assert any("FROM users" in sql for sql in login["statements"])
+        habits = summaries["get_habits"]
+        assert habits["connections"] == 1
+        assert habits["statements"]["SELECT id, title, description, periodicity, creation_date, streak_broken_date "
+                                    "FROM habits WHERE username=? ORDER BY id"]["rows"] == 1
+
+        # With a zero threshold every statement is slow; SELECTs are logged with their plan, never their parameters.
+        with open(slow_log) as log:
+            entries = [json.loads(line) for line in log]
+        assert len(entries) == sum(summary["queries"] for summary in summaries.values())
+        users_query = next(entry for entry in entries if "FROM users" in entry["sql"])
+        assert users_query["plan"] and "testpass" not in json.dumps(users_query)
+
+    assert get_query_summaries() == {}
+
+    # 'executemany' streams its parameters through instead of collecting them in a list first.
+    enable_query_instrumentation()
+    try:
+        with with_database_connection() as cursor:
+            with patch.object(cursor, '_cursor') as raw_cursor:
+                cursor.executemany("INSERT INTO streamed VALUES (?)", iter([("a",), ("b",)]))
+                streamed = raw_cursor.executemany.call_args[0][1]
+                assert not isinstance(streamed, list) and list(streamed) == [("a",), ("b",)]
+    finally:
+        disable_query_instrumentation()
+    teardown_test_environment()
+
+
+def test_streaming_export():
+    """
+    Test that habits and completions stream out as CSV (optionally gzipped) and JSONL.
+    """
+    setup_environment()
+    add_habit("testuser", "Export Me", "desc", "daily", Reminder(None, "08:00", "daily"))
+    habit_id = get_habits("testuser", None)[0].habit_id
+    mark_habits_complete_bulk([(habit_id, f"2024-01-0{day}") for day in range(1, 6)], points_per_completion=0)
+
+    # Rows are fetched in chunks, but every record comes out, in day order.
+    records = list(iter_records("completions", "testuser", chunk_size=2))
+    assert [record["completion_date"] for record in records] == [f"2024-01-0{day} 00:00:00" for day in range(1, 6)]
+    assert records[0]["username"] == "testuser" and records[0]["title"] == "Export Me"
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = os.path.join(tmp_dir, "completions.csv.gz")
+        assert export_records("completions", csv_path, username="testuser", chunk_size=2) == 5
+        with gzip.open(csv_path, "rt", newline="") as exported:
+            rows = list(csv.DictReader(exported))
+        assert len(rows) == 5 and rows[-1]["completion_date"] == "2024-01-05 00:00:00"
+
+        jsonl_path = os.path.join(tmp_dir, "reminders.jsonl")
+        assert export_records("reminders", jsonl_path, username="testuser") == 1
+        with open(jsonl_path) as exported:
+            reminder = json.loads(exported.readline())
+        assert reminder["title"] == "Export Me" and reminder["next_reminder_time"] == "08:00"
+
+        # An export with no records still has a CSV header.
+        empty_path = os.path.join(tmp_dir, "points.csv")
+        assert export_records("points", empty_path, username="testuser") == 0
+        with open(empty_path) as exported:
+            assert exported.read() == "username,delta,reason,created_at\n"
+
+    teardown_test_environment()
+
+
+def test_streaming_import():
+    """
+    Test the chunked importer: habit resolution, validation, deduplication and resuming from a checkpoint.
+    """
+    setup_environment()
+    add_habit("testuser", "Journal", "desc", "daily", None)
+    habit_id = get_habits("testuser", None)[0].habit_id
+    mark_habit_complete(habit_id, "2024-02-01")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "history.csv")
+        with open(path, "w") as history:
+            history.write("username,title,completion_date\n")
+            history.write("testuser,Journal,2024-02-01\n")           # Already recorded.
+            history.write("testuser,Journal,2024-02-02\n")
+            history.write("testuser,Journal,2024-02-02 21:30:00\n")  # Same day again.
+            history.write("testuser,Journal,2024-02-31\n")           # Invalid date.
+            history.write("testuser,Nonexistent,2024-02-03\n")
+            for day in range(3, 8):
+                history.write(f"testuser,Journal,2024-02-0{day}\n")
+
+        # The import fails after its first chunk; the chunk stays committed with its checkpoint.
+        def fail(stats):
+            raise RuntimeError("simulated crash")
+        try:
+            import_completions(path, chunk_size=3, progress=fail)
+            assert False, "The simulated failure did not happen"
+        except RuntimeError:
+            pass
+        with with_database_connection() as cursor:
+            cursor.execute("SELECT longest_streak FROM habits WHERE id = ?", (habit_id,))
+            assert cursor.fetchone()[0] == 2  # Committed together with the chunk's completions.
+
+        # Running it again resumes after the committed chunk.
+        stats = import_completions(path, chunk_size=3)
+        assert stats.read == 7
+        assert (stats.imported, stats.invalid, stats.unknown_habits, stats.duplicates) == (5, 1, 1, 0)
+        assert "2024-02-31" in stats.errors[0][1]
+
+        with with_database_connection() as cursor:
+            cursor.execute("SELECT COUNT(*), COUNT(DISTINCT completion_day) FROM completions WHERE habit_id = ?", (habit_id,))
+            assert cursor.fetchone() == (7, 7)
+            cursor.execute("SELECT longest_streak FROM habits WHERE id = ?", (habit_id,))
+            assert cursor.fetchone()[0] == 7
+
+        # Once finished, running the import again reads nothing, unless restarted (which only finds duplicates).
+        assert import_completions(path).read == 0
+        stats = import_completions(path, restart=True)
+        assert stats.imported == 0 and stats.duplicates == 8
+
+        # JSONL input can create the habits it names.
+        jsonl_path = os.path.join(tmp_dir, "history.jsonl")
+        with open(jsonl_path, "w") as history:
+            history.write(json.dumps({"username": "testuser", "title": "Stretch", "periodicity": "weekly",
+                                      "completion_date": "2024-03-04"}) + "\n")
+            history.write("not json\n")
+            history.write(json.dumps({"username": "testuser", "title": "Stretch", "completion_date": 20240305}) + "\n")
+        stats = import_completions(jsonl_path, create_missing=True)
+        assert (stats.imported, stats.created_habits, stats.invalid) == (1, 1, 2)
+        assert "must be strings" in stats.errors[1][1]
+        assert User("testuser", "testpass").get_habit_by_title("Stretch").periodicity == "weekly"
+
+        # A habit evicted from the day cache still sees the days pending in the current chunk.
+        add_habit("testuser", "Walk", "desc", "daily", None)
+        evict_path = os.path.join(tmp_dir, "evict.csv")
+        with open(evict_path, "w") as history:
+            history.write("username,title,completion_date\n")
+            history.write("testuser,Walk,2024-04-01\n")
+            history.write("testuser,Journal,2024-04-01\n")
+            history.write("testuser,Walk,2024-04-01\n")
+        with patch("data_import.DAY_CACHE_SIZE", 1):
+            stats = import_completions(evict_path)
+        assert (stats.imported, stats.duplicates) == (2, 1)
+
+        with with_database_connection() as cursor:
+            cursor.execute("DELETE FROM import_checkpoints WHERE source IN (?, ?, ?)",
+                           (os.path.abspath(path), os.path.abspath(jsonl_path), os.path.abspath(evict_path)))
+    teardown_test_environment()
+
+
+def test_completion_rollups():
+    """
+    Test that the completion rollups follow inserts and deletes, match a rebuild, and answer the analytics queries.
+    """
+    setup_environment()
+    add_habit("testuser", "Read", "desc", "daily", None)
+    add_habit("testuser", "Clean", "desc", "weekly", None)
+    habits = {habit.title: habit for habit in get_habits("testuser", None)}
+    read_id, clean_id = habits["Read"].habit_id, habits["Clean"].habit_id
+    for day in ("2024-01-01", "2024-01-02", "2024-01-03", "2024-01-10", "2024-02-05"):
+        mark_habit_complete(read_id, day)
+    mark_habit_complete(clean_id, "2024-01-06")
+
+    def rollup(habit_id, grain):
+        with with_database_connection() as cursor:
+            cursor.execute("SELECT period, completions FROM completion_rollups WHERE habit_id = ? AND grain = ? ORDER BY period",
+                           (habit_id, grain))
+            return cursor.fetchall()
+
+    week = (date(2024, 1, 1).toordinal() - 1) // 7
+    assert rollup(read_id, "weekly") == [(week, 3), (week + 1, 1), (week + 5, 1)]
+    assert rollup(read_id, "monthly") == [(2024 * 12, 4), (2024 * 12 + 1, 1)]
+    assert len(rollup(read_id, "daily")) == 5
+
+    # Deleting a completion, and inserting one without a day, keep the counts current.
+    with with_database_connection() as cursor:
+        cursor.execute("DELETE FROM completions WHERE habit_id = ? AND completion_day = ?",
+                       (read_id, date(2024, 2, 5).toordinal()))
+        cursor.execute("INSERT INTO completions (habit_id, completion_date) VALUES (?, '2024-01-04 08:00:00')", (read_id,))
+    assert rollup(read_id, "monthly") == [(2024 * 12, 5)]
+    assert rollup(read_id, "weekly") == [(week, 4), (week + 1, 1)]
+
+    # A bulk rebuild produces the same counts as the triggers.
+    incremental = rollup(read_id, "daily") + rollup(read_id, "weekly") + rollup(clean_id, "weekly")
+    with with_database_connection() as cursor:
+        rebuild_rollups(cursor, [read_id, clean_id])
+    assert rollup(read_id, "daily") + rollup(read_id, "weekly") + rollup(clean_id, "weekly") == incremental
+
+    # Completion rates over a window count each period with a completion once.
+    rates = completion_rates([(read_id, "daily"), (clean_id, "weekly")], days=14, today=date(2024, 1, 14))
+    assert rates[read_id] == 5 / 14
+    assert rates[clean_id] == 1 / 2
+    assert best_week([read_id, clean_id]) == (date(2024, 1, 1), 5)
+    assert completion_trend([read_id], "monthly", 3, today=date(2024, 2, 20)) == \
+        [(date(2023, 12, 1), 0), (date(2024, 1, 1), 5), (date(2024, 2, 1), 0)]
+
+    analytics = Analytics(list(habits.values()))
+    assert analytics.getBestWeek() == (date(2024, 1, 1), 5)
+    assert set(analytics.getCompletionRates()) == {"Read", "Clean"}
+    assert len(analytics.getTrend("weekly", 8)) == 8
+    teardown_test_environment()
+
+
+def test_completion_calendars():
+    """
+    Test the bitmap calendars: streaks, gaps and rates match the completions, and stored years are rebuilt after changes.
+    """
+    setup_environment()
+    add_habit("testuser", "Read", "desc", "daily", None)
+    add_habit("testuser", "Clean", "desc", "weekly", None)
+    habits = {habit.title: habit for habit in get_habits("testuser", None)}
+    read, clean = habits["Read"], habits["Clean"]
+    days = ["2023-12-31", "2024-01-01", "2024-01-02", "2024-01-03", "2024-01-04", "2024-01-05", "2024-01-08", "2024-01-09"]
+    for day in days:
+        mark_habit_complete(read.habit_id, day)
+    for day in ("2024-01-02", "2024-01-09", "2024-01-24"):
+        mark_habit_complete(clean.habit_id, day)
+
+    calendar = read.getCalendar(2023, 2024)
+    assert [str(day) for day in calendar.days()] == days
+    assert calendar.count() == 8 and calendar.count(date(2024, 1, 1), date(2024, 1, 31)) == 7
+    assert calendar.longest_streak() == read.getLongestStreak() == 6
+    assert calendar.current_streak(date(2024, 1, 10)) == 2
+    assert calendar.current_streak(date(2024, 1, 12)) == 0
+    assert calendar.longest_gap() == 2
+    assert calendar.completion_rate(10, today=date(2024, 1, 10)) == 0.7
+
+    heatmap = calendar.heatmap(date(2024, 1, 10), weeks=5).split("\n")
+    assert heatmap[0] == "    Dec"
+    assert heatmap[1] == "Mon ···■■"
+    assert heatmap[3] == "Wed ···■·"
+    assert heatmap[4] == "    ···■"  # Thursday 2024-01-11 is still to come.
+    assert heatmap[7] == "    ··■·"
+
+    weekly = clean.getCalendar()
+    assert (weekly.first_year, weekly.longest_streak(), weekly.longest_gap()) == (2024, 2, 1)
+    assert weekly.current_streak(date(2024, 1, 30)) == 1
+    assert weekly.completion_rate(28, today=date(2024, 1, 28)) == 0.75
+
+    # Each year is stored as one BLOB; a new completion drops that year's BLOB so it is rebuilt.
+    def stored_years(habit_id):
+        with with_database_connection() as cursor:
+            cursor.execute("SELECT year, LENGTH(days) FROM completion_calendars WHERE habit_id = ? ORDER BY year",
+                           (habit_id,))
+            return cursor.fetchall()
+
+    assert stored_years(read.habit_id) == [(2023, 46), (2024, 46)]
+    mark_habit_complete(read.habit_id, "2024-01-06")
+    assert stored_years(read.habit_id) == [(2023, 46)]
+    assert read.getCalendar(2023, 2024).longest_streak() == 7
+    assert len(load_calendars([(read.habit_id, "daily"), (clean.habit_id, "weekly")], 2022, 2024)) == 2
+
+    # Viewing a calendar does not need the write lock: while another connection writes,
+    # missing years are still built, just not stored.
+    mark_habit_complete(read.habit_id, "2024-01-07")
+    configure_connection_pool(busy_timeout=100)
+    blocker = sqlite3.connect(get_connection_pool().database)
+    try:
+        blocker.execute("BEGIN IMMEDIATE")
+        assert read.getCalendar(2023, 2024).longest_streak() == 10
+        blocker.rollback()
+    finally:
+        blocker.close()
+        configure_connection_pool()
+    assert stored_years(read.habit_id) == [(2022, 46), (2023, 46)]
+
+    delete_habit("testuser", "Read")
+    assert stored_years(read.habit_id) == []
+    teardown_test_environment()
+
+
+def test_streak_sweeper():
+    """
+    Test the nightly sweep: broken streaks are found in one query, penalized once per day, and re-checked before updating.
+    """
+    setup_environment()
+    for title, periodicity in (("Run", "daily"), ("Read", "daily"), ("Clean", "weekly"), ("Budget", "monthly"),
+                               ("Stretch", "daily")):
+        add_habit("testuser", title, "desc", periodicity, None)
+    ids = {habit.title: habit.habit_id for habit in get_habits("testuser", None)}
+    mark_habit_complete(ids["Run"], "2024-03-17")      # Broken: nothing yesterday or today.
+    mark_habit_complete(ids["Read"], "2024-03-19")     # Still alive.
+    mark_habit_complete(ids["Clean"], "2024-02-28")    # Broken: no completion last week.
+    mark_habit_complete(ids["Stretch"], "2024-03-01")  # Broken, but already marked broken today.
+
+    def points():
+        points_ledger.flush()
+        with with_database_connection() as cursor:
+            cursor.execute("SELECT points FROM users WHERE username = 'testuser'")
+            return cursor.fetchone()[0]
+
+    with with_database_connection() as cursor:
+        cursor.execute("UPDATE habits SET streak_broken_date = '2024-03-20 00:01:00.000000' WHERE id = ?", (ids["Stretch"],))
+    start_points = points()
+
+    now = datetime(2024, 3, 20, 0, 5)
+    assert find_broken_streaks(now.date(), "testuser") == sorted([ids["Run"], ids["Clean"]])
+    assert sweep_broken_streaks(now, chunk_size=1, username="testuser") == 2
+    assert points() == start_points - 20
+    with with_database_connection() as cursor:
+        cursor.execute("SELECT id, current_streak, date(streak_broken_date) FROM habits WHERE id IN (?, ?)",
+                       (ids["Run"], ids["Clean"]))
+        assert {row[1:] for row in cursor.fetchall()} == {(0, "2024-03-20")}
+        cursor.execute("SELECT COUNT(*) FROM points_ledger WHERE username = 'testuser' AND reason = 'streak broken' "
+                       "AND created_at = '2024-03-20 00:05:00'")
+        assert cursor.fetchone()[0] == 2
+
+    # A second sweep on the same day changes nothing, and the UPDATE re-checks habits that were found earlier.
+    assert sweep_broken_streaks(now, username="testuser") == 0
+    with patch("streak_sweeper.find_broken_streaks", return_value=[ids["Read"], ids["Run"]]):
+        assert sweep_broken_streaks(now, username="testuser") == 0
+    assert points() == start_points - 20
+
+    # A login holding a copy of the habit from before the sweep does not deduct the penalty again.
+    stale_run = next(habit for habit in get_habits("testuser", None) if habit.title == "Run")
+    assert sweep_broken_streaks(username="testuser") >= 1
+    swept_points = points()
+    stale_run.streak_broken_date = None
+    stale_run.breakStreak()
+    assert points() == swept_points
+
+    # Nor does one whose copy predates a completion that keeps the streak alive.
+    add_habit("testuser", "Walk", "desc", "daily", None)
+    walk = next(habit for habit in get_habits("testuser", None) if habit.title == "Walk")
+    mark_habit_complete(walk.habit_id, "2024-01-01")
+    assert len(walk.completion_days) == 1
+    mark_habit_complete(walk.habit_id, datetime.now().date())
+    assert walk.breakStreak() is False
+    assert points() == swept_points
+    teardown_test_environment()
+
+
 # This function serves as the entry point for running a set of test cases.
 # It sets up the test environment, runs each test function, and then tears down the environment.
 def test_functions():
     setup_environment()  # Set up the test environment
-    for func in [test_cli_login_success, test_cli_login_fail, test_cli_register_success, test_cli_register_fail, test_add_and_get_habits, test_mark_habit_complete, test_points_award, test_analytics, test_habit_streaks, test_create_and_delete_habit]:
-        func()  # Run each individual test function
+    for func in [test_cli_login_success, test_cli_login_fail, test_cli_register_success, test_cli_register_fail, test_add_and_get_habits, test_mark_habit_complete, test_points_award, test_analytics, test_habit_streaks, test_create_and_delete_habit, test_connection_pool_reuses_connections, test_schema_migrations, test_storage_settings, test_mark_habits_complete_bulk, test_login_hydrates_habits, test_sql_streaks, test_streak_counters, test_vectorized_analytics, test_summarize_streaks, test_canonical_completion_migration, test_habit_lazy_completion_history, test_habit_repository, test_points_ledger, test_async_habit_service, test_http_server, test_session_manager, test_reminder_scheduler, test_batched_reminder_lookup, test_benchmarks, test_query_instrumentation, test_streaming_export, test_streaming_import, test_completion_rollups, test_completion_calendars, test_streak_sweeper]:
+        try:
+            func()  # Run each individual test function
+        except pytest.skip.Exception as skipped:
+            print(f"{func.__name__} skipped: {skipped.msg}")  # Report skips instead of counting them as passes
+            continue
         print(f"{func.__name__} passed!")  # Print a success message for the completed test
     teardown_test_environment()  # Tear down the test environment
   
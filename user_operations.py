@@ -27,4 +27,12 @@ def verify_user(username, password):
     with with_database_connection() as cursor:
         # Check if a record with the given username and password exists in the 'users' table.
         cursor.execute("SELECT * FROM users WHERE username=? AND password=?", (username, password))
-        return cursor.fetchone() is not None
\ No newline at end of file
+        return cursor.fetchone() is not None
+
+
+# This function loads a user's row in a single query when their credentials match.
+# It returns a (user_id, username, points) tuple, or None if the credentials are wrong.
+def load_user(username, password):
+    with with_database_connection() as cursor:
+        cursor.execute("SELECT id, username, points FROM users WHERE username=? AND password=?", (username, password))
+        return cursor.fetchone()
@@ -0,0 +1,250 @@
+from array import array
+from datetime import date
+from database_operations import with_database_connection
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; the default Analytics methods work without it.
+    np = None
+
+# Vectorized analytics backend.
+#
+# Completions are loaded as one concatenated int32 array of day ordinals (as returned
+# by date.toordinal()), sorted by habit and day, with an offsets array marking where
+# each habit's slice starts. Every metric is then computed for all habits at once
+# with NumPy operations instead of Python loops over Habit objects and date lists.
+
+PERIODICITY_CODES = {"daily": 0, "weekly": 1, "monthly": 2}
+
+# Offset between date ordinals and NumPy's datetime64 day numbers (1970-01-01 is day 0).
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# Rows fetched from SQLite per round trip while loading.
+FETCH_SIZE = 10000
+
+_LOAD_SQL = """SELECT h.id, h.periodicity, c.completion_day
+               FROM habits h LEFT JOIN completions c ON c.habit_id = h.id
+               WHERE {where}
+               ORDER BY h.id, c.completion_day"""
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("The vectorized analytics backend requires NumPy (pip install numpy).")
+
+
+# The 'CompletionArrays' class holds every completion of a set of habits in flat arrays.
+class CompletionArrays:
+    def __init__(self, habit_ids, periodicities, offsets, days):
+        """
+        Parameters:
+        - habit_ids (ndarray): Habit IDs, one per habit.
+        - periodicities (ndarray): Periodicity code per habit (see PERIODICITY_CODES, -1 if unknown).
+        - offsets (ndarray): Start of each habit's slice in 'days'; has one extra trailing entry.
+        - days (ndarray): int32 day ordinals, sorted and de-duplicated within each habit.
+        """
+        self.habit_ids = habit_ids
+        self.periodicities = periodicities
+        self.offsets = offsets
+        self.days = days
+
+    def __len__(self):
+        return len(self.habit_ids)
+
+    def habit_index(self):
+        # Index of the owning habit for every element of 'days'.
+        return np.repeat(np.arange(len(self.habit_ids)), np.diff(self.offsets))
+
+    def completion_days(self, habit_id):
+        # The day ordinals of one habit.
+        position = int(np.searchsorted(self.habit_ids, habit_id))
+        if position >= len(self.habit_ids) or self.habit_ids[position] != habit_id:
+            raise KeyError(habit_id)
+        return self.days[self.offsets[position]:self.offsets[position + 1]]
+
+
+def load_completion_arrays(username=None, habit_ids=None):
+    """
+    Load completions into flat arrays, for one user, a list of habits, or every habit.
+
+    Returns:
+    - CompletionArrays: The loaded completions.
+    """
+    _require_numpy()
+    if habit_ids is not None:
+        habit_ids = list(habit_ids)
+        where, params = f"h.id IN ({', '.join('?' * len(habit_ids))})", habit_ids
+        if not habit_ids:
+            where, params = "0 = 1", ()
+    elif username is not None:
+        where, params = "h.username = ?", (username,)
+    else:
+        where, params = "1 = 1", ()
+
+    ids, codes, counts = array("q"), array("b"), array("q")
+    days = array("i")
+    with with_database_connection() as cursor:
+        cursor.execute(_LOAD_SQL.format(where=where), params)
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            for habit_id, periodicity, day in rows:
+                if not ids or ids[-1] != habit_id:
+                    ids.append(habit_id)
+                    codes.append(PERIODICITY_CODES.get(periodicity, -1))
+                    counts.append(0)
+                # Skip habits without completions (NULL day) and repeated days.
+                if day is not None and (counts[-1] == 0 or days[-1] != day):
+                    days.append(day)
+                    counts[-1] += 1
+
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(np.frombuffer(counts, dtype=np.int64), out=offsets[1:])
+    return CompletionArrays(np.frombuffer(ids, dtype=np.int64).copy(),
+                            np.frombuffer(codes, dtype=np.int8).copy(),
+                            offsets,
+                            np.frombuffer(days, dtype=np.int32).copy())
+
+
+def _period_indexes(days, codes):
+    # Map day ordinals to period indexes, matching 'streaks.period_index'.
+    days = days.astype(np.int64)
+    weeks = (days - 1) // 7
+    months = (days - _EPOCH_ORDINAL).astype("datetime64[D]").astype("datetime64[M]").astype(np.int64) + 1970 * 12
+    return np.select([codes == 0, codes == 1, codes == 2], [days, weeks, months], default=-1)
+
+
+def _group_edges(owners):
+    # Positions of the first and last element of each run of equal owners (owners are sorted).
+    boundaries = np.flatnonzero(owners[1:] != owners[:-1])
+    firsts = np.concatenate(([0], boundaries + 1))
+    lasts = np.concatenate((boundaries, [len(owners) - 1]))
+    return firsts, lasts
+
+
+def _current_periods(codes, today):
+    # The period index of 'today' for each periodicity code; unknown periodicities (-1) map to -1.
+    ordinal = today.toordinal()
+    by_code = np.array([ordinal, (ordinal - 1) // 7, today.year * 12 + today.month - 1, -1], dtype=np.int64)
+    return by_code[codes]
+
+
+# The 'VectorizedAnalytics' class computes analytics for every habit in a 'CompletionArrays' at once.
+class VectorizedAnalytics:
+    def __init__(self, arrays):
+        _require_numpy()
+        self.arrays = arrays
+
+    @classmethod
+    def for_user(cls, username):
+        return cls(load_completion_arrays(username=username))
+
+    @classmethod
+    def for_habits(cls, habit_ids):
+        return cls(load_completion_arrays(habit_ids=habit_ids))
+
+    @classmethod
+    def for_everyone(cls):
+        return cls(load_completion_arrays())
+
+    def _periods(self):
+        # Distinct completed periods per habit: (owner habit index, period index), sorted.
+        arrays = self.arrays
+        owners = arrays.habit_index()
+        periods = _period_indexes(arrays.days, arrays.periodicities[owners])
+        keep = periods >= 0
+        owners, periods = owners[keep], periods[keep]
+        # Days are sorted within a habit, so periods are too; drop repeats of the same period.
+        distinct = np.ones(len(periods), dtype=bool)
+        distinct[1:] = (periods[1:] != periods[:-1]) | (owners[1:] != owners[:-1])
+        return owners[distinct], periods[distinct]
+
+    def streaks(self, today=None):
+        """
+        Compute streaks for every habit.
+
+        Returns:
+        - dict: Arrays aligned with 'arrays.habit_ids': 'current', 'latest_run', 'longest' and 'last_period'
+          ('last_period' is -1 for habits without completions).
+        """
+        today = today or date.today()
+        count = len(self.arrays)
+        owners, periods = self._periods()
+
+        latest_run = np.zeros(count, dtype=np.int64)
+        longest = np.zeros(count, dtype=np.int64)
+        last_period = np.full(count, -1, dtype=np.int64)
+        if len(periods):
+            # A new run starts at each habit boundary and after every gap.
+            starts = np.ones(len(periods), dtype=bool)
+            starts[1:] = (periods[1:] != periods[:-1] + 1) | (owners[1:] != owners[:-1])
+            run_ids = np.cumsum(starts) - 1
+            run_lengths = np.bincount(run_ids)
+            run_owners = owners[starts]
+
+            np.maximum.at(longest, run_owners, run_lengths)
+            _, last_runs = _group_edges(run_owners)
+            latest_run[run_owners[last_runs]] = run_lengths[last_runs]
+            _, last_elements = _group_edges(owners)
+            last_period[owners[last_elements]] = periods[last_elements]
+
+        alive = last_period >= _current_periods(self.arrays.periodicities, today) - 1
+        current = np.where(alive & (last_period >= 0), latest_run, 0)
+        return {"current": current, "latest_run": latest_run, "longest": longest, "last_period": last_period}
+
+    def completion_rates(self, today=None):
+        """
+        Fraction of periods completed per habit, from its first completed period up to today.
+
+        Returns:
+        - ndarray: One float per habit (0.0 for habits without completions).
+        """
+        today = today or date.today()
+        count = len(self.arrays)
+        owners, periods = self._periods()
+        completed = np.bincount(owners, minlength=count)
+
+        first_period = np.zeros(count, dtype=np.int64)
+        has_any = completed > 0
+        if len(periods):
+            first_elements, _ = _group_edges(owners)
+            first_period[owners[first_elements]] = periods[first_elements]
+        elapsed = _current_periods(self.arrays.periodicities, today) - first_period + 1
+        rates = np.zeros(count, dtype=np.float64)
+        np.divide(completed, elapsed, out=rates, where=has_any & (elapsed > 0))
+        return np.minimum(rates, 1.0)
+
+    def periodicity_counts(self):
+        # Number of habits per periodicity.
+        codes = self.arrays.periodicities
+        return {name: int(np.count_nonzero(codes == code)) for name, code in PERIODICITY_CODES.items()}
+
+    def weekday_histograms(self):
+        """
+        Completions per weekday for every habit.
+
+        Returns:
+        - ndarray: Shape (habits, 7); column 0 is Monday.
+        """
+        count = len(self.arrays)
+        weekdays = (self.arrays.days.astype(np.int64) - 1) % 7
+        flat = np.bincount(self.arrays.habit_index() * 7 + weekdays, minlength=count * 7)
+        return flat.reshape(count, 7)
+
+    def report(self, today=None):
+        """
+        Build a per-habit report with every metric, keyed by habit ID.
+        """
+        streaks = self.streaks(today)
+        rates = self.completion_rates(today)
+        histograms = self.weekday_histograms()
+        report = {}
+        for position, habit_id in enumerate(self.arrays.habit_ids.tolist()):
+            report[habit_id] = {
+                "current_streak": int(streaks["current"][position]),
+                "longest_streak": int(streaks["longest"][position]),
+                "completion_rate": float(rates[position]),
+                "weekday_histogram": histograms[position].tolist(),
+            }
+        return report